@@ -50,6 +50,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.admission.AdmissionControlMiddleware',
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,7 +86,8 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        # PostgreSQL with per-process connection pooling, see core.db.pool
+        "ENGINE": "core.db",
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
@@ -91,6 +95,30 @@ DATABASES = {
     }
 }
 
+# Connection pool of each database, per worker process, see core.db.pool.
+# DB_POOL_MIN_SIZE connections are opened at boot and at most
+# DB_POOL_MAX_SIZE, which should cover the worker's threads, are kept.
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', 30))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 600))
+
+# Read replicas, see core.routers. Each host in the comma separated
+# DB_REPLICA_HOSTS gets a `replica<n>` alias with the primary's credentials.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Seconds a user reads from the primary after a write, to cover the lag
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -130,6 +158,10 @@ MEDIA_URL = '/static/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
+
+# Threads per worker process resizing uploaded movie images
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANTS_ASYNC = True
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -139,13 +171,108 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = { #Telling the rest framework generate the schema
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema'
+    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Keyset pagination: constant cost per page, no OFFSET and no COUNT(*)
+    'DEFAULT_PAGINATION_CLASS': 'movie.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.OrjsonRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.OrjsonParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Cache shared by the workers, holding the token cache invalidations of
+# user.authentication and the replica pins of core.routers. Without
+# REDIS_URL every process gets its own local memory cache, which only suits
+# a single process and can't be used with DB_REPLICA_HOSTS.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+# In-process token -> user cache used by user.authentication
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+# Seconds a cached token is used before its shared version is read again,
+# how long other workers may still accept a token after it's revoked
+TOKEN_CACHE_CHECK_SECONDS = float(
+    os.environ.get('TOKEN_CACHE_CHECK_SECONDS', 2)
+)
+
+# Lifetimes of the signed access and refresh tokens, see user.tokens
+SIGNED_TOKEN_ACCESS_TTL = int(os.environ.get('SIGNED_TOKEN_ACCESS_TTL', 300))
+SIGNED_TOKEN_REFRESH_TTL = int(
+    os.environ.get('SIGNED_TOKEN_REFRESH_TTL', 7 * 24 * 3600)
+)
+
+# Per-process admission control, see core.admission. The concurrency
+# should match the worker's threads; queue limits are the queue length at
+# which each request class starts being shed.
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 8))
+# Requests an ASGI process serves at once on its event loop
+ADMISSION_ASYNC_MAX_CONCURRENCY = int(
+    os.environ.get('ADMISSION_ASYNC_MAX_CONCURRENCY', 256)
+)
+ADMISSION_QUEUE_LIMITS = {
+    'cheap': int(os.environ.get('ADMISSION_QUEUE_CHEAP', 32)),
+    'normal': int(os.environ.get('ADMISSION_QUEUE_NORMAL', 16)),
+    'expensive': int(os.environ.get('ADMISSION_QUEUE_EXPENSIVE', 4)),
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+
+# Metrics, see core.metrics. /metrics needs a staff user or this bearer
+# token. With METRICS_DIR the workers of a server share their metrics
+# there, every METRICS_EXPORT_SECONDS, and any of them serves them all.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_EXPORT_SECONDS = float(os.environ.get('METRICS_EXPORT_SECONDS', 5))
+
+# Slow query log, see core.instrumentation. Queries at least this slow
+# are logged to `core.slow_queries`, this fraction of them.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.1))
+
+# Movie leaderboards, see core.models.bayesian_score and trending_points
+LEADERBOARD_PRIOR_MEAN = float(os.environ.get('LEADERBOARD_PRIOR_MEAN', 2.5))
+LEADERBOARD_PRIOR_WEIGHT = float(os.environ.get('LEADERBOARD_PRIOR_WEIGHT', 10))
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+TRENDING_WINDOW_HOURS = float(os.environ.get('TRENDING_WINDOW_HOURS', 72))
+
+# Similar movies, see core.similarity. Neighbours kept per movie, and the
+# number of common raters at which a similarity keeps half its value.
+SIMILAR_MOVIES_TOP_K = int(os.environ.get('SIMILAR_MOVIES_TOP_K', 20))
+SIMILAR_MOVIES_SHRINKAGE = float(os.environ.get('SIMILAR_MOVIES_SHRINKAGE', 10))
+
+# In-memory title autocomplete, see movie.autocomplete. Seconds between
+# incremental refreshes, and between full reloads dropping deleted movies.
+AUTOCOMPLETE_REFRESH_SECONDS = float(
+    os.environ.get('AUTOCOMPLETE_REFRESH_SECONDS', 30)
+)
+AUTOCOMPLETE_RELOAD_SECONDS = float(
+    os.environ.get('AUTOCOMPLETE_RELOAD_SECONDS', 3600)
+)
+AUTOCOMPLETE_ASYNC = True
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'IMDB Clone API',
     'DESCRIPTION': 'A simple API for IMDB clone',
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
     'COMPONENT_SPLIT_REQUEST': False
-}
\ No newline at end of file
+}
+# Pregenerated OpenAPI document served at /api/schema/, see core.schema.
+# Regenerate with `manage.py build_schema` after changing the API.
+OPENAPI_SCHEMA_PATH = os.environ.get('OPENAPI_SCHEMA_PATH',
+                                     BASE_DIR / 'schema.yml')
+# Results `manage.py benchmark_api` compares against, see core.benchmark
+BENCHMARK_BASELINE_PATH = os.environ.get('BENCHMARK_BASELINE_PATH',
+                                         BASE_DIR / 'benchmark_baseline.json')
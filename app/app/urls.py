@@ -16,15 +16,19 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (SpectacularAPIView,
-                                   SpectacularRedocView,
+from drf_spectacular.views import (SpectacularRedocView,
                                    SpectacularSwaggerView)
 
+from core.schema import CachedSchemaView
+from core.views import metrics_view, ready_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/movie/', include('movie.urls')),
     path('api/user/', include('user.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),# Generates the yaml file for the API schema
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', ready_view, name='ready'),
+    path('api/schema/', CachedSchemaView.as_view(), name='api-schema'),# Serves the pregenerated API schema
     path('api/docs/',
          SpectacularSwaggerView.as_view(url_name='api-schema'),
          name='api-docs'),
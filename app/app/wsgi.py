@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# Open the worker's pooled DB connections before it takes traffic
+from core.db.pool import warm_pools  # noqa: E402
+
+warm_pools()
+
+# Share this worker's metrics with the others of the server
+from core.metrics import start_exporter  # noqa: E402
+
+start_exporter()
+
+# Start loading the title autocomplete index in the background
+from movie.autocomplete import index  # noqa: E402
+
+index.schedule_refresh()
@@ -0,0 +1,288 @@
+"""
+Admission control and load shedding.
+
+Each worker process admits at most ADMISSION_MAX_CONCURRENCY requests at
+a time. Requests beyond that wait in a small in-process queue, cheapest
+class first, and are shed with a 503 as soon as the queue for their class
+is full or they have waited ADMISSION_QUEUE_TIMEOUT seconds. Shedding
+early keeps latency bounded for the requests that are admitted, instead
+of every request queueing behind the workers until the proxy times out.
+
+Under ASGI the middleware runs on the event loop, where a request waiting
+on the database doesn't hold a thread, and admits up to
+ADMISSION_ASYNC_MAX_CONCURRENCY requests per process instead.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from core import metrics
+
+# Request classes, in the order they are admitted from the queue
+CHEAP = 'cheap'
+NORMAL = 'normal'
+EXPENSIVE = 'expensive'
+PRIORITIES = {CHEAP: 0, NORMAL: 1, EXPENSIVE: 2}
+
+# (method, URL name) -> request class, anything else is NORMAL
+REQUEST_CLASSES = {
+    ('GET', 'movie:movie-detail'): CHEAP,
+    ('HEAD', 'movie:movie-detail'): CHEAP,
+    ('GET', 'movie:async-movie-detail'): CHEAP,
+    ('GET', 'movie:movie-autocomplete'): CHEAP,
+    ('GET', 'movie:movie-list'): EXPENSIVE,
+    ('GET', 'movie:async-movie-list'): EXPENSIVE,
+    ('GET', 'movie:movie-export'): EXPENSIVE,
+    # Password hashing
+    ('POST', 'user:token'): EXPENSIVE,
+    ('POST', 'user:create'): EXPENSIVE,
+    ('POST', 'user:signed-token'): EXPENSIVE,
+}
+# URL names that are never queued or shed
+EXEMPT_URL_NAMES = {'metrics', 'ready'}
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded priority queue for one process"""
+
+    def __init__(self, max_concurrency, queue_limits, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = queue_limits
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.counters = {
+            (outcome, request_class): 0
+            for outcome in ('admitted', 'queued', 'shed')
+            for request_class in PRIORITIES
+        }
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+            queue_limits=settings.ADMISSION_QUEUE_LIMITS,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+
+    def acquire(self, request_class):
+        """Wait for a slot, returning False if the request is shed"""
+        priority = PRIORITIES[request_class]
+        with self._condition:
+            if self.active < self.max_concurrency and (
+                    not self._waiting or priority < self._waiting[0][0]):
+                return self._admit(request_class)
+
+            if len(self._waiting) >= self.queue_limits[request_class]:
+                self.counters['shed', request_class] += 1
+                return False
+
+            self.counters['queued', request_class] += 1
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.queue_timeout
+            while not (self._waiting[0] == entry and
+                       self.active < self.max_concurrency):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self.counters['shed', request_class] += 1
+                    self._condition.notify_all()
+                    return False
+                self._condition.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._condition.notify_all()
+            return self._admit(request_class)
+
+    def release(self):
+        """Free a slot and wake the queue"""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """Return the counters and the current number of active/waiting"""
+        with self._condition:
+            return {
+                'counters': dict(self.counters),
+                'active': self.active,
+                'waiting': len(self._waiting),
+            }
+
+    def _admit(self, request_class):
+        self.active += 1
+        self.counters['admitted', request_class] += 1
+        return True
+
+
+class AsyncAdmissionController(AdmissionController):
+    """The same policy for the requests of one event loop.
+
+    Only the loop changes the queue, the lock keeps `stats` consistent
+    for the threads serving /metrics.
+    """
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_concurrency=settings.ADMISSION_ASYNC_MAX_CONCURRENCY,
+            queue_limits=settings.ADMISSION_QUEUE_LIMITS,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+
+    async def acquire(self, request_class):
+        """Wait for a slot, returning False if the request is shed"""
+        priority = PRIORITIES[request_class]
+        with self._condition:
+            if self.active < self.max_concurrency and (
+                    not self._waiting or priority < self._waiting[0][0]):
+                return self._admit(request_class)
+
+            if len(self._waiting) >= self.queue_limits[request_class]:
+                self.counters['shed', request_class] += 1
+                return False
+
+            self.counters['queued', request_class] += 1
+            admitted = asyncio.get_running_loop().create_future()
+            entry = (priority, next(self._sequence), request_class, admitted)
+            heapq.heappush(self._waiting, entry)
+
+        try:
+            await asyncio.wait([admitted], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        if admitted.done():
+            return True
+        self._abandon(entry)
+        with self._condition:
+            self.counters['shed', request_class] += 1
+        return False
+
+    def release(self):
+        """Free a slot and admit the head of the queue"""
+        with self._condition:
+            self.active -= 1
+            self._admit_waiting()
+
+    def _abandon(self, entry):
+        # The request stopped waiting, give its slot back if it got one
+        with self._condition:
+            if entry[3].done():
+                self.active -= 1
+                self._admit_waiting()
+            else:
+                entry[3].cancel()
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+
+    def _admit_waiting(self):
+        while self._waiting and self.active < self.max_concurrency:
+            _, _, request_class, admitted = heapq.heappop(self._waiting)
+            self._admit(request_class)
+            admitted.set_result(True)
+
+
+controller = AdmissionController.from_settings()
+async_controller = AsyncAdmissionController.from_settings()
+
+
+def classify(request):
+    """Return the request class of a request, or None if it's exempt"""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return NORMAL
+    if match.url_name in EXEMPT_URL_NAMES:
+        return None
+    return REQUEST_CLASSES.get((request.method, match.view_name), NORMAL)
+
+
+def busy_response():
+    response = JsonResponse(
+        {'detail': 'Server is busy, please retry later.'}, status=503
+    )
+    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+    return response
+
+
+class AdmissionControlMiddleware:
+    """Admit, queue or shed each request before any other work is done"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_class = classify(request)
+        if request_class is None:
+            return self.get_response(request)
+
+        admission = controller
+        if not admission.acquire(request_class):
+            return busy_response()
+        try:
+            return self.get_response(request)
+        finally:
+            admission.release()
+
+    async def __acall__(self, request):
+        request_class = classify(request)
+        if request_class is None:
+            return await self.get_response(request)
+
+        admission = async_controller
+        if not await admission.acquire(request_class):
+            return busy_response()
+        try:
+            return await self.get_response(request)
+        finally:
+            admission.release()
+
+
+def collect_admission_metrics():
+    """Metrics collector for the admission controllers, the async one only
+    once the process has served async requests"""
+    stats = {'sync': controller.stats()}
+    async_stats = async_controller.stats()
+    if any(async_stats['counters'].values()):
+        stats['async'] = async_stats
+    yield metrics.counter(
+        'admission_requests_total',
+        'Requests by admission outcome and request class',
+        [(dict({'outcome': outcome, 'class': request_class},
+               **mode_label(mode)), value)
+         for mode, mode_stats in stats.items()
+         for (outcome, request_class), value
+         in mode_stats['counters'].items()]
+    )
+    yield metrics.gauge('admission_active_requests',
+                        'Requests currently being served',
+                        [(mode_label(mode), mode_stats['active'])
+                         for mode, mode_stats in stats.items()])
+    yield metrics.gauge('admission_waiting_requests',
+                        'Requests currently queued',
+                        [(mode_label(mode), mode_stats['waiting'])
+                         for mode, mode_stats in stats.items()])
+
+
+def mode_label(mode):
+    # The sync series keep the labels they had before async admission
+    return {'mode': mode} if mode == 'async' else {}
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import metrics
+        from core.admission import collect_admission_metrics
+        from core.db.pool import collect_pool_metrics
+        from core.instrumentation import (collect_instrumentation_metrics,
+                                          install_query_recorder)
+        from core.routers import check_pin_cache
+
+        check_pin_cache()
+        connection_created.connect(install_query_recorder)
+        metrics.register(collect_admission_metrics)
+        metrics.register(collect_instrumentation_metrics)
+        metrics.register(collect_pool_metrics)
@@ -0,0 +1,296 @@
+"""
+API load benchmark.
+
+A deterministic synthetic catalog is seeded with the importer's writers,
+then each scenario sends a fixed, seeded sequence of requests through the
+full middleware stack and URLconf from a pool of threads, each with its
+own DB connection. Latency is measured around every request, and query
+counts are read back from the `Server-Timing` header added by
+core.instrumentation.
+"""
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core import importer
+from core.models import Movie, Rating
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+USERNAME = 'benchmark'
+EMAIL = 'benchmark@example.com'
+PASSWORD = 'benchmark-password'
+SEARCH_WORDS = ('star', 'night', 'river', 'ghost', 'city', 'summer', 'war',
+                'love', 'return', 'last')
+PERCENTILES = (50, 95, 99)
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def synthetic_rows(start, count, ratings_per_movie, seed=0):
+    """Yield catalog rows `start` to `start + count`, the same every time"""
+    for index in range(start, start + count):
+        rng = random.Random(f'{seed}:{index}')
+        words = rng.sample(SEARCH_WORDS, 2)
+        released = date(1950, 1, 1) + timedelta(days=rng.randrange(27000))
+        yield {
+            'title': f'{words[0].title()} {words[1]} {index}',
+            'description': f'Synthetic benchmark movie {index}',
+            'released_date': released.isoformat(),
+            'is_active': 'true' if rng.random() < 0.9 else 'false',
+            'ratings': [
+                round(rng.uniform(0, 5), 1)
+                for _ in range(rng.randrange(ratings_per_movie * 2 + 1))
+            ],
+        }
+
+
+def get_benchmark_user():
+    """Return the user owning the synthetic catalog, with its token"""
+    user, created = get_user_model().objects.get_or_create(
+        username=USERNAME, defaults={'email': EMAIL}
+    )
+    if created:
+        user.set_password(PASSWORD)
+        user.save()
+    token, _ = Token.objects.get_or_create(user=user)
+    return user, token.key
+
+
+def seed_catalog(user, movies, ratings_per_movie=5, batch_size=5000, seed=0):
+    """Top the user's catalog up to `movies` movies, yielding progress.
+
+    Movie n is always generated from the same row, so a catalog that was
+    seeded partially, or at a smaller size, is extended rather than
+    rebuilt.
+    """
+    existing = Movie.objects.filter(user=user).count()
+    writer = importer.get_writer(user)
+    for start in range(existing, movies, batch_size):
+        count = min(batch_size, movies - start)
+        batch = [importer.parse_movie(row) for row in
+                 synthetic_rows(start, count, ratings_per_movie, seed)]
+        with transaction.atomic():
+            writer.write(batch)
+        yield start + count
+
+
+class Scenario:
+    """A named request type and the deterministic requests it sends"""
+
+    def __init__(self, name, method, url, data=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+
+    def requests(self, count, rng, ids):
+        """Return `count` (method, path, data) tuples"""
+        return [(self.method, self.url(rng, ids), self.data)
+                for _ in range(count)]
+
+
+SCENARIOS = [
+    Scenario('movie-list', 'GET',
+             lambda rng, ids: reverse('movie:movie-list')),
+    Scenario('movie-list-filtered', 'GET',
+             lambda rng, ids: reverse('movie:movie-list') +
+             f'?min_rating={rng.randint(1, 4)}&ordering=-rating_mean'),
+    Scenario('movie-detail', 'GET',
+             lambda rng, ids: reverse('movie:movie-detail',
+                                      args=[rng.randint(*ids['movie'])])),
+    Scenario('movie-search', 'GET',
+             lambda rng, ids: reverse('movie:movie-search') +
+             f'?q={rng.choice(SEARCH_WORDS)}'),
+    Scenario('movie-top', 'GET',
+             lambda rng, ids: reverse('movie:movie-top')),
+    Scenario('rating-list', 'GET',
+             lambda rng, ids: reverse('movie:rating-list')),
+    Scenario('rating-detail', 'GET',
+             lambda rng, ids: reverse('movie:rating-detail',
+                                      args=[rng.randint(*ids['rating'])])),
+    Scenario('user-me', 'GET',
+             lambda rng, ids: reverse('user:me')),
+    Scenario('user-token', 'POST',
+             lambda rng, ids: reverse('user:token'),
+             data={'username': USERNAME, 'email': EMAIL,
+                   'password': PASSWORD}),
+]
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+class Runner:
+    """Send scenario requests from a pool of threads and summarise them"""
+
+    def __init__(self, token, concurrency=8, requests=200, warmup=10,
+                 seed=0):
+        self.token = token
+        self.concurrency = concurrency
+        self.requests = requests
+        self.warmup = warmup
+        self.seed = seed
+        self._local = threading.local()
+
+    def get_client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(
+                raise_request_exception=False,
+                HTTP_AUTHORIZATION=f'Token {self.token}',
+            )
+        return client
+
+    def send(self, method, path, data):
+        client = self.get_client()
+        start = time.perf_counter()
+        if method == 'POST':
+            response = client.post(path, data)
+        else:
+            response = client.get(path)
+        latency = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(
+            response.headers.get('Server-Timing', '')
+        )
+        queries = int(match[1]) if match else 0
+        return latency, queries, response.status_code
+
+    def send_all(self, requests, pool):
+        if pool is None:
+            return [self.send(*request) for request in requests]
+        return list(pool.map(lambda request: self.send(*request), requests))
+
+    def run_scenario(self, scenario, ids, pool):
+        rng = random.Random(f'{self.seed}:{scenario.name}')
+        requests = scenario.requests(self.warmup + self.requests, rng, ids)
+        self.send_all(requests[:self.warmup], pool)
+
+        start = time.perf_counter()
+        results = self.send_all(requests[self.warmup:], pool)
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _, _ in results)
+        summary = {
+            'requests': len(results),
+            'errors': sum(1 for _, _, status in results if status >= 400),
+            'throughput': round(len(results) / elapsed, 1),
+            'queries_per_request': round(
+                sum(queries for _, queries, _ in results) / len(results), 2
+            ),
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = round(
+                percentile(latencies, percent) * 1000, 2
+            )
+        return summary
+
+    def run(self, scenarios, user):
+        """Run each scenario in turn, returning {name: summary}.
+
+        With a concurrency of 1 requests are sent from the calling thread.
+        """
+        ids = {
+            'movie': id_range(Movie.objects.filter(user=user)),
+            'rating': id_range(Rating.objects.filter(user=user)),
+        }
+        if self.concurrency == 1:
+            return {scenario.name: self.run_scenario(scenario, ids, None)
+                    for scenario in scenarios}
+
+        results = {}
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            try:
+                for scenario in scenarios:
+                    results[scenario.name] = self.run_scenario(scenario, ids,
+                                                               pool)
+            finally:
+                # One task per worker thread, each closing its connections
+                barrier = threading.Barrier(self.concurrency)
+                list(pool.map(lambda _: (barrier.wait(),
+                                         connections.close_all()),
+                              range(self.concurrency)))
+        return results
+
+
+def id_range(queryset):
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    return bounds['low'] or 0, bounds['high'] or 0
+
+
+# Metrics compared against the baseline -> whether higher is better
+COMPARED_METRICS = {
+    'throughput': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'queries_per_request': False,
+    'errors': False,
+}
+# Deterministic metrics, which regress on any change for the worse. The
+# timings depend on the machine and its load, so they are only advisory.
+GATED_METRICS = ('queries_per_request', 'errors')
+
+
+def compare(results, baseline, tolerance):
+    """Return (scenario, metric, baseline, current) for each regression.
+
+    Timings regress once they're more than `tolerance` worse than the
+    baseline, relatively; GATED_METRICS regress on any increase.
+    """
+    regressions = []
+    for name, summary in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = expected.get(metric), summary[metric]
+            if old is None:
+                continue
+            if metric in GATED_METRICS:
+                regressed = new > old
+            elif higher_is_better:
+                regressed = new < old / (1 + tolerance)
+            else:
+                regressed = new > old * (1 + tolerance)
+            if regressed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def baseline_key(vendor, movies, concurrency):
+    """Key of the baseline entry comparable with a run"""
+    return f'{vendor}, {movies} movies, concurrency {concurrency}'
+
+
+def load_baselines(path):
+    """Return every stored baseline, keyed by `baseline_key`"""
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, key, scenarios):
+    """Store the scenario results of a run as the baseline for its key"""
+    baselines = load_baselines(path)
+    baselines[key] = scenarios
+    with open(path, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
@@ -0,0 +1,3 @@
+"""
+Pooled PostgreSQL database engine, see core.db.pool
+"""
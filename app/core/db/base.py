@@ -0,0 +1,53 @@
+"""
+PostgreSQL backend handing out connections from core.db.pool
+"""
+import functools
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.db.pool import PoolTimeout, drop_pool, get_pool
+
+
+def check_connection(connection):
+    """Raise if an idle connection no longer answers"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def reset_connection(connection):
+    """Roll back what a request left open, raise if it can't be reused"""
+    if connection.closed:
+        raise base.Database.InterfaceError('connection already closed')
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        raise base.Database.InterfaceError('connection is broken')
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Connections are taken from and returned to the process's pool"""
+
+    def get_new_connection(self, conn_params):
+        connect = functools.partial(super().get_new_connection, conn_params)
+        # Kept so the connection goes back to the pool it came from
+        self._pool = get_pool(self.alias)
+        try:
+            return self._pool.getconn(connect, check_connection)
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is not None:
+            self._pool.putconn(self.connection, reset_connection)
+
+    def warm_pool(self):
+        get_pool(self.alias).warm(functools.partial(
+            super().get_new_connection, self.get_connection_params()
+        ))
+
+    def close_pool(self):
+        # Called by Django before creating, cloning or dropping test
+        # databases and when the time zone setting changes
+        drop_pool(self.alias)
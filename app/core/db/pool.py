@@ -0,0 +1,287 @@
+"""
+Per-process database connection pool.
+
+Django opens a connection the first time a request queries the database
+and closes it when the request finishes. With the `core.db` engine,
+closing hands the connection back to a pool shared by the worker's
+threads and the next request reuses it, so the connection setup (TCP,
+authentication, backend startup) is paid once per connection instead of
+once per request.
+
+Each database alias gets a pool of at most DB_POOL_MAX_SIZE connections,
+DB_POOL_MIN_SIZE of which `warm_pools` opens when a worker boots. A
+connection idle for DB_POOL_CHECK_INTERVAL seconds is health-checked
+before it's reused, idle connections beyond the minimum are closed after
+DB_POOL_MAX_IDLE seconds, and a request finding every connection in use
+waits up to DB_POOL_TIMEOUT seconds for one.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+CHECKOUTS = ('created', 'reused')
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection is returned within the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections to one database.
+
+    The pool doesn't know the driver: callers pass `connect()` returning a
+    new connection, `check(connection)` and `reset(connection)` raising
+    for a connection that can't be reused.
+    """
+
+    def __init__(self, min_size, max_size, timeout, check_interval,
+                 max_idle):
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_idle = max_idle
+        # (connection, idle since), most recently returned last
+        self._idle = collections.deque()
+        self._open = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.counters = {
+            'created': 0, 'reused': 0, 'discarded': 0, 'waited': 0,
+            'timed_out': 0,
+        }
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            timeout=settings.DB_POOL_TIMEOUT,
+            check_interval=settings.DB_POOL_CHECK_INTERVAL,
+            max_idle=settings.DB_POOL_MAX_IDLE,
+        )
+
+    def getconn(self, connect, check):
+        """Return a healthy idle connection, or a new one"""
+        start = time.monotonic()
+        while True:
+            with self._condition:
+                self._close_expired()
+                waited = False
+                while not self._idle and self._open >= self.max_size:
+                    remaining = start + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timed_out'] += 1
+                        raise PoolTimeout(
+                            'No connection available after {}s, all {} in '
+                            'use'.format(self.timeout, self.max_size)
+                        )
+                    waited = True
+                    self._condition.wait(remaining)
+                if waited:
+                    self.counters['waited'] += 1
+                    self.wait_seconds += time.monotonic() - start
+                if not self._idle:
+                    self._open += 1
+                    break
+                # Reuse the most recently returned, likeliest to be healthy
+                connection, idle_since = self._idle.pop()
+
+            idle = time.monotonic() - idle_since
+            if idle < self.check_interval or self._healthy(connection, check):
+                self._count('reused')
+                return connection
+
+        return self._connect(connect)
+
+    def putconn(self, connection, reset):
+        """Take a connection back, closing it if it can't be reset"""
+        try:
+            reset(connection)
+        except Exception:
+            self._discard(connection)
+            return
+        with self._condition:
+            if self._closed:
+                self._open -= 1
+                close_quietly(connection)
+                return
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def warm(self, connect):
+        """Open connections until the pool holds `min_size`"""
+        while True:
+            with self._condition:
+                if self._open >= self.min_size:
+                    return
+                self._open += 1
+            connection = self._connect(connect)
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def close(self):
+        """Close the idle connections, and the others once returned"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, collections.deque()
+            self._open -= len(idle)
+        for connection, _ in idle:
+            close_quietly(connection)
+
+    def stats(self):
+        """Return the counters and the current connection counts"""
+        with self._condition:
+            return {
+                'counters': dict(self.counters),
+                'wait_seconds': self.wait_seconds,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+    def _connect(self, connect):
+        # The slot is reserved by the caller
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+        self._count('created')
+        return connection
+
+    def _healthy(self, connection, check):
+        try:
+            check(connection)
+        except Exception:
+            self._discard(connection)
+            return False
+        return True
+
+    def _discard(self, connection):
+        close_quietly(connection)
+        with self._condition:
+            self._open -= 1
+            self.counters['discarded'] += 1
+            self._condition.notify()
+
+    def _close_expired(self):
+        # Called with the lock held, the oldest idle connections are first
+        now = time.monotonic()
+        while (self._idle and self._open > self.min_size
+               and now - self._idle[0][1] > self.max_idle):
+            connection, _ = self._idle.popleft()
+            self._open -= 1
+            close_quietly(connection)
+
+    def _count(self, outcome):
+        with self._condition:
+            self.counters[outcome] += 1
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    """Return this process's pool for a database alias"""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Never share connections inherited from a parent process
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool.from_settings()
+        return pool
+
+
+def drop_pool(alias):
+    """Close a pool's idle connections, the next connection gets a new one"""
+    with _pools_lock:
+        pool = _pools.pop(alias, None) if _pools_pid == os.getpid() else None
+    if pool is not None:
+        pool.close()
+
+
+def warm_pools():
+    """Fill the pool of every pooled database, when a worker boots"""
+    for alias in connections:
+        connection = connections[alias]
+        if not hasattr(connection, 'warm_pool'):
+            continue
+        try:
+            connection.warm_pool()
+        except Exception:
+            logger.warning('Could not warm the %s connection pool', alias,
+                           exc_info=True)
+
+
+def collect_pool_metrics():
+    """Metrics collector for the connection pools"""
+    with _pools_lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    stats = {alias: pool.stats() for alias, pool in pools.items()}
+    yield metrics.gauge(
+        'db_pool_connections',
+        'Open pooled connections by database and state',
+        [({'database': alias, 'state': state}, pool_stats[state])
+         for alias, pool_stats in stats.items()
+         for state in ('idle', 'in_use')]
+    )
+    yield metrics.gauge(
+        'db_pool_max_connections',
+        'Size limit of each database pool',
+        [({'database': alias}, pool_stats['max_size'])
+         for alias, pool_stats in stats.items()]
+    )
+    yield metrics.counter(
+        'db_pool_checkouts_total',
+        'Connections handed out, newly created or reused',
+        [({'database': alias, 'outcome': outcome},
+          pool_stats['counters'][outcome])
+         for alias, pool_stats in stats.items() for outcome in CHECKOUTS]
+    )
+    yield metrics.counter(
+        'db_pool_waits_total',
+        'Checkouts that waited for a connection, by outcome',
+        [({'database': alias, 'outcome': outcome},
+          pool_stats['counters'][counter])
+         for alias, pool_stats in stats.items()
+         for outcome, counter in (('served', 'waited'),
+                                  ('timed_out', 'timed_out'))]
+    )
+    yield metrics.counter(
+        'db_pool_wait_seconds_total',
+        'Time spent waiting for a connection',
+        [({'database': alias}, round(pool_stats['wait_seconds'], 6))
+         for alias, pool_stats in stats.items()]
+    )
+    yield metrics.counter(
+        'db_pool_discarded_total',
+        'Connections closed because they failed a health check or reset',
+        [({'database': alias}, pool_stats['counters']['discarded'])
+         for alias, pool_stats in stats.items()]
+    )
@@ -0,0 +1,21 @@
+"""
+Readiness checks shared by `wait_for_db` and the /ready probe
+"""
+from django.db import DatabaseError, connections
+
+
+def ping(alias):
+    """Run a trivial query, raising if the database can't be reached"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def unavailable_databases(aliases=None):
+    """Return the aliases of the databases that can't be queried"""
+    unavailable = []
+    for alias in aliases or connections:
+        try:
+            ping(alias)
+        except DatabaseError:
+            unavailable.append(alias)
+    return unavailable
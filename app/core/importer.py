@@ -0,0 +1,326 @@
+"""
+Streaming bulk import of movie catalogs.
+
+Rows are read lazily from CSV, TSV (including IMDb `title.basics` style
+dumps) or JSON Lines files, optionally gzipped, and written in large
+batches: `COPY` on PostgreSQL and `bulk_create` elsewhere. Memory use is
+bounded by the batch size, not the size of the file.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import date
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import (Movie,
+                         Rating,
+                         bayesian_score,
+                         rating_bucket,
+                         empty_rating_histogram)
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+NULL_VALUES = ('', '\\N')
+TITLE_FIELDS = ('title', 'primaryTitle')
+DESCRIPTION_FIELDS = ('description', 'originalTitle', 'genres')
+RATING_FIELDS = ('rating', 'averageRating')
+TRUE_VALUES = ('1', 'true', 'yes', 't', 'y')
+
+csv.field_size_limit(1024 * 1024)
+
+
+class RowError(ValueError):
+    """Raised when a source row can't be turned into a movie"""
+
+
+def detect_format(path):
+    """Guess the file format from its extension"""
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    if extension in ('ndjson', 'json'):
+        return 'jsonl'
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f'Unable to detect the format of {path}')
+
+
+def open_source(path):
+    """Open a (possibly gzipped) text file for streaming"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per record of the stream"""
+    if fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
+    if fmt == 'tsv':
+        reader = csv.DictReader(stream, delimiter='\t',
+                                quoting=csv.QUOTE_NONE)
+    else:
+        reader = csv.DictReader(stream)
+    yield from reader
+
+
+def first_value(row, fields):
+    """Return the first non-null value among the given columns"""
+    for field in fields:
+        value = row.get(field)
+        if value is not None and value not in NULL_VALUES:
+            return value
+    return None
+
+
+def parse_date(row):
+    value = first_value(row, ('released_date',))
+    try:
+        if value is not None:
+            return date.fromisoformat(str(value)[:10])
+        year = first_value(row, ('startYear', 'year'))
+        if year is not None:
+            return date(int(year), 1, 1)
+    except ValueError:
+        pass
+    raise RowError('missing or invalid release date')
+
+
+def parse_ratings(row, rating_scale):
+    """Return a list of (value, description) tuples for a row"""
+    values = row.get('ratings')
+    if values is None:
+        value = first_value(row, RATING_FIELDS)
+        values = [] if value is None else [value]
+
+    ratings = []
+    for value in values:
+        description = 'Imported rating'
+        if isinstance(value, dict):
+            description = value.get('description') or description
+            value = value.get('rating')
+        try:
+            value = float(value) / rating_scale
+        except (TypeError, ValueError):
+            raise RowError('invalid rating')
+        if not 0.0 <= value <= 5.0:
+            raise RowError('rating out of range')
+        ratings.append((value, str(description)[:255]))
+    return ratings
+
+
+def parse_movie(row, rating_scale=1.0, title_type=None):
+    """Turn a source row into (movie fields, ratings)"""
+    if not isinstance(row, dict):
+        raise RowError('malformed row')
+    if title_type and row.get('titleType') not in (None, title_type):
+        raise RowError('filtered title type')
+    title = first_value(row, TITLE_FIELDS)
+    if title is None:
+        raise RowError('missing title')
+    description = first_value(row, DESCRIPTION_FIELDS) or ''
+    is_active = str(row.get('is_active', 'true')).strip().lower() in TRUE_VALUES
+    ratings = parse_ratings(row, rating_scale)
+
+    fields = {
+        'title': str(title)[:255],
+        'description': str(description)[:255],
+        'is_active': is_active,
+        'released_date': parse_date(row),
+    }
+    histogram = empty_rating_histogram()
+    for value, _ in ratings:
+        histogram[rating_bucket(value)] += 1
+    fields['rating_count'] = len(ratings)
+    fields['rating_sum'] = sum(value for value, _ in ratings)
+    fields['rating_mean'] = (
+        fields['rating_sum'] / len(ratings) if ratings else 0.0
+    )
+    fields['rating_histogram'] = histogram
+    fields['top_score'] = bayesian_score(len(ratings), fields['rating_sum'])
+    return fields, ratings
+
+
+class BulkCreateWriter:
+    """Insert batches with bulk_create (works on every backend)"""
+
+    def __init__(self, user, using='default'):
+        self.user = user
+        self.using = using
+
+    def write(self, batch):
+        movies = Movie.objects.using(self.using).bulk_create(
+            Movie(user=self.user, **fields) for fields, _ in batch
+        )
+        Rating.objects.using(self.using).bulk_create(
+            Rating(user=self.user, movie=movie, rating=value,
+                   description=description)
+            for movie, (_, movie_ratings) in zip(movies, batch)
+            for value, description in movie_ratings
+        )
+
+
+class CopyWriter:
+    """Insert batches with PostgreSQL COPY using pre-reserved ids.
+
+    Model defaults aren't applied by COPY, so every NOT NULL column
+    needs a value in the rows.
+    """
+    movie_columns = [
+        'id', 'user_id', 'title', 'description', 'is_active',
+        'released_date', 'image_variants', 'rating_count', 'rating_sum',
+        'rating_mean', 'rating_histogram', 'top_score', 'updated',
+    ]
+    rating_columns = [
+        'id', 'user_id', 'movie_id', 'rating', 'description', 'created',
+        'updated',
+    ]
+
+    def __init__(self, user, using='default'):
+        self.user = user
+        self.using = using
+
+    def reserve_ids(self, cursor, model, count):
+        if not count:
+            return []
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [model._meta.db_table, 'id', count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def copy(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer
+        )
+
+    def write(self, batch):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            movie_ids = self.reserve_ids(cursor, Movie, len(batch))
+            rating_count = sum(len(ratings) for _, ratings in batch)
+            rating_ids = iter(self.reserve_ids(cursor, Rating, rating_count))
+
+            now = timezone.now()
+            movie_rows = []
+            rating_rows = []
+            for movie_id, (fields, ratings) in zip(movie_ids, batch):
+                movie_rows.append(self.movie_row(movie_id, fields, now))
+                for value, description in ratings:
+                    rating_rows.append(self.rating_row(
+                        next(rating_ids), movie_id, value, description, now
+                    ))
+
+            raw_cursor = cursor.cursor
+            self.copy(raw_cursor, Movie._meta.db_table, self.movie_columns,
+                      movie_rows)
+            self.copy(raw_cursor, Rating._meta.db_table, self.rating_columns,
+                      rating_rows)
+
+    def movie_row(self, movie_id, fields, now):
+        """Return the values of `movie_columns` for a parsed movie"""
+        return (
+            movie_id, self.user.pk, fields['title'], fields['description'],
+            fields['is_active'], fields['released_date'], '{}',
+            fields['rating_count'], fields['rating_sum'],
+            fields['rating_mean'], json.dumps(fields['rating_histogram']),
+            fields['top_score'], now,
+        )
+
+    def rating_row(self, rating_id, movie_id, value, description, now):
+        """Return the values of `rating_columns` for a parsed rating"""
+        return (rating_id, self.user.pk, movie_id, value, description, now,
+                now)
+
+
+def copy_value(value):
+    """Format a value for the COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, date):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def get_writer(user, using='default'):
+    """Return the fastest writer the database supports"""
+    if connections[using].vendor == 'postgresql':
+        return CopyWriter(user, using=using)
+    return BulkCreateWriter(user, using=using)
+
+
+def load_checkpoint(path, source):
+    """Return the number of rows already consumed from source"""
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return 0
+    if checkpoint.get('source') != os.path.abspath(source):
+        raise ValueError(f'Checkpoint {path} belongs to another file')
+    return checkpoint['rows']
+
+
+def save_checkpoint(path, source, rows):
+    """Atomically record how many source rows have been committed"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump({'source': os.path.abspath(source), 'rows': rows},
+                  checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+def import_movies(source, user, fmt=None, batch_size=5000, skip=0,
+                  rating_scale=1.0, title_type=None, using='default',
+                  writer=None):
+    """Import a catalog file, yielding progress after every batch.
+
+    Each batch is committed in its own transaction. The yielded dict has
+    `rows` (source rows consumed, including `skip`), `imported` and
+    `skipped` counts, so callers can checkpoint after each yield.
+    """
+    fmt = fmt or detect_format(source)
+    writer = writer or get_writer(user, using=using)
+    progress = {'rows': skip, 'imported': 0, 'skipped': 0}
+    batch = []
+
+    def flush():
+        with transaction.atomic(using=using):
+            writer.write(batch)
+        progress['imported'] += len(batch)
+        batch.clear()
+
+    with open_source(source) as stream:
+        for index, row in enumerate(read_rows(stream, fmt)):
+            if index < skip:
+                continue
+            try:
+                batch.append(parse_movie(row, rating_scale, title_type))
+            except RowError:
+                progress['skipped'] += 1
+            progress['rows'] = index + 1
+            if len(batch) >= batch_size:
+                flush()
+                yield dict(progress)
+        if batch:
+            flush()
+        yield dict(progress)
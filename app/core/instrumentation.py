@@ -0,0 +1,233 @@
+"""
+Per-request performance instrumentation.
+
+`InstrumentationMiddleware` records, for every request, the number and
+total time of DB queries, the time spent in serializers, the time spent
+rendering the response and the total time. The phases are sent back in a
+`Server-Timing` header and aggregated per view into histograms served
+from /metrics. The phases can overlap, e.g. queries run lazily while a
+serializer reads a queryset count towards both `db` and `serializer`.
+
+Queries are timed by `record_query`, which is installed on every
+database connection and finds the request from a context variable, so
+the queries an async view runs in sync_to_async threads are counted too.
+
+Queries slower than SLOW_QUERY_THRESHOLD_MS are logged to the
+`core.slow_queries` logger with their SQL and the project code that ran
+them, for a SLOW_QUERY_SAMPLE_RATE fraction of them.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import time
+import traceback
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core import metrics
+
+slow_query_logger = logging.getLogger('core.slow_queries')
+
+PHASES = ('db', 'serializer', 'render', 'total')
+
+request_duration = metrics.Histogram(
+    'request_phase_seconds',
+    'Time spent per request in each phase, by view',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+             2.5, 5, 10),
+    label_names=('view', 'phase'),
+)
+request_queries = metrics.Histogram(
+    'request_db_queries',
+    'DB queries per request, by view',
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+    label_names=('view',),
+)
+
+_current_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Phase durations and query count of one request"""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self._depth = dict.fromkeys(PHASES, 0)
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        """Add the time spent in the block to a phase, once if nested"""
+        self._depth[phase] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[phase] -= 1
+            if not self._depth[phase]:
+                self.durations[phase] += time.perf_counter() - start
+
+    def record_query(self, execute, sql, params, many, context):
+        """DB execute wrapper timing every query of the request"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.durations['db'] += duration
+            log_slow_query(sql, duration)
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header"""
+        entries = []
+        for phase in PHASES:
+            entry = '{};dur={:.3f}'.format(phase,
+                                           self.durations[phase] * 1000)
+            if phase == 'db':
+                entry += ';desc="{} queries"'.format(self.queries)
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+def record_query(execute, sql, params, many, context):
+    """DB execute wrapper timing the query towards the current request"""
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding `record_query` to a connection"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextlib.contextmanager
+def measure(phase):
+    """Time a block towards the current request's phase, if any"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+    else:
+        with timings.measure(phase):
+            yield
+
+
+def call_site():
+    """Return 'path:line in function' of the project code running a query"""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(base_dir)
+                and frame.filename != __file__):
+            return '{}:{} in {}'.format(
+                os.path.relpath(frame.filename, base_dir), frame.lineno,
+                frame.name
+            )
+    return 'unknown'
+
+
+def log_slow_query(sql, duration):
+    if duration * 1000 < settings.SLOW_QUERY_THRESHOLD_MS:
+        return
+    if random.random() >= settings.SLOW_QUERY_SAMPLE_RATE:
+        return
+    slow_query_logger.warning(
+        'Slow query (%.1f ms) at %s: %s', duration * 1000, call_site(), sql
+    )
+
+
+def view_name(request):
+    """Return a label like 'MovieViewSet.list' for the view of a request"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class',
+                                                       None)
+    if view_class is None:
+        return func.__name__
+    action = getattr(func, 'actions', {}).get(request.method.lower())
+    if action:
+        return '{}.{}'.format(view_class.__name__, action)
+    return view_class.__name__
+
+
+class InstrumentedSerializerMixin:
+    """Count validation and serialization towards the serializer phase"""
+
+    def is_valid(self, *args, **kwargs):
+        with measure('serializer'):
+            return super().is_valid(*args, **kwargs)
+
+    @property
+    def data(self):
+        with measure('serializer'):
+            return super().data
+
+
+class InstrumentationMiddleware:
+    """Time each request's phases and report them"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self.report(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self.report(request, response, timings, start)
+
+    def report(self, request, response, timings, start):
+        """Add the Server-Timing header and record the histograms"""
+        timings.durations['total'] = time.perf_counter() - start
+
+        response['Server-Timing'] = timings.server_timing()
+        view = view_name(request)
+        for phase, duration in timings.durations.items():
+            request_duration.observe(duration, view=view, phase=phase)
+        request_queries.observe(timings.queries, view=view)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time rendering, which happens right after this hook"""
+        timings = _current_timings.get()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timings.durations['render'] += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def collect_instrumentation_metrics():
+    """Metrics collector for the request histograms"""
+    yield from request_duration.collect()
+    yield from request_queries.collect()
@@ -0,0 +1,140 @@
+"""
+Django command to load test the API against a synthetic catalog
+"""
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    """Seed a synthetic catalog, load the API and compare to the baseline"""
+    help = ('Benchmark the movie, rating and user endpoints and compare '
+            'the results with the committed baseline. Seeds a `benchmark` '
+            'user and its movies, so run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=benchmark.SIZES, default='10k',
+                            help='Catalog size to seed')
+        parser.add_argument('--movies', type=int,
+                            help='Exact catalog size, overrides --size')
+        parser.add_argument('--ratings-per-movie', type=int, default=5,
+                            help='Average ratings seeded per movie')
+        parser.add_argument('--no-seed', action='store_true',
+                            help='Benchmark the catalog as it is')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Unmeasured requests per scenario')
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=[scenario.name for scenario in benchmark.SCENARIOS],
+            help='Only run this scenario, can be repeated'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this file')
+        parser.add_argument('--baseline',
+                            default=settings.BENCHMARK_BASELINE_PATH)
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=1.0,
+            help='Relative slowdown of a timing reported as a regression, '
+                 '1 for twice as slow'
+        )
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if queries per request or errors '
+                                 'regressed, timings are only reported')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store the results as the new baseline')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+        movies = options['movies'] or benchmark.SIZES[options['size']]
+        user, token = benchmark.get_benchmark_user()
+
+        if not options['no_seed']:
+            for seeded in benchmark.seed_catalog(
+                    user, movies,
+                    ratings_per_movie=options['ratings_per_movie'],
+                    seed=options['seed']):
+                self.stdout.write(f'Seeded {seeded}/{movies} movies')
+
+        scenarios = [scenario for scenario in benchmark.SCENARIOS
+                     if not options['scenario']
+                     or scenario.name in options['scenario']]
+        runner = benchmark.Runner(
+            token,
+            concurrency=options['concurrency'],
+            requests=options['requests'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+        )
+        # Requests come from the test client's `testserver` host
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = runner.run(scenarios, user)
+
+        key = benchmark.baseline_key(connection.vendor, movies,
+                                     options['concurrency'])
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump({'baseline_key': key, 'scenarios': results},
+                          output_file, indent=2, sort_keys=True)
+                output_file.write('\n')
+
+        if options['update_baseline']:
+            benchmark.save_baseline(options['baseline'], key, results)
+            self.stdout.write(self.style.SUCCESS(
+                f"Baseline for '{key}' written to {options['baseline']}"
+            ))
+            return
+
+        baseline = benchmark.load_baselines(options['baseline']).get(key)
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline for '{key}' in {options['baseline']}"
+            ))
+            return
+        regressions = benchmark.compare(results, baseline,
+                                        options['tolerance'])
+        gated = [regression for regression in regressions
+                 if regression[1] in benchmark.GATED_METRICS]
+        for name, metric, old, new in regressions:
+            if metric in benchmark.GATED_METRICS:
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: {metric} regressed from {old} to {new}'
+                ))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: {metric} regressed from {old} to {new} '
+                    f'(advisory, timings vary between machines)'
+                ))
+        if gated and options['check']:
+            raise CommandError(f'{len(gated)} metrics regressed')
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions against '{key}'"
+            ))
+
+    def report(self, results):
+        columns = ('requests', 'errors', 'throughput', 'p50_ms', 'p95_ms',
+                   'p99_ms', 'queries_per_request')
+        widths = [len(column) + 2 for column in columns]
+        self.stdout.write(f"{'scenario':<22}" + ''.join(
+            f'{column:>{width}}' for column, width in zip(columns, widths)
+        ))
+        for name, summary in results.items():
+            self.stdout.write(f'{name:<22}' + ''.join(
+                f'{summary[column]:>{width}}'
+                for column, width in zip(columns, widths)
+            ))
@@ -0,0 +1,43 @@
+"""
+Django command to regenerate the pregenerated OpenAPI schema
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import generate_schema, schema_cache
+
+
+class Command(BaseCommand):
+    """Write the OpenAPI schema to OPENAPI_SCHEMA_PATH"""
+    help = 'Regenerate the OpenAPI schema served at /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if the schema on disk differs from the code '
+                 'instead of writing it'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        path = settings.OPENAPI_SCHEMA_PATH
+        content = generate_schema()
+
+        if options['check']:
+            try:
+                with open(path, 'rb') as schema_file:
+                    current = schema_file.read()
+            except FileNotFoundError:
+                current = None
+            if current != content:
+                raise CommandError(
+                    f'{path} is out of date, run `manage.py build_schema`'
+                )
+            self.stdout.write(self.style.SUCCESS('Schema is up to date'))
+            return
+
+        with open(path, 'wb') as schema_file:
+            schema_file.write(content)
+        schema_cache.clear()
+        self.stdout.write(self.style.SUCCESS(f'Schema written to {path}'))
@@ -0,0 +1,90 @@
+"""
+Django command to stream a movie catalog file into the database
+"""
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+
+
+class Command(BaseCommand):
+    """Bulk import movies and ratings from CSV, TSV or JSON Lines"""
+    help = 'Stream a CSV/TSV/JSONL movie catalog into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file, optionally .gz')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username that will own the imported movies and ratings'
+        )
+        parser.add_argument('--format', choices=importer.FORMATS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording committed progress so the import can resume'
+        )
+        parser.add_argument(
+            '--rating-scale',
+            type=float,
+            default=1.0,
+            help='Divide source ratings by this, e.g. 2 for 0-10 ratings'
+        )
+        parser.add_argument(
+            '--title-type',
+            help='Only import rows with this IMDb titleType, e.g. movie'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        path = options['path']
+        checkpoint = options['checkpoint']
+        # The file is opened and parsed while the progress is iterated
+        try:
+            skip = importer.load_checkpoint(checkpoint, path) if checkpoint else 0
+            progress = self.run_import(path, user, skip, options)
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(f'Cannot import {path}: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress['imported']} movies"
+        ))
+
+    def run_import(self, path, user, skip, options):
+        """Import the file, reporting and checkpointing after each batch"""
+        checkpoint = options['checkpoint']
+        progress_iter = importer.import_movies(
+            path,
+            user,
+            fmt=options['format'] or importer.detect_format(path),
+            batch_size=options['batch_size'],
+            skip=skip,
+            rating_scale=options['rating_scale'],
+            title_type=options['title_type'],
+            using=options['database'],
+        )
+
+        if skip:
+            self.stdout.write(f'Resuming after {skip} rows')
+        started = time.monotonic()
+        progress = {'rows': skip, 'imported': 0, 'skipped': 0}
+        for progress in progress_iter:
+            if checkpoint:
+                importer.save_checkpoint(checkpoint, path, progress['rows'])
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(
+                f"{progress['rows']} rows read, "
+                f"{progress['imported']} imported, "
+                f"{progress['skipped']} skipped "
+                f"({(progress['rows'] - skip) / elapsed:.0f} rows/s)"
+            )
+        return progress
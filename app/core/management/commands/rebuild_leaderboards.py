@@ -0,0 +1,31 @@
+"""
+Django command to rebuild the movie leaderboard scores
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Movie
+
+
+class Command(BaseCommand):
+    """Recompute the top rated and trending scores of every movie"""
+    help = 'Rebuild the top rated and trending leaderboard scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of movies updated per statement'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        self.stdout.write('Rebuilding top rated scores')
+        Movie.objects.rebuild_rating_aggregates(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write('Rebuilding trending scores')
+        Movie.objects.rebuild_trending_scores(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS('Leaderboards rebuilt'))
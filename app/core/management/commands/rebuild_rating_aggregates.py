@@ -0,0 +1,27 @@
+"""
+Django command to rebuild the denormalized movie rating aggregates
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Movie
+
+
+class Command(BaseCommand):
+    """Recompute rating count, sum, mean and histogram for every movie"""
+    help = 'Rebuild the rating aggregates stored on each movie'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of movies updated per statement'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        self.stdout.write('Rebuilding movie rating aggregates')
+        updated = Movie.objects.rebuild_rating_aggregates(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {updated} movies'))
@@ -0,0 +1,46 @@
+"""
+Django command to rebuild the similar movies
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core import similarity
+
+
+class Command(BaseCommand):
+    """Recompute each movie's nearest neighbours from the ratings"""
+    help = ('Rebuild the similar movies from co-rating patterns. Only movies '
+            'affected by rating changes since the last build are '
+            'recomputed, unless --full is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every movie')
+        parser.add_argument('--top-k', type=int,
+                            help='Neighbours stored per movie, defaults to '
+                                 'SIMILAR_MOVIES_TOP_K')
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1000,
+            help='Number of movies compared with the catalog at once'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of rows read or written per statement'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        if options['top_k'] is not None and options['top_k'] < 1:
+            raise CommandError('--top-k must be positive')
+        progress = similarity.build(
+            full=options['full'],
+            top_k=options['top_k'],
+            block_size=options['block_size'],
+            batch_size=options['batch_size'],
+        )
+        for done, total in progress:
+            self.stdout.write(f'Computed neighbours of {done}/{total} movies')
+        self.stdout.write(self.style.SUCCESS('Similar movies rebuilt'))
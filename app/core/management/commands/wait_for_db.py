@@ -3,24 +3,59 @@ Django command to wait for the databse to be ready
 """
 import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 
 from psycopg2 import OperationalError as psycopgError
 from django.db.utils import OperationalError
 
+from core.health import ping
+
+
 class Command(BaseCommand):
     """Custom commands"""
+    help = ('Wait until every database answers a query, retrying with '
+            'exponential backoff. With --timeout it fails once the time is '
+            'up, so it can serve as a readiness probe.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='databases',
+            help='Database alias to wait for, can be repeated. Defaults to '
+                 'all of them'
+        )
+        parser.add_argument('--timeout', type=float,
+                            help='Give up after this many seconds, 0 tries '
+                                 'once. Waits forever by default')
+        parser.add_argument('--interval', type=float, default=0.1,
+                            help='Delay after the first failed attempt, '
+                                 'doubled after each one')
+        parser.add_argument('--max-interval', type=float, default=2.0)
 
     def handle(self, *args, **options):
         """Entry point for the command"""
+        pending = options['databases'] or list(connections)
+        deadline = None
+        if options['timeout'] is not None:
+            deadline = time.monotonic() + options['timeout']
+        delay = options['interval']
         self.stdout.write("Waiting for databse")
-        db_up = False
 
-        while db_up is False:
+        while pending:
             try:
-                self.check(databases=['default']) #Wait for the databse to be ready
-                db_up = True
-            except(OperationalError, psycopgError):
-                self.stdout.write(self.style.ERROR('Databse unavailabe waiting 1 sec'))
-                time.sleep(1)
+                ping(pending[0])
+                pending = pending[1:]
+            except(OperationalError, psycopgError) as exc:
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise CommandError(
+                        f"Database '{pending[0]}' unavailable: {exc}"
+                    )
+                self.stdout.write(self.style.ERROR(
+                    f"Database '{pending[0]}' unavailable, retrying in "
+                    f"{delay:g}s"
+                ))
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_interval'])
         self.stdout.write(self.style.SUCCESS('Databse available!'))
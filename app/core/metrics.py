@@ -0,0 +1,221 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Collectors are generators registered with `register`; each yields
+metric families built with `counter`, `gauge` or a `Histogram`.
+Values are per worker process and every sample carries a `pid` label,
+so series from different workers don't get mixed up.
+
+With METRICS_DIR set, every worker writes its metrics to a file of that
+directory each METRICS_EXPORT_SECONDS, and /metrics serves those of all
+the server's workers whichever one the scrape reaches. Files not updated
+for three intervals belong to workers that are gone and are removed. If
+the directory can't be written, a warning is logged and each worker only
+serves its own metrics.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_collectors = []
+
+
+def register(collector):
+    """Add a collector to the /metrics output"""
+    if collector not in _collectors:
+        _collectors.append(collector)
+    return collector
+
+
+def format_labels(labels):
+    labels = dict(labels, pid=os.getpid())
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def family(name, metric_type, description, samples):
+    """Return the exposition lines of one metric family"""
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    return lines
+
+
+def counter(name, description, samples):
+    return family(name, 'counter', description, samples)
+
+
+def gauge(name, description, samples):
+    return family(name, 'gauge', description, samples)
+
+
+def render():
+    """Return every registered metric as exposition text"""
+    lines = []
+    for collector in _collectors:
+        for metric_family in collector():
+            lines.extend(metric_family)
+    return '\n'.join(lines) + '\n'
+
+
+def export_path(directory, pid=None):
+    return os.path.join(directory, '{}.prom'.format(pid or os.getpid()))
+
+
+def export(directory):
+    """Write this process's metrics for the other workers to serve"""
+    path = export_path(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as export_file:
+        export_file.write(render())
+    os.replace(tmp_path, path)
+
+
+def render_all(directory, max_age):
+    """Return the metrics of this process and of the workers exporting to
+    `directory`, merged by family"""
+    texts = [render()]
+    own_path = export_path(directory)
+    now = time.time()
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        # Not created, the exports are off
+        names = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.endswith('.prom') or path == own_path:
+            continue
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                continue
+            with open(path) as export_file:
+                texts.append(export_file.read())
+        except OSError:
+            # Removed by another worker meanwhile
+            continue
+    return merge(texts)
+
+
+def merge(texts):
+    """Merge exposition texts, keeping one HELP and TYPE per family"""
+    families = {}
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if line.startswith(('# HELP ', '# TYPE ')):
+                current = families.setdefault(line.split(' ', 3)[2],
+                                              {'header': {}, 'samples': []})
+                # Keyed by HELP or TYPE, the first worker's is kept
+                current['header'].setdefault(line[2:6], line)
+            elif line and current is not None:
+                current['samples'].append(line)
+    lines = []
+    for metric_family in families.values():
+        lines.extend(metric_family['header'].values())
+        lines.extend(metric_family['samples'])
+    return '\n'.join(lines) + '\n'
+
+
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """Export this worker's metrics every METRICS_EXPORT_SECONDS to
+    METRICS_DIR, if set"""
+    global _exporter_pid
+    if not settings.METRICS_DIR:
+        return
+    with _exporter_lock:
+        if _exporter_pid == os.getpid():
+            return
+        _exporter_pid = os.getpid()
+    try:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        if not os.access(settings.METRICS_DIR, os.W_OK):
+            raise PermissionError(f'{settings.METRICS_DIR} is read only')
+    except OSError:
+        logger.warning('Cannot export the metrics to %s, /metrics only '
+                       'serves the worker answering it',
+                       settings.METRICS_DIR, exc_info=True)
+        return
+    threading.Thread(target=export_forever, name='metrics-exporter',
+                     args=(settings.METRICS_DIR,
+                           settings.METRICS_EXPORT_SECONDS),
+                     daemon=True).start()
+
+
+def export_forever(directory, interval):
+    while True:
+        try:
+            export(directory)
+        except Exception:
+            logger.warning('Could not export the metrics', exc_info=True)
+        time.sleep(interval)
+
+
+class Histogram:
+    """Thread-safe histogram with fixed buckets and a set of label names"""
+
+    def __init__(self, name, description, buckets, label_names):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for the given label values"""
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0,
+                }
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        """Yield the histogram as one metric family"""
+        with self._lock:
+            series = {key: dict(value, buckets=list(value['buckets']))
+                      for key, value in self._series.items()}
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values['buckets']):
+                cumulative += count
+                bucket_labels = format_labels(dict(labels, le=repr(float(bound))))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            bucket_labels = format_labels(dict(labels, le='+Inf'))
+            lines.append(f'{self.name}_bucket{bucket_labels} {values["count"]}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {values["sum"]}')
+            lines.append(
+                f'{self.name}_count{format_labels(labels)} {values["count"]}'
+            )
+        yield lines
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:36
+
+import core.models
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """Populate the new aggregate columns from existing ratings"""
+    Movie = apps.get_model('core', 'Movie')
+    for movie in Movie.objects.prefetch_related('ratings').iterator(chunk_size=1000):
+        values = [rating.rating for rating in movie.ratings.all()]
+        if not values:
+            continue
+        histogram = core.models.empty_rating_histogram()
+        for value in values:
+            histogram[core.models.rating_bucket(value)] += 1
+        movie.rating_count = len(values)
+        movie.rating_sum = sum(values)
+        movie.rating_mean = movie.rating_sum / movie.rating_count
+        movie.rating_histogram = histogram
+        movie.save(update_fields=['rating_count', 'rating_sum',
+                                  'rating_mean', 'rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_movie_image_alter_rating_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_histogram',
+            field=models.JSONField(default=core.models.empty_rating_histogram),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_mean',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates,
+                             migrations.RunPython.noop),
+    ]
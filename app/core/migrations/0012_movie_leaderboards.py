@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:52
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_top_scores(apps, schema_editor):
+    """Score existing movies from their stored rating aggregates"""
+    Movie = apps.get_model('core', 'Movie')
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    prior_total = weight * settings.LEADERBOARD_PRIOR_MEAN
+    Movie.objects.update(top_score=models.ExpressionWrapper(
+        (models.Value(prior_total) + models.F('rating_sum')) /
+        (models.Value(weight) + models.F('rating_count')),
+        output_field=models.FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_movie_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='top_score',
+            field=models.FloatField(default=core.models.default_top_score),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='trending_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_top_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-top_score', 'id'], name='movie_top_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-trending_score', 'id'], name='movie_trending_score_idx'),
+        ),
+    ]
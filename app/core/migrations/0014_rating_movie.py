@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_movie_filter_indexes'),
+    ]
+
+    operations = [
+        # No reverse accessor until the many to many is removed in 0016,
+        # both would be called `ratings`
+        migrations.AddField(
+            model_name='rating',
+            name='movie',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.movie'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['movie', 'created'], name='rating_movie_created_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+"""
+Copy the movie/rating links of the many to many into Rating.movie.
+
+Links are copied in batches, each committed on its own so the tables are
+never locked for long and an interrupted run can simply be restarted:
+links already copied are skipped. A rating linked to several movies is
+kept on its first movie and copied for each of the others, so every
+movie keeps the ratings its aggregates were computed from.
+"""
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+
+def copy_rating_movies(apps, schema_editor):
+    Rating = apps.get_model('core', 'Rating')
+    Through = apps.get_model('core', 'Movie').ratings.through
+    using = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        links = list(Through.objects.using(using)
+                     .filter(id__gt=last_id)
+                     .order_by('id')
+                     .values_list('id', 'movie_id', 'rating_id')[:BATCH_SIZE])
+        if not links:
+            break
+        last_id = links[-1][0]
+
+        with transaction.atomic(using=using):
+            ratings = Rating.objects.using(using).in_bulk(
+                {rating_id for _, _, rating_id in links}
+            )
+            linked = []
+            copies = []
+            for _, movie_id, rating_id in links:
+                rating = ratings[rating_id]
+                if rating.movie_id is None:
+                    rating.movie_id = movie_id
+                    linked.append(rating)
+                elif rating.movie_id != movie_id and not (
+                        Rating.objects.using(using)
+                        .filter(movie_id=movie_id, user_id=rating.user_id,
+                                rating=rating.rating,
+                                description=rating.description,
+                                created=rating.created)
+                        .exists()):
+                    copies.append(Rating(
+                        user_id=rating.user_id, movie_id=movie_id,
+                        rating=rating.rating, description=rating.description,
+                        created=rating.created, updated=rating.updated,
+                    ))
+            Rating.objects.using(using).bulk_update(linked, ['movie'])
+            if copies:
+                # bulk_create stamps auto_now(_add) fields, restore them
+                stamps = [(copy.created, copy.updated) for copy in copies]
+                copies = Rating.objects.using(using).bulk_create(copies)
+                for copy, (created, updated) in zip(copies, stamps):
+                    copy.created, copy.updated = created, updated
+                Rating.objects.using(using).bulk_update(
+                    copies, ['created', 'updated']
+                )
+
+
+def copy_movie_ratings(apps, schema_editor):
+    """Rebuild the many to many links from Rating.movie"""
+    Rating = apps.get_model('core', 'Rating')
+    Through = apps.get_model('core', 'Movie').ratings.through
+    using = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        ratings = list(Rating.objects.using(using)
+                       .filter(id__gt=last_id, movie__isnull=False)
+                       .order_by('id')
+                       .values_list('id', 'movie_id')[:BATCH_SIZE])
+        if not ratings:
+            break
+        last_id = ratings[-1][0]
+        with transaction.atomic(using=using):
+            Through.objects.using(using).bulk_create(
+                [Through(movie_id=movie_id, rating_id=rating_id)
+                 for rating_id, movie_id in ratings],
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_rating_movie'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_rating_movies, copy_movie_ratings),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_copy_rating_movies'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='movie',
+            name='ratings',
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='movie',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ratings', to='core.movie'),
+        ),
+    ]
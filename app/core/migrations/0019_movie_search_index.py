@@ -0,0 +1,153 @@
+"""
+Install the full-text search index of core.search.
+
+On PostgreSQL a trigger keeps `Movie.search_vector` up to date and a GIN
+index covers it, on SQLite an external-content FTS5 table is kept in sync
+by triggers. Each statement only runs on its database vendor. The
+statements are idempotent, so databases where an earlier version
+installed the index outside migrations are brought in line.
+
+SQLite drops a table's triggers when a migration rebuilds it, so later
+migrations that rebuild core_movie must reinstall the FTS5 triggers.
+"""
+from django.db import migrations
+
+SEARCH_CONFIG = 'english'
+
+
+class VendorRunSQL(migrations.RunSQL):
+    """RunSQL only applied to databases of one vendor"""
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, [self.vendor, *args], kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state,
+                                      to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state,
+                                       to_state)
+
+    def describe(self):
+        return f'Raw SQL operation on {self.vendor}'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_movie_similarity'),
+    ]
+
+    operations = [
+        VendorRunSQL(
+            'postgresql',
+            # A list, so the function body isn't split on its semicolons
+            sql=[f"""
+            CREATE OR REPLACE FUNCTION core_movie_search_vector_update()
+            RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('{SEARCH_CONFIG}',
+                                          coalesce(NEW.title, '')), 'A') ||
+                    setweight(to_tsvector('{SEARCH_CONFIG}',
+                                          coalesce(NEW.description, '')),
+                              'B');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """],
+            reverse_sql=(
+                'DROP FUNCTION IF EXISTS core_movie_search_vector_update()'
+            ),
+        ),
+        VendorRunSQL(
+            'postgresql',
+            sql="""
+            CREATE OR REPLACE TRIGGER core_movie_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF title, description, search_vector
+            ON core_movie
+            FOR EACH ROW EXECUTE FUNCTION core_movie_search_vector_update()
+            """,
+            reverse_sql=(
+                'DROP TRIGGER IF EXISTS core_movie_search_vector_trigger '
+                'ON core_movie'
+            ),
+        ),
+        VendorRunSQL(
+            'postgresql',
+            sql="""
+            CREATE INDEX IF NOT EXISTS core_movie_search_vector_idx
+            ON core_movie USING GIN (search_vector)
+            """,
+            reverse_sql='DROP INDEX IF EXISTS core_movie_search_vector_idx',
+        ),
+        # Fires the trigger for the rows saved before it existed
+        VendorRunSQL(
+            'postgresql',
+            sql='UPDATE core_movie SET title = title '
+                'WHERE search_vector IS NULL',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        VendorRunSQL(
+            'sqlite',
+            sql="""
+            CREATE VIRTUAL TABLE IF NOT EXISTS core_movie_fts USING fts5(
+                title, description,
+                content='core_movie', content_rowid='id',
+                tokenize='porter unicode61'
+            )
+            """,
+            reverse_sql='DROP TABLE IF EXISTS core_movie_fts',
+        ),
+        VendorRunSQL(
+            'sqlite',
+            sql=[
+                """
+                CREATE TRIGGER IF NOT EXISTS core_movie_fts_insert
+                AFTER INSERT ON core_movie BEGIN
+                    INSERT INTO core_movie_fts(rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_movie_fts_delete
+                AFTER DELETE ON core_movie BEGIN
+                    INSERT INTO core_movie_fts(core_movie_fts, rowid, title,
+                                               description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                END
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_movie_fts_update
+                AFTER UPDATE OF title, description ON core_movie BEGIN
+                    INSERT INTO core_movie_fts(core_movie_fts, rowid, title,
+                                               description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                    INSERT INTO core_movie_fts(rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+                """,
+            ],
+            reverse_sql=[
+                'DROP TRIGGER IF EXISTS core_movie_fts_insert',
+                'DROP TRIGGER IF EXISTS core_movie_fts_delete',
+                'DROP TRIGGER IF EXISTS core_movie_fts_update',
+            ],
+        ),
+        VendorRunSQL(
+            'sqlite',
+            sql="INSERT INTO core_movie_fts(core_movie_fts) "
+                "VALUES ('rebuild')",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,14 +1,70 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 from django.conf import settings
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+import math
 import os
 import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+RATING_HISTOGRAM_BUCKETS = 6
+# Fixed origin of the log-space trending scores, see Movie.trending_score
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def rating_bucket(value):
+    """Return the 0-5 histogram bucket a rating value falls into"""
+    return min(int(value), RATING_HISTOGRAM_BUCKETS - 1)
+
+
+def empty_rating_histogram():
+    """Default value for Movie.rating_histogram"""
+    return [0] * RATING_HISTOGRAM_BUCKETS
+
+
+def bayesian_score(count, total):
+    """Return the Bayesian-weighted mean of `count` ratings summing `total`.
+
+    The mean is pulled towards LEADERBOARD_PRIOR_MEAN as if every movie
+    had LEADERBOARD_PRIOR_WEIGHT extra ratings of that value, so a couple
+    of perfect ratings can't top the leaderboard.
+    """
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    return (weight * settings.LEADERBOARD_PRIOR_MEAN + total) / (weight + count)
+
+
+def default_top_score():
+    """Default value for Movie.top_score, the score of an unrated movie"""
+    return bayesian_score(0, 0.0)
+
+
+def trending_points(when, count=1):
+    """Return the log-space trending weight of `count` ratings at `when`.
+
+    A rating's weight halves every TRENDING_HALF_LIFE_HOURS. Instead of
+    decaying every score as time passes, newer ratings get exponentially
+    larger weights, which preserves the ordering; weights are stored as
+    logarithms so they don't overflow.
+    """
+    decay = math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+    return decay * (when - TRENDING_EPOCH).total_seconds() + math.log(count)
+
+
+def log_add(a, b):
+    """Return log(exp(a) + exp(b)) without overflowing"""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
 def movie_image_file_path(instance, filename):
     """Generate file path for the movie image"""
     ext = os.path.split(filename)[1]
@@ -56,8 +112,136 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['first_name','email']
+
+
+class MovieManager(models.Manager):
+    """Manages movies and their denormalized rating aggregates"""
+
+    def get_queryset(self):
+        """Don't load the search vector, only the database reads it"""
+        return super().get_queryset().defer('search_vector')
+
+    def apply_rating_change(self, movie_ids, added=(), removed=(),
+                            created=0):
+        """Fold the same added/removed rating values into several movies,
+        `created` of the added values being new ratings"""
+        self.apply_rating_changes(
+            {movie_id: (added, removed) for movie_id in movie_ids},
+            created={movie_id: created for movie_id in movie_ids}
+        )
+
+    def apply_rating_changes(self, changes, created=None):
+        """Fold rating changes into the movies' aggregates.
+
+        `changes` maps a movie id to an (added, removed) pair of rating
+        value lists, and `created` a movie id to the number of new ratings,
+        the only ones that count as trending activity: an edited rating is
+        removed and added again. The movie rows are locked for the duration
+        of the caller's transaction so concurrent rating writes can't lose
+        updates, and all movies are written back in one statement.
+        """
+        created = created or {}
+        changes = {
+            movie_id: (added, removed)
+            for movie_id, (added, removed) in changes.items()
+            if added or removed
+        }
+        if not changes:
+            return
+        with transaction.atomic(using=self.db):
+            movies = list(self.select_for_update()
+                          .filter(pk__in=changes)
+                          .order_by('pk'))
+            now = timezone.now()
+            for movie in movies:
+                added, removed = changes[movie.pk]
+                movie.fold_ratings(added=added, removed=removed)
+                if created.get(movie.pk):
+                    movie.record_rating_activity(created[movie.pk], now)
+                movie.updated = now
+            self.bulk_update(movies, Movie.RATING_AGGREGATE_FIELDS +
+                             ['trending_score', 'updated'])
+
+    def rebuild_rating_aggregates(self, batch_size=1000):
+        """Recompute every movie's rating aggregates from the Rating rows"""
+        aggregates = {}
+        rows = (Rating.objects.using(self.db).filter(movie__isnull=False)
+                .values_list('movie_id', 'rating'))
+        for movie_id, value in rows.iterator(chunk_size=batch_size):
+            aggregates.setdefault(movie_id, []).append(value)
+
+        fields = Movie.RATING_AGGREGATE_FIELDS + ['updated']
+        now = timezone.now()
+        updated = 0
+        with transaction.atomic(using=self.db):
+            batch = []
+            for movie in self.only('pk').iterator(chunk_size=batch_size):
+                movie.reset_rating_aggregates()
+                movie.fold_ratings(added=aggregates.get(movie.pk, ()))
+                movie.updated = now
+                batch.append(movie)
+                if len(batch) >= batch_size:
+                    self.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                self.bulk_update(batch, fields)
+                updated += len(batch)
+        return updated
+
+    def rebuild_trending_scores(self, batch_size=1000):
+        """Recompute every movie's trending score from rating timestamps"""
+        scores = {}
+        rows = (Rating.objects.using(self.db).filter(movie__isnull=False)
+                .values_list('movie_id', 'created'))
+        for movie_id, created in rows.iterator(chunk_size=batch_size):
+            scores[movie_id] = log_add(scores.get(movie_id),
+                                       trending_points(created))
+
+        with transaction.atomic(using=self.db):
+            batch = []
+            for movie in self.only('pk').iterator(chunk_size=batch_size):
+                movie.trending_score = scores.get(movie.pk)
+                batch.append(movie)
+                if len(batch) >= batch_size:
+                    self.bulk_update(batch, ['trending_score'])
+                    batch = []
+            if batch:
+                self.bulk_update(batch, ['trending_score'])
+
+    def top_rated(self, limit):
+        """Return the `limit` movies with the best Bayesian score"""
+        return self.order_by('-top_score', 'id')[:limit]
+
+    def similar_to(self, movie, limit):
+        """Return the `limit` nearest neighbours of a movie, best first.
+
+        Neighbours are precomputed by core.similarity, and each movie has
+        its score as `similarity`.
+        """
+        return (self.filter(neighbour_of__movie=movie)
+                .annotate(similarity=models.F('neighbour_of__score'))
+                .order_by('neighbour_of__rank')[:limit])
+
+    def trending(self, limit, now=None):
+        """Return the `limit` movies with the most recent rating activity.
+
+        Only movies whose decayed activity is at least that of one rating
+        made TRENDING_WINDOW_HOURS ago are included.
+        """
+        now = now or timezone.now()
+        window_start = now - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+        return (self.filter(trending_score__gte=trending_points(window_start))
+                .order_by('-trending_score', 'id')[:limit])
+
+
 class Movie(models.Model):
     """Movie model"""
+    RATING_AGGREGATE_FIELDS = [
+        'rating_count', 'rating_sum', 'rating_mean', 'rating_histogram',
+        'top_score',
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -66,18 +250,147 @@ class Movie(models.Model):
     description = models.CharField(max_length=255)
     is_active = models.BooleanField(default=False)
     released_date = models.DateField()
-    ratings = models.ManyToManyField('Rating')
     image = models.ImageField(null=True, upload_to=movie_image_file_path)
+    # Storage names of resized copies of image, see movie.images
+    image_variants = models.JSONField(default=dict, blank=True)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.FloatField(default=0.0)
+    rating_mean = models.FloatField(default=0.0)
+    rating_histogram = models.JSONField(default=empty_rating_histogram)
+    # Leaderboard scores, see bayesian_score and trending_points
+    top_score = models.FloatField(default=default_top_score)
+    trending_score = models.FloatField(null=True, blank=True)
+    # Maintained by a database trigger, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Bumped on every change, including rating aggregate updates
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = MovieManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination orderings, see movie.pagination
+            models.Index(fields=['released_date', 'id'],
+                         name='movie_released_date_id_idx'),
+            models.Index(fields=['rating_mean', 'id'],
+                         name='movie_rating_mean_id_idx'),
+            # Filtered listings, see movie.filters
+            models.Index(fields=['user', 'id'],
+                         name='movie_user_id_idx'),
+            models.Index(fields=['id'],
+                         condition=models.Q(is_active=True),
+                         name='movie_active_id_idx'),
+            models.Index(fields=['id'],
+                         condition=models.Q(is_active=False),
+                         name='movie_inactive_id_idx'),
+            models.Index(fields=['released_date', 'id'],
+                         condition=models.Q(is_active=True),
+                         name='movie_active_released_idx'),
+            models.Index(fields=['rating_mean', 'id'],
+                         condition=models.Q(is_active=True),
+                         name='movie_active_rating_idx'),
+            # Leaderboards read the first k entries of these
+            models.Index(fields=['-top_score', 'id'],
+                         name='movie_top_score_idx'),
+            models.Index(fields=['-trending_score', 'id'],
+                         name='movie_trending_score_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def reset_rating_aggregates(self):
+        """Clear the rating aggregates in memory"""
+        self.rating_count = 0
+        self.rating_sum = 0.0
+        self.rating_mean = 0.0
+        self.rating_histogram = empty_rating_histogram()
+        self.top_score = default_top_score()
+
+    def fold_ratings(self, added=(), removed=()):
+        """Apply added/removed rating values to the aggregates in memory"""
+        histogram = list(self.rating_histogram or empty_rating_histogram())
+        for value in added:
+            self.rating_count += 1
+            self.rating_sum += value
+            histogram[rating_bucket(value)] += 1
+        for value in removed:
+            self.rating_count -= 1
+            self.rating_sum -= value
+            histogram[rating_bucket(value)] -= 1
+
+        if self.rating_count > 0:
+            self.rating_mean = self.rating_sum / self.rating_count
+        else:
+            self.rating_sum = 0.0
+            self.rating_mean = 0.0
+        self.rating_histogram = histogram
+        self.top_score = bayesian_score(self.rating_count, self.rating_sum)
+
+    def record_rating_activity(self, count, when):
+        """Add `count` ratings made at `when` to the trending score"""
+        self.trending_score = log_add(self.trending_score,
+                                      trending_points(when, count))
+
 class Rating(models.Model):
     """Rating model"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE)
+    # Ratings outlive their movie, like they did as a many to many
+    movie = models.ForeignKey(
+        Movie,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='ratings',
+        db_index=False)
     rating = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(5.0)])
     description = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # A movie's ratings, also covers lookups by movie alone
+            models.Index(fields=['movie', 'created'],
+                         name='rating_movie_created_idx'),
+            # Rating list filters with the keyset ordering, see
+            # movie.filters.RatingFilterBackend
+            models.Index(fields=['user', 'id'], name='rating_user_id_idx'),
+            models.Index(fields=['movie', 'id'], name='rating_movie_id_idx'),
+        ]
 
     def __str__(self):
         return self.description
+
+
+class MovieSimilarity(models.Model):
+    """One of a movie's nearest neighbours, see core.similarity"""
+    movie = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        db_index=False)
+    neighbour = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        related_name='neighbour_of')
+    # 0 for the most similar movie
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also serves reading a movie's neighbours in order
+            models.UniqueConstraint(fields=['movie', 'rank'],
+                                    name='movie_similarity_rank_unique'),
+        ]
+
+
+class SimilarityRun(models.Model):
+    """A build of the similar movies, incremental builds start from the
+    last one"""
+    started = models.DateTimeField()
+    full = models.BooleanField()
+    movies = models.PositiveIntegerField()
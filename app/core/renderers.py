@@ -0,0 +1,35 @@
+"""
+Fast JSON renderer for the APIs
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonRenderer(JSONRenderer):
+    """Render compact JSON with orjson.
+
+    The output is byte for byte what JSONRenderer produces for serializer
+    data; dates, datetimes and UUIDs are encoded natively by orjson and
+    anything else orjson doesn't know falls back to DRF's encoder. Indented
+    output (e.g. for the browsable API) is left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=ORJSON_OPTIONS)
+        # JSONRenderer escapes these so the output is a strict JavaScript
+        # subset, orjson doesn't
+        if b'\xe2\x80' in ret:
+            ret = (ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+                   .replace(b'\xe2\x80\xa9', b'\\u2029'))
+        return ret
@@ -0,0 +1,150 @@
+"""
+Read replica routing.
+
+While a safe-method (GET, HEAD, OPTIONS) request is served, reads go to
+one of the DATABASE_REPLICAS aliases, picked round robin once per
+request. Writes, reads made while serving other requests and reads
+outside requests (management commands, shells) use the primary.
+
+Replicas lag behind the primary, so a user who sends a write request is
+pinned to the primary for REPLICA_PIN_SECONDS afterwards and reads their
+own writes. Pins are kept in Django's default cache, which must be shared
+by the worker processes: configuring replicas with a local memory cache
+is refused when the app loads. Users, tokens and
+sessions are always read from the primary so that a new account, token
+or password works on the next request.
+"""
+import contextvars
+import itertools
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Models read from the primary whatever the request
+PRIMARY_MODELS = {settings.AUTH_USER_MODEL.lower(), 'authtoken.token',
+                  'sessions.session'}
+
+_current_routing = contextvars.ContextVar('database_routing', default=None)
+_replica_sequence = itertools.count()
+
+
+def pin_key(user_id):
+    return 'core.routers.pin:{}'.format(user_id)
+
+
+def pin_to_primary(user_id):
+    """Read from the primary for the user's next requests"""
+    if settings.REPLICA_PIN_SECONDS > 0:
+        cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+def check_pin_cache():
+    """Refuse replicas when another worker couldn't see a user's pin"""
+    if settings.DATABASE_REPLICAS and isinstance(caches['default'],
+                                                 LocMemCache):
+        raise ImproperlyConfigured(
+            'DATABASE_REPLICAS needs a cache shared by the workers to pin '
+            'users to the primary, set REDIS_URL.'
+        )
+
+
+def next_replica():
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return PRIMARY
+    return replicas[next(_replica_sequence) % len(replicas)]
+
+
+class RequestRouting:
+    """The database one request reads from"""
+
+    def __init__(self, request):
+        self.request = request
+        self._alias = None
+
+    def read_alias(self):
+        """Pick the alias on the first read, once the user is known"""
+        if self._alias is None:
+            self._alias = self.choose()
+        return self._alias
+
+    def choose(self):
+        if self.request.method not in SAFE_METHODS:
+            return PRIMARY
+        # Set by AuthenticationMiddleware, or by DRF once authenticated
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated and is_pinned(user.pk):
+            return PRIMARY
+        return next_replica()
+
+
+class ReplicaRouter:
+    """Database router sending request reads to the replicas"""
+
+    def db_for_read(self, model, **hints):
+        routing = _current_routing.get()
+        if routing is None or model._meta.label_lower in PRIMARY_MODELS:
+            return PRIMARY
+        return routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+def pin_writer(request):
+    """Pin the user of a write request, once it's been served"""
+    if request.method not in SAFE_METHODS:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+
+
+class ReplicaRoutingMiddleware:
+    """Route the request's reads and pin users who write"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _current_routing.set(RequestRouting(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+
+        pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        # The routing is copied into the threads running the ORM queries
+        token = _current_routing.set(RequestRouting(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            # The user may still be a lazy session lookup
+            await sync_to_async(pin_writer)(request)
+        return response
@@ -0,0 +1,88 @@
+"""
+Pregenerated OpenAPI schema.
+
+Introspecting every viewset and serializer takes long enough that the
+schema isn't built per request. `manage.py build_schema` writes it to
+OPENAPI_SCHEMA_PATH, which is committed with the code; if the file is
+missing it is generated on first use instead. Either way it is rendered
+once per format and then served from memory with an ETag.
+"""
+import hashlib
+import threading
+
+import yaml
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from drf_spectacular.renderers import OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+
+def generate_schema():
+    """Introspect the API and return the OpenAPI document as YAML bytes"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return OpenApiYamlRenderer().render(schema, renderer_context={})
+
+
+class SchemaCache:
+    """The OpenAPI document, loaded once and rendered once per format"""
+
+    def __init__(self, path):
+        self.path = path
+        self._schema = None
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def get_schema(self):
+        """Return the schema from disk, generating it if there is none"""
+        with self._lock:
+            if self._schema is None:
+                try:
+                    with open(self.path, 'rb') as schema_file:
+                        content = schema_file.read()
+                except FileNotFoundError:
+                    content = generate_schema()
+                self._schema = yaml.safe_load(content)
+            return self._schema
+
+    def render(self, renderer):
+        """Return the (content, etag) of the schema in a renderer's format"""
+        key = type(renderer)
+        if key not in self._rendered:
+            content = renderer.render(self.get_schema(), renderer_context={})
+            etag = quote_etag(hashlib.sha256(content).hexdigest()[:32])
+            self._rendered[key] = (content, etag)
+        return self._rendered[key]
+
+    def clear(self):
+        """Forget the loaded schema, e.g. after it was rebuilt"""
+        with self._lock:
+            self._schema = None
+            self._rendered = {}
+
+
+schema_cache = SchemaCache(settings.OPENAPI_SCHEMA_PATH)
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """Serve the pregenerated OpenAPI schema with ETag support"""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        content, etag = schema_cache.render(renderer)
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = HttpResponse(content, content_type=content_type)
+            title = spectacular_settings.TITLE or 'schema'
+            response['Content-Disposition'] = \
+                f'inline; filename="{title}.{renderer.format}"'
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,74 @@
+"""
+Full-text search over movie titles and descriptions.
+
+On PostgreSQL the index is the stored `Movie.search_vector` column, kept up
+to date by a trigger and indexed with GIN. On SQLite (local development and
+tests) it is an external-content FTS5 table kept in sync by triggers. Both
+are installed by migration 0019_movie_search_index.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+
+SEARCH_CONFIG = 'english'
+
+SQLITE_SEARCH = """
+    SELECT rowid, -bm25(core_movie_fts, 10.0, 1.0) AS rank
+    FROM core_movie_fts
+    WHERE core_movie_fts MATCH %s
+    ORDER BY rank DESC, rowid
+    LIMIT %s OFFSET %s
+"""
+
+
+def fts5_query(query):
+    """Turn free text into an FTS5 query ANDing quoted terms"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join('"%s"' % term for term in terms)
+
+
+class MovieSearch:
+    """Lazily ranked movie search results that can be sliced into pages"""
+
+    def __init__(self, query, queryset):
+        self.query = query
+        self.queryset = queryset
+
+    def __getitem__(self, window):
+        if not isinstance(window, slice):
+            raise TypeError('MovieSearch only supports slicing')
+        offset = window.start or 0
+        limit = window.stop - offset
+        ranked = self.ranked_ids(limit, offset)
+        movies = self.queryset.in_bulk([movie_id for movie_id, _ in ranked])
+        results = []
+        for movie_id, rank in ranked:
+            movie = movies.get(movie_id)
+            if movie is not None:
+                movie.search_rank = rank
+                results.append(movie)
+        return results
+
+    def ranked_ids(self, limit, offset):
+        """Return (movie id, rank) pairs, best match first"""
+        connection = connections[self.queryset.db]
+        if connection.vendor == 'postgresql':
+            query = SearchQuery(self.query, config=SEARCH_CONFIG,
+                                search_type='websearch')
+            ranked = (
+                self.queryset.model._default_manager
+                .filter(search_vector=query)
+                .annotate(rank=SearchRank(F('search_vector'), query))
+                .order_by('-rank', 'id')
+                .values_list('id', 'rank')
+            )
+            return list(ranked[offset:offset + limit])
+
+        match = fts5_query(self.query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(SQLITE_SEARCH, [match, limit, offset])
+            return cursor.fetchall()
@@ -0,0 +1,157 @@
+"""
+Item-to-item "similar movies" from the rating matrix.
+
+Each movie is a column of the sparse user x movie rating matrix, and two
+movies are similar when the same users rated them alike: the score is the
+cosine similarity of their columns, shrunk towards 0 by
+n / (n + SIMILAR_MOVIES_SHRINKAGE) where n is the number of users who
+rated both, so two movies sharing a single rater don't look identical.
+
+`build` computes each movie's SIMILAR_MOVIES_TOP_K best neighbours a block
+of movies at a time, with one sparse matrix product per block, and stores
+them as MovieSimilarity rows. An incremental build only recomputes the
+movies whose neighbours may have changed since the last build: movies
+whose ratings changed, movies sharing a rater with them and movies that
+list them as neighbours.
+"""
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from core.models import Movie, MovieSimilarity, Rating, SimilarityRun
+
+
+class RatingMatrix:
+    """Sparse user x movie matrices of the ratings"""
+
+    def __init__(self, user_ids, movie_ids, values):
+        self.movie_ids, columns = np.unique(movie_ids, return_inverse=True)
+        _, rows = np.unique(user_ids, return_inverse=True)
+        shape = (int(rows.max()) + 1 if len(rows) else 0,
+                 len(self.movie_ids))
+
+        # A user who rated a movie several times counts with their mean
+        totals = sparse.csc_matrix((values, (rows, columns)), shape=shape)
+        self.raters = sparse.csc_matrix(
+            (np.ones(len(values)), (rows, columns)), shape=shape
+        )
+        ratings = totals.copy()
+        ratings.data = totals.data / self.raters.data
+        self.raters.data[:] = 1
+
+        norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0)))
+        norms = norms.ravel()
+        inverse = np.divide(1, norms, out=np.zeros_like(norms),
+                            where=norms > 0)
+        self.normalized = (ratings @ sparse.diags(inverse)).tocsc()
+
+    @classmethod
+    def from_database(cls, chunk_size=10000):
+        user_ids, movie_ids, values = array('q'), array('q'), array('d')
+        rows = (Rating.objects.filter(movie__isnull=False)
+                .values_list('user_id', 'movie_id', 'rating'))
+        for user_id, movie_id, value in rows.iterator(chunk_size=chunk_size):
+            user_ids.append(user_id)
+            movie_ids.append(movie_id)
+            values.append(value)
+        return cls(np.frombuffer(user_ids, dtype=np.int64),
+                   np.frombuffer(movie_ids, dtype=np.int64),
+                   np.frombuffer(values, dtype=np.float64))
+
+    def columns(self, ids):
+        """Return the columns of the movie ids that have ratings"""
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.movie_ids, ids)
+        positions = np.minimum(positions, max(len(self.movie_ids) - 1, 0))
+        found = (self.movie_ids[positions] == ids if len(self.movie_ids)
+                 else np.zeros(len(ids), dtype=bool))
+        return positions[found]
+
+    def co_rated(self, columns):
+        """Return the columns sharing at least one rater with `columns`"""
+        users = np.unique(self.raters[:, columns].indices)
+        return np.unique(self.raters.tocsr()[users].indices)
+
+    def neighbours(self, columns, top_k, shrinkage):
+        """Yield (movie id, neighbour ids, scores) of a block of columns"""
+        scores = (self.normalized[:, columns].T @ self.normalized).tocsr()
+        common = (self.raters[:, columns].T @ self.raters).tocsr()
+        common.data = common.data / (common.data + shrinkage)
+        scores = scores.multiply(common).tocsr()
+
+        # A movie isn't its own neighbour
+        rows = np.repeat(np.arange(len(columns)), np.diff(scores.indptr))
+        scores.data[scores.indices == columns[rows]] = 0
+        scores.eliminate_zeros()
+
+        for row, column in enumerate(columns):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data = scores.data[start:end]
+            ids = self.movie_ids[scores.indices[start:end]]
+            if len(data) > top_k:
+                best = np.argpartition(-data, top_k - 1)[:top_k]
+                data, ids = data[best], ids[best]
+            # Best first, ties by id so builds are reproducible
+            order = np.lexsort((ids, -data))
+            yield int(self.movie_ids[column]), ids[order], data[order]
+
+
+def save_neighbours(movie_ids, neighbours, batch_size):
+    """Replace the stored neighbours of a block of movies"""
+    rows = [
+        MovieSimilarity(movie_id=movie_id, neighbour_id=int(neighbour_id),
+                        rank=rank, score=float(score))
+        for movie_id, neighbour_ids, scores in neighbours
+        for rank, (neighbour_id, score) in enumerate(zip(neighbour_ids,
+                                                         scores))
+    ]
+    with transaction.atomic():
+        MovieSimilarity.objects.filter(movie_id__in=movie_ids).delete()
+        MovieSimilarity.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def affected_movies(matrix, since, batch_size):
+    """Return the ids of the movies whose neighbours may have changed"""
+    changed = list(Movie.objects.filter(updated__gt=since)
+                   .values_list('id', flat=True))
+    affected = set(changed)
+    columns = matrix.columns(changed)
+    if len(columns):
+        affected.update(matrix.movie_ids[matrix.co_rated(columns)].tolist())
+    for start in range(0, len(changed), batch_size):
+        affected.update(MovieSimilarity.objects.filter(
+            neighbour_id__in=changed[start:start + batch_size]
+        ).values_list('movie_id', flat=True))
+    return sorted(affected)
+
+
+def build(full=False, top_k=None, block_size=1000, batch_size=5000):
+    """Recompute and store the neighbours of every movie, or only of those
+    affected by rating changes since the last build. Yields progress as
+    (movies done, movies to do)."""
+    top_k = top_k or settings.SIMILAR_MOVIES_TOP_K
+    started = timezone.now()
+    last_run = SimilarityRun.objects.order_by('-started').first()
+    full = full or last_run is None
+
+    matrix = RatingMatrix.from_database(chunk_size=batch_size)
+    if full:
+        movie_ids = list(Movie.objects.order_by('id')
+                         .values_list('id', flat=True))
+    else:
+        movie_ids = affected_movies(matrix, last_run.started, batch_size)
+
+    yield 0, len(movie_ids)
+    for start in range(0, len(movie_ids), block_size):
+        block = movie_ids[start:start + block_size]
+        neighbours = matrix.neighbours(matrix.columns(block), top_k,
+                                       settings.SIMILAR_MOVIES_SHRINKAGE)
+        save_neighbours(block, neighbours, batch_size)
+        yield start + len(block), len(movie_ids)
+
+    SimilarityRun.objects.create(started=started, full=full,
+                                 movies=len(movie_ids))
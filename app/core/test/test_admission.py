@@ -0,0 +1,369 @@
+"""
+Test admission control and the metrics endpoint
+"""
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from unittest.mock import patch
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from core import metrics
+from core.admission import (AdmissionController,
+                            AsyncAdmissionController,
+                            CHEAP,
+                            NORMAL,
+                            EXPENSIVE)
+
+METRICS_URL = reverse('metrics')
+MOVIES_URL = reverse('movie:movie-list')
+ASYNC_MOVIES_URL = reverse('movie:async-movie-list')
+TOKEN_URL = reverse('user:token')
+
+
+def make_controller(max_concurrency=1, queue_limit=4, queue_timeout=5.0,
+                    controller_class=AdmissionController):
+    return controller_class(
+        max_concurrency=max_concurrency,
+        queue_limits={CHEAP: queue_limit, NORMAL: queue_limit,
+                      EXPENSIVE: queue_limit},
+        queue_timeout=queue_timeout,
+    )
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    """Test the concurrency limit and priority queue"""
+    def start_waiter(self, controller, request_class, admitted):
+        def wait():
+            if controller.acquire(request_class):
+                admitted.append(request_class)
+                controller.release()
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        return thread
+
+    def wait_for_queue(self, controller, length):
+        deadline = time.monotonic() + 5
+        while controller.stats()['waiting'] < length:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_admits_up_to_limit(self):
+        """Test requests are admitted while slots are free"""
+        controller = make_controller(max_concurrency=2, queue_limit=0)
+
+        self.assertTrue(controller.acquire(NORMAL))
+        self.assertTrue(controller.acquire(NORMAL))
+        self.assertFalse(controller.acquire(NORMAL))
+        controller.release()
+        self.assertTrue(controller.acquire(NORMAL))
+
+        stats = controller.stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['counters']['admitted', NORMAL], 3)
+        self.assertEqual(stats['counters']['shed', NORMAL], 1)
+
+    def test_cheap_requests_admitted_first(self):
+        """Test queued requests are admitted by class, then arrival"""
+        controller = make_controller()
+        controller.acquire(NORMAL)
+        admitted = []
+        threads = []
+        for request_class in (EXPENSIVE, NORMAL, CHEAP):
+            threads.append(self.start_waiter(controller, request_class,
+                                             admitted))
+            self.wait_for_queue(controller, len(threads))
+
+        controller.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(admitted, [CHEAP, NORMAL, EXPENSIVE])
+        self.assertEqual(controller.stats()['counters']['queued', CHEAP], 1)
+
+    def test_expensive_shed_before_cheap(self):
+        """Test a class is shed once the queue reaches its limit"""
+        controller = AdmissionController(
+            max_concurrency=1,
+            queue_limits={CHEAP: 2, NORMAL: 2, EXPENSIVE: 1},
+            queue_timeout=5.0,
+        )
+        controller.acquire(NORMAL)
+        admitted = []
+        threads = [self.start_waiter(controller, NORMAL, admitted)]
+        self.wait_for_queue(controller, 1)
+
+        self.assertFalse(controller.acquire(EXPENSIVE))
+        threads.append(self.start_waiter(controller, CHEAP, admitted))
+        self.wait_for_queue(controller, 2)
+        self.assertFalse(controller.acquire(CHEAP))
+
+        controller.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, [CHEAP, NORMAL])
+
+    def test_queue_timeout_sheds(self):
+        """Test a request waiting too long is shed"""
+        controller = make_controller(queue_timeout=0.01)
+        controller.acquire(NORMAL)
+
+        self.assertFalse(controller.acquire(CHEAP))
+        stats = controller.stats()
+        self.assertEqual(stats['waiting'], 0)
+        self.assertEqual(stats['counters']['queued', CHEAP], 1)
+        self.assertEqual(stats['counters']['shed', CHEAP], 1)
+
+
+class AsyncAdmissionControllerTests(SimpleTestCase):
+    """Test the event loop flavour of the limit and queue"""
+    def make_controller(self, **params):
+        return make_controller(controller_class=AsyncAdmissionController,
+                               **params)
+
+    async def start_waiter(self, controller, request_class, admitted):
+        async def wait():
+            if await controller.acquire(request_class):
+                admitted.append(request_class)
+                controller.release()
+
+        task = asyncio.create_task(wait())
+        await asyncio.sleep(0)
+        return task
+
+    async def test_admits_up_to_limit(self):
+        """Test requests are admitted while slots are free"""
+        controller = self.make_controller(max_concurrency=2, queue_limit=0)
+
+        self.assertTrue(await controller.acquire(NORMAL))
+        self.assertTrue(await controller.acquire(NORMAL))
+        self.assertFalse(await controller.acquire(NORMAL))
+        controller.release()
+        self.assertTrue(await controller.acquire(NORMAL))
+        self.assertEqual(controller.stats()['active'], 2)
+
+    async def test_cheap_requests_admitted_first(self):
+        """Test queued requests are admitted by class, then arrival"""
+        controller = self.make_controller()
+        await controller.acquire(NORMAL)
+        admitted = []
+        tasks = [await self.start_waiter(controller, request_class, admitted)
+                 for request_class in (EXPENSIVE, NORMAL, CHEAP)]
+        self.assertEqual(controller.stats()['waiting'], 3)
+
+        controller.release()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(admitted, [CHEAP, NORMAL, EXPENSIVE])
+        self.assertEqual(controller.stats()['active'], 0)
+
+    async def test_queue_timeout_sheds(self):
+        """Test a request waiting too long is shed"""
+        controller = self.make_controller(queue_timeout=0.01)
+        await controller.acquire(NORMAL)
+
+        self.assertFalse(await controller.acquire(CHEAP))
+        stats = controller.stats()
+        self.assertEqual(stats['waiting'], 0)
+        self.assertEqual(stats['counters']['shed', CHEAP], 1)
+
+    async def test_cancelled_request_leaves_queue(self):
+        """Test a request cancelled while queued gives up its place"""
+        controller = self.make_controller()
+        await controller.acquire(NORMAL)
+        admitted = []
+        task = await self.start_waiter(controller, CHEAP, admitted)
+
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        controller.release()
+
+        self.assertEqual(admitted, [])
+        self.assertEqual((controller.stats()['active'],
+                          controller.stats()['waiting']), (0, 0))
+
+
+class AdmissionMiddlewareTests(TestCase):
+    """Test requests are shed with 503 and counted"""
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        ))
+
+    def test_requests_admitted(self):
+        """Test requests pass through and release their slot"""
+        controller = make_controller()
+        with patch('core.admission.controller', controller):
+            res = self.client.get(MOVIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = controller.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['counters']['admitted', EXPENSIVE], 1)
+
+    def test_overload_is_shed(self):
+        """Test requests beyond the limits get 503 with Retry-After"""
+        controller = make_controller(queue_limit=0)
+        controller.acquire(NORMAL)
+        with patch('core.admission.controller', controller):
+            res = self.client.post(TOKEN_URL, {'username': 'username',
+                                               'password': 'test123'})
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(controller.stats()['counters']['shed', EXPENSIVE], 1)
+
+    async def test_async_requests_admitted_on_the_event_loop(self):
+        """Test ASGI requests use the async controller and its limits"""
+        user = await get_user_model().objects.aget(username='username')
+        token = await Token.objects.acreate(user=user)
+        controller = make_controller()
+        async_controller = make_controller(
+            controller_class=AsyncAdmissionController
+        )
+        with patch('core.admission.controller', controller), \
+                patch('core.admission.async_controller', async_controller):
+            res = await self.async_client.get(
+                ASYNC_MOVIES_URL, headers={'Authorization': f'Token {token}'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = async_controller.stats()
+        self.assertEqual(stats['counters']['admitted', EXPENSIVE], 1)
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(controller.stats()['counters']['admitted', EXPENSIVE],
+                         0)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_runs_on_the_event_loop(self):
+        """Test no middleware is adapted to sync under ASGI, which would run
+        every async request in a thread"""
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_exempt_and_exposed(self):
+        """Test /metrics answers under overload and reports the counters"""
+        controller = make_controller(queue_limit=0)
+        controller.acquire(CHEAP)
+        with patch('core.admission.controller', controller):
+            self.client.get(MOVIES_URL)
+            res = self.client.get(METRICS_URL,
+                                  HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        self.assertIn('# TYPE admission_requests_total counter', body)
+        self.assertRegex(
+            body,
+            r'admission_requests_total\{outcome="shed",class="expensive",'
+            r'pid="\d+"\} 1\n'
+        )
+        self.assertRegex(body, r'admission_active_requests\{pid="\d+"\} 1\n')
+
+
+@override_settings(METRICS_TOKEN='secret', METRICS_DIR='',
+                   METRICS_EXPORT_SECONDS=5)
+class MetricsViewTests(TestCase):
+    """Test who can read /metrics and what it reports"""
+    def get_metrics(self, token='secret'):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.get(METRICS_URL, **headers)
+
+    def test_token_or_staff_required(self):
+        """Test anonymous users, wrong tokens and non staff are refused"""
+        user = get_user_model().objects.create_user(
+            username='username', email='user@example.com', password='test123'
+        )
+        staff = get_user_model().objects.create_user(
+            username='staff', email='staff@example.com', password='test123',
+            is_staff=True
+        )
+
+        self.assertEqual(self.get_metrics(None).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.get_metrics('wrong').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.client.force_login(user)
+        self.assertEqual(self.get_metrics(None).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.client.force_login(staff)
+        self.assertEqual(self.get_metrics(None).status_code,
+                         status.HTTP_200_OK)
+        self.client.logout()
+        self.assertEqual(self.get_metrics().status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured(self):
+        """Test an empty token setting doesn't let anyone in"""
+        self.assertEqual(self.get_metrics('').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_workers_merged(self):
+        """Test the metrics exported by the other workers are served too"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(METRICS_DIR=directory.name):
+            # Another worker's export, and one from a worker that's gone
+            other = metrics.render().replace(
+                f'pid="{os.getpid()}"', 'pid="999999"'
+            )
+            with open(metrics.export_path(directory.name, 999999), 'w') \
+                    as export_file:
+                export_file.write(other)
+            gone = metrics.export_path(directory.name, 999998)
+            with open(gone, 'w') as export_file:
+                export_file.write(other.replace('999999', '999998'))
+            os.utime(gone, (0, 0))
+
+            body = self.get_metrics().content.decode()
+
+        self.assertEqual(
+            body.count('# TYPE admission_requests_total counter'), 1
+        )
+        self.assertRegex(body, r'admission_waiting_requests\{pid="%d"\} '
+                         % os.getpid())
+        self.assertIn('admission_waiting_requests{pid="999999"} ', body)
+        self.assertNotIn('999998', body)
+        self.assertFalse(os.path.exists(gone))
+
+    def test_export(self):
+        """Test a worker's export is its rendered metrics"""
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.export(directory)
+
+            self.assertEqual(os.listdir(directory), [f'{os.getpid()}.prom'])
+            with open(metrics.export_path(directory)) as export_file:
+                self.assertIn('# TYPE admission_requests_total counter',
+                              export_file.read())
+
+    def test_unwritable_directory(self):
+        """Test workers serve their own metrics when they can't export"""
+        with tempfile.NamedTemporaryFile() as not_a_directory:
+            directory = os.path.join(not_a_directory.name, 'metrics')
+            with self.settings(METRICS_DIR=directory), \
+                    patch.object(metrics, '_exporter_pid', None), \
+                    patch('core.metrics.threading.Thread') as thread:
+                with self.assertLogs('core.metrics', 'WARNING'):
+                    metrics.start_exporter()
+
+                res = self.get_metrics()
+
+        thread.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(f'pid="{os.getpid()}"', res.content.decode())
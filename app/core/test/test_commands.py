@@ -2,29 +2,384 @@
 Test custom commands
 """
 from unittest.mock import patch #For mocking
+from io import StringIO
+import json
+import os
+import tempfile
 
 from psycopg2 import OperationalError as psycopgError
 
-from django.test import SimpleTestCase
-from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.management import call_command, CommandError
 from django.db.utils import OperationalError
+from django.contrib.auth import get_user_model
+from django.db.models import NOT_PROVIDED
+from django.utils import timezone
 
-@patch('core.management.commands.wait_for_db.Command.check')
+from datetime import date
+
+from core import importer
+from core.models import Movie, Rating
+
+@patch('core.management.commands.wait_for_db.ping')
 class CommandTests(SimpleTestCase):
     """Test commands"""
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_ping):
         """Testing waiting for databse until it's ready """
-        patched_check.return_value = True
+        patched_ping.return_value = None
         call_command('wait_for_db')
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_ping.assert_called_once_with('default')
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_ping):
         """Test waiting for databse when getting an error"""
-        patched_check.side_effect = [psycopgError] * 2 +\
-            [OperationalError] * 3 + [True]
+        patched_ping.side_effect = [psycopgError] * 2 +\
+            [OperationalError] * 3 + [None]
 
-        call_command('wait_for_db')
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        call_command('wait_for_db', '--max-interval', '1', stdout=StringIO())
+        self.assertEqual(patched_ping.call_count, 6)
+        patched_ping.assert_called_with('default')
+        self.assertEqual([call.args[0] for call in patched_sleep.call_args_list],
+                         [0.1, 0.2, 0.4, 0.8, 1])
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_ping):
+        """Test waiting gives up once the next attempt would be too late"""
+        patched_ping.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', '--timeout', '0.25',
+                         stdout=StringIO())
+        self.assertEqual(patched_ping.call_count, 3)
+
+    def test_wait_for_db_aliases(self, patched_ping):
+        """Test waiting for the given databases in turn"""
+        call_command('wait_for_db', '--database', 'default',
+                     '--database', 'replica1', stdout=StringIO())
+        self.assertEqual([call.args[0] for call in patched_ping.call_args_list],
+                         ['default', 'replica1'])
+
+
+class RebuildRatingAggregatesTests(TestCase):
+    """Test rebuilding the movie rating aggregates"""
+    def test_rebuild_rating_aggregates(self):
+        """Test aggregates are recomputed from the rating rows"""
+        user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        rated = Movie.objects.create(user=user,
+                                     title='Rated',
+                                     description='Rated movie',
+                                     released_date=date(2020, 1, 1))
+        unrated = Movie.objects.create(user=user,
+                                       title='Unrated',
+                                       description='Unrated movie',
+                                       released_date=date(2020, 1, 1),
+                                       rating_count=7,
+                                       rating_sum=14.0)
+        for value in (0.5, 2.5, 5.0):
+            rated.ratings.add(Rating.objects.create(user=user,
+                                                    rating=value,
+                                                    description='desc'))
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+
+        rated.refresh_from_db()
+        unrated.refresh_from_db()
+        self.assertEqual(rated.rating_count, 3)
+        self.assertEqual(rated.rating_sum, 8.0)
+        self.assertEqual(rated.rating_histogram, [1, 0, 1, 0, 0, 1])
+        self.assertEqual(unrated.rating_count, 0)
+        self.assertEqual(unrated.rating_mean, 0.0)
+
+
+class RebuildLeaderboardsTests(TestCase):
+    """Test rebuilding the movie leaderboard scores"""
+    def test_rebuild_leaderboards(self):
+        """Test top and trending scores are recomputed from the ratings"""
+        user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        rated = Movie.objects.create(user=user,
+                                     title='Rated',
+                                     description='Rated movie',
+                                     released_date=date(2020, 1, 1))
+        unrated = Movie.objects.create(user=user,
+                                       title='Unrated',
+                                       description='Unrated movie',
+                                       released_date=date(2020, 1, 1),
+                                       top_score=4.9,
+                                       trending_score=100.0)
+        for value in (4.0, 5.0):
+            rated.ratings.add(Rating.objects.create(user=user,
+                                                    rating=value,
+                                                    description='desc'))
+
+        call_command('rebuild_leaderboards', stdout=StringIO())
+
+        rated.refresh_from_db()
+        unrated.refresh_from_db()
+        self.assertAlmostEqual(rated.top_score, (10 * 2.5 + 9.0) / 12)
+        self.assertIsNotNone(rated.trending_score)
+        self.assertEqual(unrated.top_score, 2.5)
+        self.assertIsNone(unrated.trending_score)
+        self.assertEqual(list(Movie.objects.trending(10)), [rated])
+
+
+class ImportMoviesTests(TestCase):
+    """Test the streaming catalog import command"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='importer',
+            email='importer@example.com',
+            password='test123'
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as source:
+            source.write(content)
+        return path
+
+    def test_import_imdb_tsv(self):
+        """Test importing an IMDb style TSV with scaled ratings"""
+        path = self.write_file('titles.tsv', (
+            'tconst\ttitleType\tprimaryTitle\tstartYear\taverageRating\n'
+            'tt1\tmovie\tFirst\t1999\t8.0\n'
+            'tt2\tshort\tSkipped short\t2001\t5.0\n'
+            'tt3\tmovie\tNo year\t\\N\t5.0\n'
+            'tt4\tmovie\tUnrated\t2005\t\\N\n'
+        ))
+
+        call_command('import_movies', path, user='importer',
+                     rating_scale=2, title_type='movie', stdout=StringIO())
+
+        first = Movie.objects.get(title='First')
+        self.assertEqual(first.released_date, date(1999, 1, 1))
+        self.assertEqual(first.rating_count, 1)
+        self.assertEqual(first.rating_mean, 4.0)
+        self.assertEqual(first.ratings.get().rating, 4.0)
+        self.assertEqual(Movie.objects.get(title='Unrated').rating_count, 0)
+        self.assertEqual(Movie.objects.count(), 2)
+
+    def test_import_jsonl_in_batches(self):
+        """Test JSON Lines rows with nested ratings import in batches"""
+        lines = [
+            json.dumps({
+                'title': f'Movie {index}',
+                'description': 'Imported',
+                'released_date': '2010-05-01',
+                'ratings': [1, {'rating': 4.5, 'description': 'Great'}],
+            })
+            for index in range(5)
+        ]
+        path = self.write_file('movies.jsonl', '\n'.join(lines + ['{bad']))
+        out = StringIO()
+
+        call_command('import_movies', path, user='importer', batch_size=2,
+                     stdout=out)
+
+        self.assertEqual(Movie.objects.count(), 5)
+        self.assertEqual(Rating.objects.count(), 10)
+        movie = Movie.objects.get(title='Movie 3')
+        self.assertEqual(movie.rating_histogram, [0, 1, 0, 0, 1, 0])
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn('1 skipped', out.getvalue())
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test a checkpointed import skips rows already committed"""
+        path = self.write_file('movies.csv', (
+            'title,description,released_date,rating\n'
+            'One,First,2001-01-01,3\n'
+            'Two,Second,2002-01-01,4\n'
+            'Three,Third,2003-01-01,5\n'
+        ))
+        checkpoint = os.path.join(self.tmpdir.name, 'import.checkpoint')
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump({'source': os.path.abspath(path), 'rows': 2},
+                      checkpoint_file)
+
+        call_command('import_movies', path, user='importer',
+                     checkpoint=checkpoint, stdout=StringIO())
+
+        self.assertEqual(list(Movie.objects.values_list('title', flat=True)),
+                         ['Three'])
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['rows'], 3)
+
+    def test_import_unknown_user(self):
+        """Test importing for a missing user fails"""
+        path = self.write_file('movies.csv', 'title\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_movies', path, user='nobody',
+                         stdout=StringIO())
+
+    def test_import_unreadable_files(self):
+        """Test missing and malformed files fail with a command error"""
+        undecodable = os.path.join(self.tmpdir.name, 'latin1.csv')
+        with open(undecodable, 'wb') as source:
+            source.write('title\nAm\xe9lie\n'.encode('latin-1'))
+        cases = {
+            'missing': os.path.join(self.tmpdir.name, 'missing.csv'),
+            'undecodable': undecodable,
+            'oversized field': self.write_file(
+                'huge.csv', 'title\n' + 'x' * (1024 * 1024 + 1) + '\n'
+            ),
+            'bad gzip': self.write_file('movies.csv.gz', 'not gzip'),
+        }
+        for name, path in cases.items():
+            with self.subTest(file=name):
+                with self.assertRaisesMessage(CommandError, path):
+                    call_command('import_movies', path, user='importer',
+                                 stdout=StringIO())
+        self.assertEqual(Movie.objects.count(), 0)
+
+
+class CopyWriterTests(SimpleTestCase):
+    """Test the COPY writer fills every column PostgreSQL requires"""
+    def test_required_columns_copied(self):
+        """Test NOT NULL columns without a database default are copied"""
+        writer = importer.CopyWriter(get_user_model()(pk=1))
+        for model, columns in ((Movie, writer.movie_columns),
+                               (Rating, writer.rating_columns)):
+            required = {
+                field.column for field in model._meta.concrete_fields
+                if not field.null and field.db_default is NOT_PROVIDED
+            }
+            with self.subTest(model=model.__name__):
+                self.assertEqual(required - set(columns), set())
+                self.assertTrue(set(columns) <= {
+                    field.column for field in model._meta.concrete_fields
+                })
+
+    def test_rows_match_columns(self):
+        """Test each row has a value for every column, in order"""
+        writer = importer.CopyWriter(get_user_model()(pk=1))
+        fields, ratings = importer.parse_movie({
+            'title': 'Movie', 'released_date': '2010-05-01', 'rating': '4',
+        })
+        now = timezone.now()
+
+        movie_row = dict(zip(writer.movie_columns,
+                             writer.movie_row(7, fields, now)))
+        rating_row = writer.rating_row(8, 7, *ratings[0], now)
+
+        self.assertEqual(len(movie_row), len(writer.movie_columns))
+        self.assertEqual(movie_row['image_variants'], '{}')
+        self.assertEqual(movie_row['rating_histogram'],
+                         json.dumps(fields['rating_histogram']))
+        self.assertEqual(movie_row['updated'], now)
+        self.assertEqual(len(rating_row), len(writer.rating_columns))
+
+
+class BuildSchemaTests(SimpleTestCase):
+    """Test regenerating the OpenAPI schema"""
+    def test_committed_schema_is_up_to_date(self):
+        """Test the schema on disk matches the code"""
+        call_command('build_schema', '--check', stdout=StringIO())
+
+    def test_build_and_check_schema(self):
+        """Test the schema is written and drift is detected"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schema.yml')
+            with override_settings(OPENAPI_SCHEMA_PATH=path):
+                with self.assertRaises(CommandError):
+                    call_command('build_schema', '--check', stdout=StringIO())
+
+                call_command('build_schema', stdout=StringIO())
+                call_command('build_schema', '--check', stdout=StringIO())
+
+                with open(path, 'a') as schema_file:
+                    schema_file.write('x-drift: true\n')
+                with self.assertRaises(CommandError):
+                    call_command('build_schema', '--check', stdout=StringIO())
+
+
+
+class BenchmarkApiTests(TestCase):
+    """Test the API benchmark and its baseline comparison"""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+        self.output = os.path.join(directory.name, 'results.json')
+
+    def benchmark(self, *args):
+        call_command('benchmark_api', '--movies', '20', '--concurrency', '1',
+                     '--requests', '3', '--warmup', '0',
+                     '--baseline', self.baseline, *args, stdout=StringIO())
+
+    def test_seed_is_deterministic(self):
+        """Test the catalog is seeded once and the same way"""
+        self.benchmark('--scenario', 'movie-list', '--update-baseline')
+        self.benchmark('--scenario', 'movie-list')
+
+        movies = Movie.objects.filter(user__username='benchmark')
+        self.assertEqual(movies.count(), 20)
+        self.assertEqual(movies.order_by('id').first().title, 'Last night 0')
+        self.assertEqual(
+            Rating.objects.filter(user__username='benchmark').count(),
+            sum(movie.rating_count for movie in movies)
+        )
+
+    def test_results_and_baseline(self):
+        """Test every scenario runs without errors and is stored"""
+        self.benchmark('--update-baseline', '--output', self.output)
+
+        with open(self.output) as output_file:
+            results = json.load(output_file)
+        with open(self.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+        self.assertEqual(baselines,
+                         {results['baseline_key']: results['scenarios']})
+        for name, summary in results['scenarios'].items():
+            self.assertEqual(summary['requests'], 3, name)
+            self.assertEqual(summary['errors'], 0, name)
+            self.assertGreater(summary['throughput'], 0, name)
+        self.assertGreaterEqual(
+            results['scenarios']['movie-list']['queries_per_request'], 1
+        )
+
+    def test_check_fails_on_regression(self):
+        """Test more queries per request than the baseline fail --check"""
+        self.benchmark('--scenario', 'movie-detail', '--update-baseline')
+        with open(self.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+        for scenarios in baselines.values():
+            scenarios['movie-detail']['queries_per_request'] -= 1
+        with open(self.baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file)
+
+        self.benchmark('--scenario', 'movie-detail')
+        with self.assertRaises(CommandError):
+            self.benchmark('--scenario', 'movie-detail', '--check')
+
+    def test_timings_are_advisory(self):
+        """Test slower timings are reported without failing --check"""
+        self.benchmark('--scenario', 'movie-detail', '--update-baseline')
+        with open(self.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+        for scenarios in baselines.values():
+            scenarios['movie-detail']['p50_ms'] /= 10
+            scenarios['movie-detail']['throughput'] *= 10
+        with open(self.baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file)
+
+        out = StringIO()
+        call_command('benchmark_api', '--movies', '20', '--concurrency', '1',
+                     '--requests', '3', '--warmup', '0',
+                     '--baseline', self.baseline, '--scenario',
+                     'movie-detail', '--check', stdout=out)
 
+        self.assertIn('p50_ms regressed', out.getvalue())
+        self.assertIn('throughput regressed', out.getvalue())
+        self.assertIn('advisory', out.getvalue())
@@ -0,0 +1,198 @@
+"""
+Test the connection pool and the readiness probe
+"""
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from core.db import pool as db_pool
+
+READY_URL = reverse('ready')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+
+    def close(self):
+        self.closed = True
+
+
+def check(connection):
+    if connection.broken:
+        raise ConnectionError('broken')
+
+
+def create_pool(**params):
+    defaults = {'min_size': 0, 'max_size': 2, 'timeout': 1,
+                'check_interval': 30, 'max_idle': 600}
+    defaults.update(params)
+    return db_pool.ConnectionPool(**defaults)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test connections are reused, checked and limited"""
+
+    def test_connection_reused(self):
+        """Test a returned connection is handed out again"""
+        pool = create_pool()
+        first = pool.getconn(FakeConnection, check)
+        pool.putconn(first, check)
+
+        self.assertIs(pool.getconn(FakeConnection, check), first)
+        stats = pool.stats()
+        self.assertEqual((stats['counters']['created'],
+                          stats['counters']['reused']), (1, 1))
+        self.assertEqual((stats['idle'], stats['in_use']), (0, 1))
+
+    def test_warm(self):
+        """Test warming opens the minimum number of connections once"""
+        pool = create_pool(min_size=2)
+        pool.warm(FakeConnection)
+        pool.warm(FakeConnection)
+
+        stats = pool.stats()
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['counters']['created'], 2)
+
+    def test_recent_connection_not_checked(self):
+        """Test connections idle for a short while are reused unchecked"""
+        pool = create_pool()
+        pool.putconn(pool.getconn(FakeConnection, check), check)
+        patched_check = mock.Mock()
+
+        pool.getconn(FakeConnection, patched_check)
+
+        patched_check.assert_not_called()
+
+    def test_broken_idle_connection_replaced(self):
+        """Test idle connections failing the health check are closed"""
+        pool = create_pool(check_interval=0)
+        broken = pool.getconn(FakeConnection, check)
+        pool.putconn(broken, check)
+        broken.broken = True
+
+        connection = pool.getconn(FakeConnection, check)
+
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['counters']['discarded'], 1)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_connection_failing_reset_closed(self):
+        """Test a connection that can't be reset isn't pooled"""
+        pool = create_pool()
+        connection = pool.getconn(FakeConnection, check)
+        connection.broken = True
+
+        pool.putconn(connection, check)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.stats()['idle'], pool.stats()['in_use']),
+                         (0, 0))
+
+    def test_expired_idle_connections_closed(self):
+        """Test connections idle too long beyond the minimum are closed"""
+        pool = create_pool(max_idle=0)
+        first = pool.getconn(FakeConnection, check)
+        pool.putconn(first, check)
+        time.sleep(0.01)
+
+        self.assertIsNot(pool.getconn(FakeConnection, check), first)
+        self.assertTrue(first.closed)
+
+    def test_saturated_pool_times_out(self):
+        """Test a checkout fails once no connection frees up in time"""
+        pool = create_pool(max_size=1, timeout=0.05)
+        pool.getconn(FakeConnection, check)
+
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.getconn(FakeConnection, check)
+        self.assertEqual(pool.stats()['counters']['timed_out'], 1)
+
+    def test_saturated_pool_waits(self):
+        """Test a checkout waits for a connection to be returned"""
+        pool = create_pool(max_size=1, timeout=5)
+        first = pool.getconn(FakeConnection, check)
+        release = threading.Timer(0.05, pool.putconn, (first, check))
+        release.start()
+        self.addCleanup(release.join)
+
+        self.assertIs(pool.getconn(FakeConnection, check), first)
+        stats = pool.stats()
+        self.assertEqual(stats['counters']['waited'], 1)
+        self.assertGreater(stats['wait_seconds'], 0)
+
+    def test_closed_pool(self):
+        """Test closing a pool closes idle and returned connections"""
+        pool = create_pool()
+        idle = pool.getconn(FakeConnection, check)
+        in_use = pool.getconn(FakeConnection, check)
+        pool.putconn(idle, check)
+
+        pool.close()
+        pool.putconn(in_use, check)
+
+        self.assertTrue(idle.closed and in_use.closed)
+        self.assertEqual((pool.stats()['idle'], pool.stats()['in_use']),
+                         (0, 0))
+
+    @override_settings(DB_POOL_MAX_SIZE=3)
+    def test_metrics(self):
+        """Test pool sizes are exposed per database"""
+        self.addCleanup(db_pool.drop_pool, 'pool-test')
+        pool = db_pool.get_pool('pool-test')
+        pool.getconn(FakeConnection, check)
+
+        output = metrics.render()
+
+        self.assertIn('db_pool_connections{database="pool-test",'
+                      'state="in_use",', output)
+        self.assertIn('db_pool_max_connections{database="pool-test",',
+                      output)
+        self.assertIn('db_pool_checkouts_total{database="pool-test",'
+                      'outcome="created",', output)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Pooling is for PostgreSQL')
+class PooledBackendTests(TransactionTestCase):
+    """Test the database engine hands out pooled connections"""
+
+    def test_connection_reused_after_close(self):
+        """Test closing returns the connection for the next request"""
+        connection.ensure_connection()
+        raw = connection.connection
+        connection.close()
+
+        connection.ensure_connection()
+
+        self.assertIs(connection.connection, raw)
+
+
+class ReadinessTests(SimpleTestCase):
+    """Test the readiness probe"""
+    databases = {'default'}
+
+    def test_ready(self):
+        """Test the probe succeeds when the databases answer"""
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ready'})
+
+    @mock.patch('core.views.unavailable_databases')
+    def test_database_unavailable(self, patched_unavailable):
+        """Test the probe fails while a database is unreachable"""
+        patched_unavailable.return_value = ['default']
+
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['databases'], ['default'])
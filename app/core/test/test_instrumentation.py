@@ -0,0 +1,115 @@
+"""
+Test per-request instrumentation
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+import re
+
+from core import instrumentation
+from core.models import Movie
+
+METRICS_URL = reverse('metrics')
+MOVIES_URL = reverse('movie:movie-list')
+ASYNC_MOVIES_URL = reverse('movie:async-movie-list')
+TOKEN_URL = reverse('user:token')
+
+
+def parse_server_timing(header):
+    """Return {phase: (duration in ms, description)}"""
+    timings = {}
+    for entry in header.split(', '):
+        match = re.fullmatch(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', entry)
+        timings[match[1]] = (float(match[2]), match[3])
+    return timings
+
+
+class InstrumentationTests(TestCase):
+    """Test the Server-Timing header, histograms and slow query log"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Movie.objects.create(user=self.user, title='Movie',
+                             released_date='2020-01-01')
+        instrumentation.request_duration.clear()
+        instrumentation.request_queries.clear()
+
+    def test_server_timing_header(self):
+        """Test every phase is reported with the query count"""
+        res = self.client.get(MOVIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        timings = parse_server_timing(res['Server-Timing'])
+        self.assertEqual(list(timings), list(instrumentation.PHASES))
+        self.assertRegex(timings['db'][1], r'^[1-9]\d* queries$')
+        self.assertGreater(timings['serializer'][0], 0)
+        self.assertGreater(timings['render'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['render'][0])
+
+    async def test_async_requests_timed(self):
+        """Test queries run by async views under ASGI are counted"""
+        token = await Token.objects.acreate(user=self.user)
+
+        res = await self.async_client.get(
+            ASYNC_MOVIES_URL, headers={'Authorization': f'Token {token}'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        timings = parse_server_timing(res['Server-Timing'])
+        self.assertRegex(timings['db'][1], r'^[1-9]\d* queries$')
+        self.assertGreater(timings['db'][0], 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_histograms_per_view(self):
+        """Test requests are aggregated by view and action in /metrics"""
+        self.client.get(MOVIES_URL)
+        self.client.post(TOKEN_URL, {'username': 'username',
+                                     'email': 'user@example.com',
+                                     'password': 'test123'})
+        body = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+
+        self.assertIn('# TYPE request_phase_seconds histogram', body)
+        for phase in instrumentation.PHASES:
+            self.assertRegex(
+                body,
+                r'request_phase_seconds_count\{view="MovieViewSet.list",'
+                r'phase="%s",pid="\d+"\} 1\n' % phase
+            )
+        self.assertRegex(
+            body,
+            r'request_phase_seconds_bucket\{view="CreateTokenView",'
+            r'phase="total",le="\+Inf",pid="\d+"\} 1\n'
+        )
+        self.assertRegex(
+            body,
+            r'request_db_queries_count\{view="MovieViewSet.list",'
+            r'pid="\d+"\} 1\n'
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_SAMPLE_RATE=1)
+    def test_slow_query_logged(self):
+        """Test slow queries are logged with the SQL and call site"""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(MOVIES_URL)
+
+        self.assertTrue(any('core_movie' in line for line in logs.output))
+        self.assertTrue(any('movie/' in line and '.py:' in line
+                            for line in logs.output))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_SAMPLE_RATE=0)
+    def test_slow_query_sampling(self):
+        """Test no slow queries are logged with a zero sample rate"""
+        with self.assertNoLogs('core.slow_queries', 'WARNING'):
+            self.client.get(MOVIES_URL)
@@ -0,0 +1,98 @@
+"""
+Test data migrations
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from core.models import Movie
+from core.search import MovieSearch
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Run migrations back and forth, the latest are applied afterwards"""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph
+                     .leaf_nodes())
+
+
+class CopyRatingMoviesTests(MigrationTestCase):
+    """Test moving movie/rating links from the many to many to Rating.movie"""
+    migrate_from = [('core', '0014_rating_movie')]
+    migrate_to = [('core', '0016_remove_movie_ratings')]
+
+    def test_links_copied(self):
+        """Test each rating gets its movie and shared ratings are copied"""
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        Movie = apps.get_model('core', 'Movie')
+        Rating = apps.get_model('core', 'Rating')
+        user = User.objects.create(username='username',
+                                   email='user@example.com')
+        first = Movie.objects.create(user=user, title='First',
+                                     released_date='2020-01-01')
+        second = Movie.objects.create(user=user, title='Second',
+                                      released_date='2020-01-01')
+        rating = Rating.objects.create(user=user, rating=4.0,
+                                       description='Shared')
+        loose = Rating.objects.create(user=user, rating=1.0,
+                                      description='No movie')
+        first.ratings.add(rating)
+        second.ratings.add(rating)
+
+        apps = self.migrate(self.migrate_to)
+        Rating = apps.get_model('core', 'Rating')
+
+        self.assertIsNone(Rating.objects.get(pk=loose.pk).movie_id)
+        self.assertEqual(Rating.objects.get(pk=rating.pk).movie_id, first.pk)
+        copy = Rating.objects.get(movie_id=second.pk)
+        self.assertEqual((copy.rating, copy.description, copy.created),
+                         (4.0, 'Shared', rating.created))
+        self.assertEqual(Rating.objects.count(), 3)
+
+
+class SearchIndexMigrationTests(MigrationTestCase):
+    """Test installing and removing the full-text search index"""
+
+    def search_objects(self):
+        """Return the names of the triggers, tables and indexes of the
+        search index"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT tgname FROM pg_trigger WHERE tgname LIKE "
+                    "'core_movie_search%%' UNION SELECT indexname FROM "
+                    "pg_indexes WHERE indexname LIKE 'core_movie_search%%'"
+                )
+            else:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master "
+                    "WHERE name LIKE 'core_movie_fts%%' AND type IN "
+                    "('table', 'trigger')"
+                )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_reversible_and_backfilled(self):
+        """Test the index is dropped when unapplied and covers the movies
+        saved before it once applied"""
+        apps = self.migrate([('core', '0018_movie_similarity')])
+        self.assertEqual(self.search_objects(), set())
+        User = apps.get_model('core', 'User')
+        user = User.objects.create(username='username',
+                                   email='user@example.com')
+        movie = apps.get_model('core', 'Movie').objects.create(
+            user=user, title='Heat', released_date='2020-01-01'
+        )
+
+        self.migrate([('core', '0019_movie_search_index')])
+
+        self.assertTrue(self.search_objects())
+        results = MovieSearch('heat', Movie.objects.all())[0:10]
+        self.assertEqual([result.pk for result in results], [movie.pk])
@@ -0,0 +1,83 @@
+"""
+Test the orjson renderer and parser
+"""
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+import uuid
+
+from core.parsers import OrjsonParser
+from core.renderers import OrjsonRenderer
+
+
+class OrjsonRendererTests(SimpleTestCase):
+    """Test the orjson renderer matches JSONRenderer"""
+    def test_output_matches_json_renderer(self):
+        """Test typical API payloads render to identical bytes"""
+        data = {
+            'next': None,
+            'results': [{
+                'id': 1,
+                'title': 'Am\u00e9lie \u2028\u2029 \U0001f3ac "quoted"\n',
+                'is_active': True,
+                'released_date': '2001-04-25',
+                'ratings': [{'id': 3, 'rating': 4.0}, {'id': 7, 'rating': 0.1}],
+                'rating_count': 2,
+                'rating_mean': 2.05,
+                'rating_histogram': [0, 1, 0, 0, 1, 0],
+            }],
+            'detail': gettext_lazy('Not found.'),
+            'price': Decimal('1.50'),
+            'uid': uuid.UUID('12345678123456781234567812345678'),
+            3: 'int key',
+        }
+
+        self.assertEqual(OrjsonRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_dates_encoded_natively(self):
+        """Test dates are encoded without a fallback"""
+        self.assertEqual(OrjsonRenderer().render({'day': date(2020, 1, 2)}),
+                         b'{"day":"2020-01-02"}')
+
+    def test_indent_falls_back_to_json_renderer(self):
+        """Test indented output, as the browsable API asks for, still works"""
+        data = {'a': [1, 2]}
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(OrjsonRenderer().render(data, media_type),
+                         JSONRenderer().render(data, media_type))
+
+    def test_none_renders_empty(self):
+        """Test no data renders an empty body"""
+        self.assertEqual(OrjsonRenderer().render(None), b'')
+
+
+class OrjsonParserTests(SimpleTestCase):
+    """Test the orjson parser"""
+    def parse(self, body, encoding='utf-8'):
+        return OrjsonParser().parse(BytesIO(body),
+                                    parser_context={'encoding': encoding})
+
+    def test_parse(self):
+        """Test a JSON body is parsed"""
+        self.assertEqual(self.parse('{"title": "Amélie", "ratings": [1.5]}'
+                                    .encode()),
+                         {'title': 'Amélie', 'ratings': [1.5]})
+
+    def test_parse_other_charset(self):
+        """Test bodies in a declared non UTF-8 charset are decoded"""
+        self.assertEqual(self.parse('["é"]'.encode('latin-1'), 'latin-1'),
+                         ['é'])
+
+    def test_invalid_json(self):
+        """Test malformed bodies and non standard constants are rejected"""
+        for body in (b'{"title":', b'', b'[NaN]'):
+            with self.assertRaises(ParseError):
+                self.parse(body)
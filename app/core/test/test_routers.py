@@ -0,0 +1,191 @@
+"""
+Test read replica routing, with in-memory SQLite databases as replicas
+"""
+import itertools
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Movie
+
+REPLICAS = ['replica1', 'replica2']
+MOVIES_URL = reverse('movie:movie-list')
+RATINGS_URL = reverse('movie:rating-list')
+ASYNC_MOVIES_URL = reverse('movie:async-movie-list')
+
+
+def detail_url(movie_id):
+    return reverse('movie:movie-detail', args=[movie_id])
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRoutingTests(TestCase):
+    """Test reads go to the replicas and users read their own writes"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Each replica is a separate, migrated in-memory database. They are
+        # added to `databases` once they exist, after the runner's checks.
+        for alias in REPLICAS:
+            connections.settings[alias] = connections.configure_settings({
+                DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+                alias: {'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': ':memory:'},
+            })[alias]
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in REPLICAS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        del cls.databases
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        sequence = mock.patch.object(routers, '_replica_sequence',
+                                     itertools.count())
+        sequence.start()
+        self.addCleanup(sequence.stop)
+
+        self.user = self.create_user(DEFAULT_DB_ALIAS)
+        self.movie = self.create_movie(DEFAULT_DB_ALIAS, 'Primary')
+        for alias in REPLICAS:
+            self.create_user(alias)
+            self.create_movie(alias, alias)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_user(self, alias):
+        # A superuser, who may edit movies
+        return get_user_model().objects.db_manager(alias).create_superuser(
+            id=1, username='username', email='user@example.com',
+            password='test123'
+        )
+
+    def create_movie(self, alias, title):
+        return Movie.objects.using(alias).create(
+            id=1, user_id=1, title=title, description='Description',
+            is_active=True, released_date=date(2020, 1, 1)
+        )
+
+    def list_titles(self):
+        res = self.client.get(MOVIES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [movie['title'] for movie in res.data['results']]
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test commands and shells read from the primary"""
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Movie),
+                         DEFAULT_DB_ALIAS)
+
+    def test_safe_requests_read_from_replicas(self):
+        """Test GET requests read from each replica in turn"""
+        self.assertEqual(self.list_titles(), ['replica1'])
+        self.assertEqual(self.list_titles(), ['replica2'])
+        self.assertEqual(self.list_titles(), ['replica1'])
+
+    async def test_async_requests_read_from_replicas(self):
+        """Test reads of async views served under ASGI are routed too"""
+        token = await Token.objects.acreate(user=self.user)
+
+        res = await self.async_client.get(
+            ASYNC_MOVIES_URL, headers={'Authorization': f'Token {token}'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['title'] for movie in res.json()['results']],
+                         ['replica1'])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test everything is read from the primary without replicas"""
+        self.assertEqual(self.list_titles(), ['Primary'])
+
+    def test_unsafe_requests_read_from_primary(self):
+        """Test reads made while serving a write use the primary"""
+        Movie.objects.using('replica1').filter(pk=1).delete()
+
+        res = self.client.patch(detail_url(self.movie.id),
+                                {'title': 'Updated'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.title, 'Updated')
+
+    def test_write_pins_user_to_primary(self):
+        """Test a user reads from the primary for a while after writing"""
+        res = self.client.post(RATINGS_URL, {'rating': 4.0,
+                                             'description': 'Good'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self.list_titles(), ['Primary'])
+        self.assertEqual(self.list_titles(), ['Primary'])
+
+        cache.clear()
+        self.assertEqual(self.list_titles(), ['replica1'])
+
+    def test_pin_is_per_user(self):
+        """Test another user's write doesn't pin this user"""
+        routers.pin_to_primary(self.user.id + 1)
+
+        self.assertEqual(self.list_titles(), ['replica1'])
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pinning_disabled(self):
+        """Test writes don't pin users without a pin window"""
+        self.client.post(RATINGS_URL, {'rating': 4.0, 'description': 'Good'})
+
+        self.assertEqual(self.list_titles(), ['replica1'])
+
+    def test_tokens_read_from_primary(self):
+        """Test a token is usable before it reaches the replicas"""
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = client.get(MOVIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['title'] for movie in res.data['results']],
+                         ['replica1'])
+
+
+class PinCacheTests(SimpleTestCase):
+    """Test replicas need a cache shared by the workers"""
+
+    @override_settings(DATABASE_REPLICAS=REPLICAS, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_memory_cache_refused(self):
+        """Test a per process cache is refused with replicas"""
+        with self.assertRaises(ImproperlyConfigured):
+            routers.check_pin_cache()
+
+    @override_settings(DATABASE_REPLICAS=REPLICAS, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache'}})
+    def test_shared_cache_accepted(self):
+        """Test a cache shared by the workers is accepted with replicas"""
+        routers.check_pin_cache()
+
+    @override_settings(DATABASE_REPLICAS=[], CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_memory_cache_without_replicas(self):
+        """Test a single process without replicas can keep a local cache"""
+        routers.check_pin_cache()
@@ -0,0 +1,65 @@
+"""
+Test serving the pregenerated OpenAPI schema
+"""
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from unittest.mock import patch
+import json
+import os
+import tempfile
+
+from core.schema import SchemaCache, generate_schema, schema_cache
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaViewTests(TestCase):
+    """Test the schema endpoint"""
+    def setUp(self):
+        self.client = APIClient()
+        schema_cache.clear()
+        self.addCleanup(schema_cache.clear)
+
+    def test_schema_served_without_introspection(self):
+        """Test the committed schema is served, not regenerated"""
+        with patch('core.schema.generate_schema') as generate:
+            res = self.client.get(SCHEMA_URL)
+            self.client.get(SCHEMA_URL)
+
+        generate.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith(
+            'application/vnd.oai.openapi'))
+        with open(schema_cache.path, 'rb') as schema_file:
+            self.assertEqual(res.content, schema_file.read())
+
+    def test_json_format(self):
+        """Test the JSON rendering is available too"""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('/api/movie/movies/', json.loads(res.content)['paths'])
+
+    def test_etag_not_modified(self):
+        """Test a matching If-None-Match gets a 304"""
+        res = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_generated_once_without_file(self):
+        """Test a missing schema file is generated on first use only"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SchemaCache(os.path.join(directory, 'schema.yml'))
+            with patch('core.schema.generate_schema',
+                       wraps=generate_schema) as generate:
+                first = cache.get_schema()
+                second = cache.get_schema()
+
+        generate.assert_called_once()
+        self.assertIs(first, second)
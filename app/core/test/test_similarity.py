@@ -0,0 +1,163 @@
+"""
+Test the similar movies build
+"""
+from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import similarity
+from core.models import Movie, MovieSimilarity, Rating, SimilarityRun
+
+
+def neighbours(movie):
+    return list(MovieSimilarity.objects.filter(movie=movie).order_by('rank')
+                .values_list('neighbour__title', flat=True))
+
+
+@override_settings(SIMILAR_MOVIES_SHRINKAGE=0)
+class SimilarityBuildTests(TestCase):
+    """Test neighbours are computed from co-rating patterns"""
+
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create_user(
+                username=f'user{index}', email=f'user{index}@example.com',
+                password='test123'
+            )
+            for index in range(4)
+        ]
+        self.movies = {
+            title: Movie.objects.create(
+                user=self.users[0], title=title, description='Description',
+                released_date=date(2020, 1, 1)
+            )
+            for title in ('Alien', 'Aliens', 'Heat', 'Unrated')
+        }
+
+    def rate(self, user, title, value):
+        Rating.objects.create(user=self.users[user],
+                              movie=self.movies[title], rating=value,
+                              description='Rating')
+
+    def touch(self, title, when):
+        """Mark a movie as changed at `when`, like rating writes do"""
+        Movie.objects.filter(pk=self.movies[title].pk).update(updated=when)
+
+    def build(self, **options):
+        return list(similarity.build(**options))
+
+    def rate_catalog(self):
+        # Alien and Aliens are rated alike by the same users, Heat by
+        # others
+        for user in (0, 1, 2):
+            self.rate(user, 'Alien', 5.0)
+            self.rate(user, 'Aliens', 4.0 + user * 0.5)
+        self.rate(2, 'Heat', 1.0)
+        self.rate(3, 'Heat', 5.0)
+
+    def test_neighbours_ranked_by_similarity(self):
+        """Test co-rated movies are neighbours, most similar first"""
+        self.rate_catalog()
+
+        progress = self.build()
+
+        self.assertEqual(progress[-1], (4, 4))
+        self.assertEqual(neighbours(self.movies['Alien']), ['Aliens', 'Heat'])
+        self.assertEqual(neighbours(self.movies['Heat']), ['Aliens', 'Alien'])
+        self.assertEqual(neighbours(self.movies['Unrated']), [])
+        score = MovieSimilarity.objects.get(movie=self.movies['Alien'],
+                                            rank=0).score
+        self.assertGreater(score, 0.9)
+        self.assertLessEqual(score, 1.0)
+
+    def test_top_k(self):
+        """Test only the best k neighbours are stored"""
+        self.rate_catalog()
+
+        self.build(top_k=1)
+
+        self.assertEqual(neighbours(self.movies['Alien']), ['Aliens'])
+
+    @override_settings(SIMILAR_MOVIES_SHRINKAGE=10)
+    def test_shrinkage(self):
+        """Test movies sharing a single rater score lower"""
+        self.rate(0, 'Alien', 5.0)
+        self.rate(0, 'Heat', 5.0)
+
+        self.build()
+
+        score = MovieSimilarity.objects.get(movie=self.movies['Alien']).score
+        self.assertAlmostEqual(score, 1 / 11)
+
+    def test_repeated_ratings_averaged(self):
+        """Test a user's ratings of one movie count as their mean"""
+        self.rate(0, 'Alien', 1.0)
+        self.rate(0, 'Alien', 5.0)
+        self.rate(0, 'Aliens', 3.0)
+
+        matrix = similarity.RatingMatrix.from_database()
+
+        self.assertEqual(matrix.normalized.nnz, 2)
+        self.assertEqual(len(matrix.movie_ids), 2)
+
+    def test_incremental_build(self):
+        """Test only movies affected by rating changes are recomputed"""
+        self.rate_catalog()
+        self.build()
+        self.assertEqual(SimilarityRun.objects.get().movies, 4)
+        other = Movie.objects.create(user=self.users[0], title='Other',
+                                     description='Description',
+                                     released_date=date(2020, 1, 1))
+        self.movies['Other'] = other
+        self.touch('Other', timezone.now() - timedelta(days=1))
+
+        later = timezone.now() + timedelta(minutes=1)
+        self.rate(3, 'Unrated', 5.0)
+        self.touch('Unrated', later)
+        with patch('django.utils.timezone.now',
+                   return_value=later + timedelta(minutes=1)):
+            progress = self.build()
+
+        # Unrated, and Heat which shares its rater, but not Alien, Aliens
+        # or the untouched Other
+        self.assertEqual(progress[-1], (2, 2))
+        self.assertEqual(neighbours(self.movies['Unrated']), ['Heat'])
+        self.assertEqual(neighbours(self.movies['Heat']),
+                         ['Unrated', 'Aliens', 'Alien'])
+        run = SimilarityRun.objects.order_by('-started').first()
+        self.assertFalse(run.full)
+
+    def test_incremental_build_drops_removed_neighbours(self):
+        """Test movies listing a changed movie as neighbour are refreshed"""
+        self.rate(0, 'Alien', 5.0)
+        self.rate(0, 'Heat', 5.0)
+        self.build()
+
+        later = timezone.now() + timedelta(minutes=1)
+        Rating.objects.filter(movie=self.movies['Heat']).delete()
+        self.touch('Heat', later)
+        with patch('django.utils.timezone.now',
+                   return_value=later + timedelta(minutes=1)):
+            self.build()
+
+        self.assertEqual(neighbours(self.movies['Alien']), [])
+
+    def test_command(self):
+        """Test the command builds, then rebuilds everything with --full"""
+        self.rate_catalog()
+        out = StringIO()
+
+        call_command('rebuild_similar_movies', stdout=out)
+        call_command('rebuild_similar_movies', '--full', '--block-size', '1',
+                     stdout=out)
+
+        self.assertIn('Computed neighbours of 4/4 movies', out.getvalue())
+        self.assertEqual([run.full for run in
+                          SimilarityRun.objects.order_by('started')],
+                         [True, True])
+        self.assertEqual(neighbours(self.movies['Alien']), ['Aliens', 'Heat'])
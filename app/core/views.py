@@ -0,0 +1,45 @@
+"""
+Operational views for the project
+"""
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_GET
+
+from core import metrics
+from core.health import unavailable_databases
+
+
+def can_read_metrics(request):
+    """Return whether the request has the metrics token or a staff user"""
+    if settings.METRICS_TOKEN:
+        expected = 'Bearer {}'.format(settings.METRICS_TOKEN)
+        if hmac.compare_digest(request.headers.get('Authorization', ''),
+                               expected):
+            return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    """Expose the metrics of the server's workers for Prometheus to scrape"""
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    if settings.METRICS_DIR:
+        body = metrics.render_all(settings.METRICS_DIR,
+                                  max_age=3 * settings.METRICS_EXPORT_SECONDS)
+    else:
+        body = metrics.render()
+    return HttpResponse(body, content_type=metrics.CONTENT_TYPE)
+
+
+@require_GET
+def ready_view(request):
+    """Readiness probe, 503 until every database can be queried"""
+    unavailable = unavailable_databases()
+    if unavailable:
+        return JsonResponse({'status': 'unavailable',
+                             'databases': unavailable}, status=503)
+    return JsonResponse({'status': 'ready'})
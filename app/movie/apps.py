@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class MovieConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movie'
+
+    def ready(self):
+        from core.models import Movie
+        from movie import autocomplete
+
+        post_save.connect(autocomplete.index_movie, sender=Movie)
+        post_delete.connect(autocomplete.unindex_movie, sender=Movie)
@@ -0,0 +1,156 @@
+"""
+Async views for the movie reads, for deployment under an ASGI server.
+
+They mirror the list, detail and search actions of `MovieViewSet`
+(authentication, permissions, filters, pagination, content negotiation,
+error responses and conditional GET) but query with the async ORM, so a
+slow query waits on the event loop instead of pinning a worker process.
+"""
+from inspect import isawaitable
+
+from django.db.models import aprefetch_related_objects
+from django.http import Http404
+from rest_framework import exceptions, generics
+from rest_framework.permissions import IsAuthenticated
+
+from core.models import Movie
+from core.search import MovieSearch
+from movie import serializers
+from movie.conditional import ConditionalGetMixin
+from movie.filters import MovieFilterBackend
+from movie.pagination import KeysetPagination, SearchPagination
+from movie.views import MovieViewSet, ratings_prefetch
+
+
+class AsyncMovieView(ConditionalGetMixin, generics.GenericAPIView):
+    """Base for async movie reads with MovieViewSet's access rules.
+
+    `dispatch` is APIView's, awaiting the authentication and the handler:
+    content negotiation, permissions, throttling and the exception handler
+    are DRF's own.
+    """
+    http_method_names = ['get', 'head', 'options']
+    authentication_classes = MovieViewSet.authentication_classes
+    permission_classes = [IsAuthenticated]
+    serializer_class = serializers.MovieSerializer
+    pagination_class = None
+    filter_backends = ()
+    queryset = Movie.objects.all()
+    ordering = MovieViewSet.ordering
+    ordering_fields = MovieViewSet.ordering_fields
+    # Documented by the sync endpoints they mirror
+    schema = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Async counterpart of APIView.dispatch"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args,
+                                               **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """Async counterpart of APIView.initial"""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        """Authenticate with the authenticators' `aauthenticate`, so
+        request.user never runs a sync lookup"""
+        for authenticator in request.authenticators:
+            try:
+                user_auth = await authenticator.aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def aget_object(self):
+        """Async counterpart of GenericAPIView.get_object"""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except queryset.model.DoesNotExist:
+            # The message of the get_object_or_404 of the sync views
+            raise Http404(f'No {queryset.model._meta.object_name} matches '
+                          'the given query.')
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self
+        )
+
+    async def aprepare_instances(self, instances):
+        """Fetch the nested ratings in one query once they're needed"""
+        await aprefetch_related_objects(instances, ratings_prefetch())
+
+
+class AsyncMovieListView(AsyncMovieView):
+    """Async counterpart of the movie list"""
+    pagination_class = KeysetPagination
+    filter_backends = [MovieFilterBackend]
+
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+
+class AsyncMovieDetailView(AsyncMovieView):
+    """Async counterpart of the movie detail"""
+    serializer_class = serializers.MovieDetailSerializer
+
+    async def get(self, request, *args, **kwargs):
+        return await self.aretrieve(request, *args, **kwargs)
+
+
+class AsyncMovieSearchView(AsyncMovieView):
+    """Async counterpart of the movie search"""
+    pagination_class = SearchPagination
+
+    async def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise exceptions.ValidationError(
+                {'q': ['This query parameter is required.']}
+            )
+
+        page = await self.apaginate_queryset(
+            MovieSearch(query, self.get_queryset())
+        )
+        await self.aprepare_instances(page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,261 @@
+"""
+In-memory title autocomplete.
+
+Each worker keeps every movie title in a `TitleIndex`: normalized titles
+(case folded, accents stripped) in a sorted list, with the ids, display
+titles and popularity (rating count) in parallel arrays. A prefix matches
+a contiguous range of the list, found by binary search, and the most
+popular movies of the range are picked with a partial sort, so a lookup
+never queries the database.
+
+The index is loaded in a background thread when the worker boots or on
+the first lookup. Saves and deletes made by the worker are applied from
+the Movie signals once committed, and changes made elsewhere (other
+workers, rating aggregates written in bulk) are picked up from
+`Movie.updated` every AUTOCOMPLETE_REFRESH_SECONDS. Movies deleted by
+other workers are dropped by a full reload every
+AUTOCOMPLETE_RELOAD_SECONDS.
+"""
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import Movie
+
+logger = logging.getLogger(__name__)
+
+# Sorts after any character of a normalized title
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Return the form titles and prefixes are compared in"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed
+                       if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def without(items, positions):
+    """Return a copy of the `items` list without the sorted `positions`"""
+    result = []
+    start = 0
+    for position in positions:
+        result.extend(items[start:position])
+        start = position + 1
+    result.extend(items[start:])
+    return result
+
+
+def with_inserted(items, points, inserted):
+    """Return a copy of the `items` list with each `inserted` item put
+    before the matching position of the sorted `points`"""
+    result = []
+    start = 0
+    for point, item in zip(points, inserted):
+        result.extend(items[start:point])
+        result.append(item)
+        start = point
+    result.extend(items[start:])
+    return result
+
+
+class TitleIndex:
+    """Sorted prefix index of movie titles, ranked by popularity"""
+
+    def __init__(self):
+        # Held by lookups and to swap the arrays
+        self._lock = threading.Lock()
+        # Held while new arrays are built, one update at a time
+        self._update_lock = threading.Lock()
+        self._loading = False
+        self._reset()
+
+    def _reset(self):
+        self._keys = []
+        self._titles = []
+        self._ids = np.empty(0, dtype=np.int64)
+        self._popularity = np.empty(0, dtype=np.int64)
+        self.loaded = False
+        # Movies updated after this are fetched by the next refresh
+        self._watermark = None
+        self._next_refresh = 0.0
+        self._next_reload = 0.0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix, limit):
+        """Return up to `limit` {id, title} of the most popular movies
+        whose title starts with `prefix`"""
+        self.schedule_refresh()
+        key = normalize(prefix)
+        if not key:
+            return []
+        if prefix[-1].isspace():
+            # 'star ' shouldn't match 'starship'
+            key += ' '
+        with self._lock:
+            start = bisect.bisect_left(self._keys, key)
+            end = bisect.bisect_right(self._keys, key + PREFIX_END, start)
+            positions = np.arange(start, end)
+            if end - start > limit:
+                popularity = self._popularity[start:end]
+                positions = start + np.argpartition(-popularity, limit - 1)[
+                    :limit]
+            # Most popular first, then shortest title
+            ranked = sorted(positions.tolist(), key=lambda position: (
+                -self._popularity[position], len(self._keys[position]),
+                self._ids[position]
+            ))
+            return [{'id': int(self._ids[position]),
+                     'title': self._titles[position]}
+                    for position in ranked]
+
+    def upsert(self, movie_id, title, popularity):
+        """Add a movie, or update its title and popularity"""
+        self.apply([(movie_id, title, popularity)])
+
+    def remove(self, movie_id):
+        """Drop a movie from the index"""
+        self.apply([], removed_ids=[movie_id])
+
+    def apply(self, rows, removed_ids=()):
+        """Add or update the (id, title, popularity) rows and drop the
+        removed movies.
+
+        The new arrays are built from the current ones without holding the
+        lock, lookups keep using the current ones until they are swapped.
+        """
+        rows = sorted((normalize(title), title, movie_id, popularity)
+                      for movie_id, title, popularity in rows)
+        with self._update_lock:
+            # Updated movies are dropped and inserted at their new place
+            changed = np.array([row[2] for row in rows] + list(removed_ids),
+                               dtype=np.int64)
+            dropped = np.flatnonzero(np.isin(self._ids, changed)).tolist()
+            keys = without(self._keys, dropped)
+            points = [bisect.bisect_left(keys, row[0]) for row in rows]
+            keys = with_inserted(keys, points, [row[0] for row in rows])
+            titles = with_inserted(without(self._titles, dropped), points,
+                                   [row[1] for row in rows])
+            ids = np.insert(np.delete(self._ids, dropped), points,
+                            [row[2] for row in rows])
+            popularity = np.insert(np.delete(self._popularity, dropped),
+                                   points, [row[3] for row in rows])
+            with self._lock:
+                self._keys = keys
+                self._titles = titles
+                self._ids = ids
+                self._popularity = popularity
+
+    def load(self, chunk_size=10000):
+        """Replace the index with every movie from the database"""
+        watermark = self.next_watermark()
+        rows = [
+            (normalize(title), title, movie_id, popularity)
+            for movie_id, title, popularity in Movie.objects.values_list(
+                'id', 'title', 'rating_count'
+            ).iterator(chunk_size=chunk_size)
+        ]
+        rows.sort()
+        with self._update_lock, self._lock:
+            self._keys = [row[0] for row in rows]
+            self._titles = [row[1] for row in rows]
+            self._ids = np.array([row[2] for row in rows], dtype=np.int64)
+            self._popularity = np.array([row[3] for row in rows],
+                                        dtype=np.int64)
+            self._watermark = watermark
+            self.loaded = True
+            now = time.monotonic()
+            self._next_refresh = now + settings.AUTOCOMPLETE_REFRESH_SECONDS
+            self._next_reload = now + settings.AUTOCOMPLETE_RELOAD_SECONDS
+
+    def refresh(self):
+        """Apply the movies updated since the last load or refresh"""
+        watermark = self.next_watermark()
+        self.apply(Movie.objects.filter(updated__gte=self._watermark)
+                   .values_list('id', 'title', 'rating_count'))
+        self._watermark = watermark
+        self._next_refresh = (time.monotonic() +
+                              settings.AUTOCOMPLETE_REFRESH_SECONDS)
+
+    def next_watermark(self):
+        # Overlaps the previous refresh so a save committed a little after
+        # its `updated` timestamp isn't missed, upserts are idempotent
+        return timezone.now() - timedelta(
+            seconds=settings.AUTOCOMPLETE_REFRESH_SECONDS
+        )
+
+    def clear(self):
+        """Empty the index, it's loaded again on the next lookup"""
+        with self._update_lock, self._lock:
+            self._reset()
+
+    def schedule_refresh(self):
+        """Start a load or refresh in the background if one is due"""
+        now = time.monotonic()
+        if self.loaded and now < self._next_refresh:
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        if not self.loaded or now >= self._next_reload:
+            job = self.load
+        else:
+            job = self.refresh
+        if settings.AUTOCOMPLETE_ASYNC:
+            get_executor().submit(self._run, job)
+        else:
+            self._run(job, close_connections=False)
+
+    def _run(self, job, close_connections=True):
+        try:
+            job()
+        except Exception:
+            logger.exception('Failed to update the autocomplete index')
+        finally:
+            self._loading = False
+            if close_connections:
+                connections.close_all()
+
+
+index = TitleIndex()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the per-process thread updating the index"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='autocomplete')
+        return _executor
+
+
+def index_movie(sender, instance, **kwargs):
+    """Signal receiver adding a saved movie once committed"""
+    if index.loaded:
+        transaction.on_commit(lambda: index.upsert(
+            instance.pk, instance.title, instance.rating_count
+        ))
+
+
+def unindex_movie(sender, instance, **kwargs):
+    """Signal receiver dropping a deleted movie once committed"""
+    if index.loaded:
+        movie_id = instance.pk
+        transaction.on_commit(lambda: index.remove(movie_id))
@@ -0,0 +1,97 @@
+"""
+Bulk rating creation for the rating API
+"""
+from django.db import transaction
+from django.utils.translation import gettext as _
+
+from core.models import (Movie,
+                         Rating)
+
+DESCRIPTION_MAX_LENGTH = Rating._meta.get_field('description').max_length
+
+
+def validate_ratings(items):
+    """Validate rating payloads in one pass.
+
+    Field checks are plain Python per item and every referenced movie is
+    checked with a single query, instead of running a serializer (and a
+    query) per rating. Returns the cleaned valid items as (index, data)
+    pairs and a dict of errors keyed by item index.
+    """
+    valid = []
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'non_field_errors': [_('Expected an object.')]}
+            continue
+
+        item_errors = {}
+        rating = item.get('rating')
+        if rating is None:
+            item_errors['rating'] = [_('This field is required.')]
+        elif isinstance(rating, bool) or not isinstance(rating, (int, float, str)):
+            item_errors['rating'] = [_('A valid number is required.')]
+        else:
+            try:
+                rating = float(rating)
+            except ValueError:
+                item_errors['rating'] = [_('A valid number is required.')]
+            else:
+                if not 0.0 <= rating <= 5.0:
+                    item_errors['rating'] = [
+                        _('Ensure this value is between 0 and 5.')
+                    ]
+
+        description = item.get('description')
+        if not isinstance(description, str) or not description.strip():
+            item_errors['description'] = [_('This field is required.')]
+        elif len(description) > DESCRIPTION_MAX_LENGTH:
+            item_errors['description'] = [
+                _('Ensure this field has no more than %d characters.')
+                % DESCRIPTION_MAX_LENGTH
+            ]
+
+        movie = item.get('movie')
+        if movie is not None and (isinstance(movie, bool) or
+                                  not isinstance(movie, int)):
+            item_errors['movie'] = [_('A valid integer is required.')]
+
+        if item_errors:
+            errors[index] = item_errors
+        else:
+            valid.append((index, {'rating': rating,
+                                  'description': description,
+                                  'movie': movie}))
+
+    movie_ids = {data['movie'] for index, data in valid if data['movie']}
+    if movie_ids:
+        existing = set(Movie.objects.filter(pk__in=movie_ids)
+                       .values_list('pk', flat=True))
+        missing = movie_ids - existing
+        if missing:
+            for index, data in valid:
+                if data['movie'] in missing:
+                    errors[index] = {'movie': [_('Movie does not exist.')]}
+            valid = [(index, data) for index, data in valid
+                     if index not in errors]
+    return valid, errors
+
+
+@transaction.atomic
+def create_ratings(user, valid):
+    """Insert validated ratings and fold them into their movies' aggregates"""
+    ratings = Rating.objects.bulk_create(
+        Rating(user=user, movie_id=data['movie'], rating=data['rating'],
+               description=data['description'])
+        for index, data in valid
+    )
+    changes = {}
+    for rating in ratings:
+        if rating.movie_id:
+            changes.setdefault(rating.movie_id, ([], []))[0].append(
+                rating.rating
+            )
+    Movie.objects.apply_rating_changes(changes, created={
+        movie_id: len(added) for movie_id, (added, removed) in changes.items()
+    })
+    return ratings
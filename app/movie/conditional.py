@@ -0,0 +1,153 @@
+"""
+Conditional GET (ETag / Last-Modified) support for the movie APIs
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """Answer list and retrieve from version columns before serializing.
+
+    Validators are derived from each row's `version_field` timestamp, so a
+    matching `If-None-Match` (or, for a single object, `If-Modified-Since`)
+    gets a 304 after the one query that loads the rows and before any
+    related data is fetched or anything is serialized. Views load that
+    related data in `prepare_instances`. List rows may also be `.values()`
+    dicts, which must include the primary key and `version_field`.
+
+    The mixin replaces `list` and `retrieve`, and so routes both: views
+    must only use it with the ListModelMixin and RetrieveModelMixin
+    actions they expose. Each format of a resource gets its own ETag.
+    """
+    version_field = 'updated'
+
+    def prepare_instances(self, instances):
+        """Hook to fetch related data once a full response is needed"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        instances = list(queryset) if page is None else page
+
+        etag, last_modified = self.get_list_validators(request, instances)
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, last_modified)
+
+        self.prepare_instances(instances)
+        return self.set_validators(self.get_list_response(instances, page),
+                                   etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+
+        etag, last_modified = self.get_detail_validators(instance)
+        not_modified = self.get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, last_modified)
+
+        self.prepare_instances([instance])
+        serializer = self.get_serializer(instance)
+        return self.set_validators(Response(serializer.data),
+                                   etag, last_modified)
+
+    async def aprepare_instances(self, instances):
+        """Async counterpart of prepare_instances"""
+
+    async def alist(self, request, *args, **kwargs):
+        """Async counterpart of list, for views served under ASGI"""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is None:
+            instances = [instance async for instance in queryset]
+        else:
+            instances = page
+
+        etag, last_modified = self.get_list_validators(request, instances)
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, last_modified)
+
+        await self.aprepare_instances(instances)
+        return self.set_validators(self.get_list_response(instances, page),
+                                   etag, last_modified)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Async counterpart of retrieve, for views served under ASGI"""
+        instance = await self.aget_object()
+
+        etag, last_modified = self.get_detail_validators(instance)
+        not_modified = self.get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, last_modified)
+
+        await self.aprepare_instances([instance])
+        serializer = self.get_serializer(instance)
+        return self.set_validators(Response(serializer.data),
+                                   etag, last_modified)
+
+    def get_list_response(self, instances, page):
+        serializer = self.get_serializer(instances, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    def get_detail_validators(self, instance):
+        """Return the (etag, last modified) pair for a single object"""
+        last_modified = getattr(instance, self.version_field)
+        etag = self.make_etag(
+            f'{instance._meta.label}:{instance.pk}:{last_modified.isoformat()}'
+        )
+        return etag, last_modified
+
+    def get_list_validators(self, request, instances):
+        """Return the (etag, last modified) pair for a list page.
+
+        The ETag covers the query string, every row's id and version and
+        the pagination links, so inserts, updates and deletes that touch
+        the page all change it.
+        """
+        parts = [request.get_full_path()]
+        versions = [self.get_version(instance) for instance in instances]
+        parts.extend(f'{pk}:{version.isoformat()}' for pk, version in versions)
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_next_link'):
+            parts.append(str(paginator.get_next_link()))
+            parts.append(str(paginator.get_previous_link()))
+        last_modified = max((version for pk, version in versions),
+                            default=None)
+        return self.make_etag('\n'.join(parts)), last_modified
+
+    def get_version(self, instance):
+        """Return the (pk, version) pair of an instance or `.values()` row"""
+        if isinstance(instance, dict):
+            return instance['id'], instance[self.version_field]
+        return instance.pk, getattr(instance, self.version_field)
+
+    def make_etag(self, value):
+        # The JSON and browsable renderings of a page are different bytes
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        if renderer is not None:
+            value = f'{renderer.format}\n{value}'
+        return quote_etag(hashlib.sha256(value.encode()).hexdigest()[:32])
+
+    def get_not_modified(self, request, etag, last_modified=None):
+        """Return a 304 response if the client's copy is current.
+
+        `If-Modified-Since` is only honoured for single objects: a list's
+        newest timestamp doesn't move when a row is deleted.
+        """
+        return get_conditional_response(
+            request._request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()),
+        )
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
@@ -0,0 +1,126 @@
+"""
+Query parameter filters for the movie and rating list APIs
+"""
+from datetime import date
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+TRUE_VALUES = ('1', 'true')
+FALSE_VALUES = ('0', 'false')
+
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+
+def parse_rating(value):
+    rating = float(value)
+    if not 0.0 <= rating <= 5.0:
+        raise ValueError
+    return rating
+
+
+def parse_boolean(value):
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError
+
+
+def parse_id(value):
+    pk = int(value)
+    if pk < 1:
+        raise ValueError
+    return pk
+
+
+class QueryParameterFilterBackend(BaseFilterBackend):
+    """Filter on the query parameters declared in `filters`"""
+    # query parameter -> (lookup, parser, schema type, description)
+    filters = {}
+
+    def get_filters(self, request):
+        """Return the ORM lookups for the request's filter parameters"""
+        lookups = {}
+        errors = {}
+        for param, (lookup, parser, schema_type, description) in \
+                self.filters.items():
+            value = request.query_params.get(param)
+            if value is None or value == '':
+                continue
+            try:
+                lookups[lookup] = parser(value)
+            except ValueError:
+                errors[param] = [_('Enter a valid value.')]
+        if errors:
+            raise ValidationError(errors)
+        return lookups
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.filter(**self.get_filters(request))
+
+    def get_schema_operation_parameters(self, view):
+        parameters = []
+        for param, (lookup, parser, schema_type, description) in \
+                self.filters.items():
+            if schema_type == 'date':
+                schema = {'type': 'string', 'format': 'date'}
+            else:
+                schema = {'type': schema_type}
+            parameters.append({
+                'name': param,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': schema,
+            })
+        return parameters
+
+
+class MovieFilterBackend(QueryParameterFilterBackend):
+    """Filter movies by release date range, status, mean rating and owner.
+
+    Every filter maps to a column covered by an index on `core.Movie`
+    (see its `Meta.indexes`), alone or combined with the keyset ordering,
+    so filtered pages never fall back to a sequential scan.
+    """
+    filters = {
+        'released_after': ('released_date__gte', parse_date, 'date',
+                           'Only movies released on or after this date.'),
+        'released_before': ('released_date__lte', parse_date, 'date',
+                            'Only movies released on or before this date.'),
+        'is_active': ('is_active', parse_boolean, 'boolean',
+                      'Only active (true) or inactive (false) movies.'),
+        'min_rating': ('rating_mean__gte', parse_rating, 'number',
+                       'Only movies with at least this mean rating.'),
+        'max_rating': ('rating_mean__lte', parse_rating, 'number',
+                       'Only movies with at most this mean rating.'),
+        'user': ('user_id', parse_id, 'integer',
+                 'Only movies owned by this user id.'),
+    }
+
+
+class RatingFilterBackend(QueryParameterFilterBackend):
+    """Filter ratings by movie and author, the caller's own by default.
+
+    Both filters are backed by an (column, id) index on `core.Rating`, so
+    a page costs the same whatever the size of the table.
+    """
+    filters = {
+        'movie': ('movie_id', parse_id, 'integer',
+                  'Only ratings of this movie id, by any user unless '
+                  '`user` is also given.'),
+        'user': ('user_id', parse_id, 'integer',
+                 'Only ratings by this user id. Without `movie` or '
+                 '`user` the caller\'s own ratings are listed.'),
+    }
+
+    def get_filters(self, request):
+        lookups = super().get_filters(request)
+        if not lookups:
+            lookups['user_id'] = request.user.pk
+        return lookups
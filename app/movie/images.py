@@ -0,0 +1,121 @@
+"""
+Background generation of resized movie image variants
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from core.models import Movie
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes (width, height) each variant is scaled down to fit in
+VARIANT_SIZES = {
+    'thumbnail': (160, 240),
+    'small': (320, 480),
+    'medium': (780, 1170),
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def supported_formats():
+    """Return the variant formats the installed Pillow can encode"""
+    return [extension for extension in FORMATS if features.check(extension)]
+
+
+def variant_name(image_name, size, extension):
+    """Return the storage name of an image variant"""
+    stem = os.path.splitext(image_name)[0]
+    return f'{stem}_{size}.{extension}'
+
+
+def get_executor():
+    """Return the per-process worker pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def render_variants(source):
+    """Yield (size, extension, bytes) for every variant of an image file"""
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for size, box in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(box, Image.Resampling.LANCZOS)
+            for extension in supported_formats():
+                output = io.BytesIO()
+                resized.save(output, **FORMATS[extension])
+                yield size, extension, output.getvalue()
+
+
+def generate_variants(movie_id, image_name, stale_variants=None):
+    """Render and store the variants of a movie image.
+
+    The movie is only updated if it still points at `image_name`, so a
+    newer upload finishing first is never overwritten.
+    """
+    try:
+        for name in (stale_variants or {}).values():
+            default_storage.delete(name)
+
+        variants = {}
+        with default_storage.open(image_name, 'rb') as source:
+            for size, extension, content in render_variants(source):
+                name = variant_name(image_name, size, extension)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                variants[f'{size}_{extension}'] = default_storage.save(
+                    name, ContentFile(content)
+                )
+
+        updated = Movie.objects.filter(pk=movie_id, image=image_name).update(
+            image_variants=variants, updated=timezone.now()
+        )
+        if not updated:
+            for name in variants.values():
+                default_storage.delete(name)
+        return variants
+    except Exception:
+        logger.exception('Failed to generate image variants for movie %s',
+                         movie_id)
+        raise
+
+
+def _generate_in_worker(*args):
+    """Run generate_variants in a pool thread with its own DB connection"""
+    try:
+        return generate_variants(*args)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(movie_id, image_name, stale_variants=None):
+    """Generate variants in the worker pool, off the request thread"""
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        return generate_variants(movie_id, image_name, stale_variants)
+    return get_executor().submit(
+        _generate_in_worker, movie_id, image_name, stale_variants
+    )
@@ -0,0 +1,302 @@
+"""
+Pagination classes for the list APIs
+"""
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class LinkedPagination(BasePagination):
+    """Base for paginators returning `next`/`previous` links and results"""
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 200
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+
+class KeysetPagination(LinkedPagination):
+    """Paginate with opaque cursors over an (ordering field, id) keyset.
+
+    Each page is fetched with a `WHERE (field, id) > (value, id)` style
+    filter and a `LIMIT`, so the cost of a page doesn't depend on how deep
+    the client has paged and no `OFFSET` or `COUNT(*)` is ever issued.
+    Views choose the allowed orderings with `ordering_fields` and the
+    default with `ordering`.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering = 'id'
+    ordering_fields = ('id',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async counterpart of paginate_queryset"""
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([item async for item in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Return the query for the requested page plus one lookahead row"""
+        self.request = request
+        self.model = queryset.model
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.cursor = self.decode_cursor(request)
+
+        field, descending = self.ordering
+        reverse = bool(self.cursor and self.cursor['r'])
+        queryset = self.order_queryset(queryset, field, descending != reverse)
+        if self.cursor:
+            queryset = queryset.filter(self.position_filter(
+                queryset.model, field, descending != reverse,
+                self.cursor['v'], self.cursor['i']))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Trim the lookahead row off fetched results and record the page"""
+        reverse = bool(self.cursor and self.cursor['r'])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_schema_operation_parameters(self, view):
+        fields = getattr(view, 'ordering_fields', self.ordering_fields)
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.ordering_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Which field to use when ordering the results.',
+                'schema': {
+                    'type': 'string',
+                    'enum': [prefix + name for name in fields
+                             for prefix in ('', '-')],
+                },
+            },
+        ]
+
+    def get_ordering(self, request, view):
+        """Return the (field, descending) pair the page is ordered by"""
+        fields = getattr(view, 'ordering_fields', self.ordering_fields)
+        ordering = request.query_params.get(
+            self.ordering_query_param,
+            getattr(view, 'ordering', self.ordering)
+        )
+        field = ordering.lstrip('-')
+        if field not in fields:
+            msg = _('Ordering must be one of: %s') % ', '.join(fields)
+            raise ValidationError({self.ordering_query_param: [msg]})
+        return field, ordering.startswith('-')
+
+    def order_queryset(self, queryset, field, descending):
+        prefix = '-' if descending else ''
+        if field == 'id':
+            return queryset.order_by(prefix + 'id')
+        return queryset.order_by(prefix + field, prefix + 'id')
+
+    def position_filter(self, model, field, descending, value, pk):
+        """Return the filter selecting rows after the (value, pk) position"""
+        lookup = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{f'id__{lookup}': pk})
+        try:
+            value = model._meta.get_field(field).to_python(value)
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        # The leading bound lets the (field, id) index seek to the
+        # position, the OR alone makes it walk the index from the start
+        bound = 'lte' if descending else 'gte'
+        return Q(**{f'{field}__{bound}': value}) & (
+            Q(**{f'{field}__{lookup}': value}) |
+            Q(**{field: value, f'id__{lookup}': pk})
+        )
+
+    def get_position(self, item):
+        """Return the (value, pk) keyset position of a page item.
+
+        Items are model instances or `.values()` rows keyed by attname.
+        """
+        opts = self.model._meta
+        attname = opts.get_field(self.ordering[0]).attname
+        if isinstance(item, dict):
+            value, pk = item[attname], item[opts.pk.attname]
+        else:
+            value, pk = getattr(item, attname), item.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return value, pk
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, item, reverse):
+        value, pk = self.get_position(item)
+        payload = {'v': value, 'i': pk, 'r': reverse}
+        token = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode()
+        ).decode()
+        return replace_query_param(self.base_url,
+                                   self.cursor_query_param,
+                                   token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()))
+            if not {'v', 'i', 'r'} <= payload.keys():
+                raise ValueError
+            if not isinstance(payload['i'], int):
+                raise ValueError
+        except (TypeError, ValueError, AttributeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return payload
+
+
+class SearchPagination(LinkedPagination):
+    """Page through ranked search results by page number.
+
+    Ranked results have no stable keyset, so pages are windows into the
+    ranking. One extra row is fetched to know whether a next page exists,
+    so no `COUNT(*)` is needed.
+    """
+    page_query_param = 'page'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(
+                self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(_('Invalid page.'))
+
+        offset = (self.page_number - 1) * self.page_size
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        return results[:self.page_size]
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async counterpart of paginate_queryset.
+
+        Ranking runs raw SQL, which has no async API, so the window is
+        fetched in a worker thread.
+        """
+        return await sync_to_async(self.paginate_queryset)(
+            queryset, request, view
+        )
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.page_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'A page number within the results.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.page_query_param,
+                                   self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        if self.page_number == 2:
+            return remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(self.base_url, self.page_query_param,
+                                   self.page_number - 1)
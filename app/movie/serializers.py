@@ -1,47 +1,131 @@
 """
 Serializer for movie APIs
 """
+from core.instrumentation import InstrumentedSerializerMixin
 from core.models import (Movie,
                          Rating)
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-class RatingSerializer(serializers.ModelSerializer):
+class ValuesListSerializer(InstrumentedSerializerMixin,
+                           serializers.ListSerializer):
+    """List serializer that also accepts `.values()` rows.
+
+    Dict rows, keyed by field source, skip model instantiation and the
+    per-field attribute lookup: each readable field's `to_representation`
+    is applied to the row value directly, which gives the same output as
+    serializing instances. Nested list fields read their rows from the
+    row's list under the same key. Instances are serialized as usual.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        rows = data if isinstance(data, list) else list(data)
+        if not rows or not isinstance(rows[0], dict):
+            return [self.child.to_representation(item) for item in rows]
+
+        fields = [(field.field_name, field.source, field.to_representation)
+                  for field in self.child._readable_fields]
+        return [
+            {
+                name: None if row[source] is None else to_representation(
+                    row[source]
+                )
+                for name, source, to_representation in fields
+            }
+            for row in rows
+        ]
+
+
+def values_fields(serializer_class):
+    """Return the `.values()` keys a serializer's list output reads"""
+    return [field.source for field in serializer_class().fields.values()
+            if not field.write_only
+            and not isinstance(field, serializers.BaseSerializer)]
+
+
+class RatingSerializer(InstrumentedSerializerMixin,
+                       serializers.ModelSerializer):
     """Serializer for rating"""
     class Meta:
         model = Rating
         fields = ['id', 'rating']
         read_only_fields = ['id']
+        list_serializer_class = ValuesListSerializer
 
 class RatingDetailSerializer(RatingSerializer):
     """Serializer for rating detail view"""
     class Meta(RatingSerializer.Meta):
         fields = RatingSerializer.Meta.fields + ['description']
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(InstrumentedSerializerMixin,
+                      serializers.ModelSerializer):
     """Serializer for Movie"""
     ratings = RatingSerializer(many=True, required=False)
     class Meta:
         model = Movie
-        fields = ['id', 'title', 'is_active', 'released_date', 'ratings']
-        read_only_fields = ['id']
+        fields = ['id', 'title', 'is_active', 'released_date', 'ratings',
+                  'rating_count', 'rating_mean', 'rating_histogram']
+        read_only_fields = ['id', 'rating_count', 'rating_mean',
+                            'rating_histogram']
+        list_serializer_class = ValuesListSerializer
 
+    @transaction.atomic
     def create(self, validated_data):
+        """Create the movie and its ratings in a fixed number of queries"""
         ratings_data = validated_data.pop('ratings', [])
-        movie = Movie.objects.create(**validated_data)
-
-        for rating_data in ratings_data:
-            rating = Rating.objects.create(user=self.context['request'].user, **rating_data)
-            movie.ratings.add(rating)
+        movie = Movie(**validated_data)
+        movie.fold_ratings(
+            added=[rating_data['rating'] for rating_data in ratings_data]
+        )
+        if ratings_data:
+            movie.record_rating_activity(len(ratings_data), timezone.now())
+        movie.save()
 
+        user = self.context['request'].user
+        Rating.objects.bulk_create(
+            Rating(user=user, movie=movie, **rating_data)
+            for rating_data in ratings_data
+        )
         return movie
 
 
+class SimilarMovieSerializer(MovieSerializer):
+    """Serializer for a movie's precomputed neighbours"""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(MovieSerializer.Meta):
+        fields = MovieSerializer.Meta.fields + ['similarity']
+
+
+class MovieAutocompleteSerializer(serializers.Serializer):
+    """Serializer for title suggestions from the autocomplete index"""
+    id = serializers.IntegerField(read_only=True)
+    title = serializers.CharField(read_only=True)
+
+
 class MovieDetailSerializer(MovieSerializer):
     """Serializer for movie detail view"""
+    image_variants = serializers.SerializerMethodField()
+
     class Meta(MovieSerializer.Meta):
-        fields = MovieSerializer.Meta.fields + ['description', 'image']
+        fields = MovieSerializer.Meta.fields + ['description', 'image',
+                                                'image_variants']
+
+    def get_image_variants(self, movie) -> dict[str, str]:
+        """Return the URL of each generated image variant"""
+        request = self.context.get('request')
+        urls = {}
+        for name, path in movie.image_variants.items():
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
 
-class MovieImageSerializer(serializers.ModelSerializer):
+class MovieImageSerializer(InstrumentedSerializerMixin,
+                           serializers.ModelSerializer):
     """Serializers for uploading image to the movies"""
 
     class Meta:
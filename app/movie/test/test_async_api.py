@@ -0,0 +1,172 @@
+"""
+Test the async (ASGI) movie read views
+"""
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.test import TestCase
+from django.urls import resolve, reverse
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from datetime import date
+import json
+
+from core.models import (Movie,
+                         Rating)
+
+ASYNC_MOVIES_URL = reverse('movie:async-movie-list')
+ASYNC_SEARCH_URL = reverse('movie:async-movie-search')
+MOVIES_URL = reverse('movie:movie-list')
+
+
+def async_detail_url(movie_id):
+    """Get async movie detail url"""
+    return reverse('movie:async-movie-detail', args=[movie_id])
+
+
+def detail_url(movie_id):
+    """Get movie detail url"""
+    return reverse('movie:movie-detail', args=[movie_id])
+
+
+def create_movie(user, **params):
+    """Create and return a movie"""
+    defaults = {
+        'title':'Sample movie title',
+        'description':'Sample movie description',
+        'is_active':False,
+        'released_date':date(2014, 12, 2)
+    }
+    defaults.update(**params)
+
+    return Movie.objects.create(user=user, **defaults)
+
+
+class AsyncMovieApiTests(TestCase):
+    """Test the async movie reads match the sync API"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        for index in range(5):
+            movie = create_movie(self.user, title=f'Movie {index}',
+                                 is_active=index % 2 == 0)
+            rating = Rating.objects.create(user=self.user, rating=index,
+                                           description='desc')
+            movie.ratings.add(rating)
+        self.movie = Movie.objects.order_by('id').first()
+
+    def test_views_are_async(self):
+        """Test the views run as coroutines under ASGI"""
+        for url in (ASYNC_MOVIES_URL, ASYNC_SEARCH_URL,
+                    async_detail_url(self.movie.id)):
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_auth_required(self):
+        """Test unauthenticated and invalid tokens are rejected"""
+        res = await self.async_client.get(ASYNC_MOVIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+        res = await self.async_client.get(
+            ASYNC_MOVIES_URL, headers={'Authorization': 'Token invalid'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.json(), {'detail': 'Invalid token.'})
+
+    async def test_list_matches_sync_list(self):
+        """Test the async list pages the same results as the sync one"""
+        params = {'page_size': 2, 'ordering': '-id', 'is_active': 'true'}
+        res = await self.async_client.get(ASYNC_MOVIES_URL, params,
+                                          headers=self.auth)
+        expected = await self.sync_get(MOVIES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(res.json()['results'], expected['results'])
+
+        res = await self.async_client.get(res.json()['next'],
+                                          headers=self.auth)
+
+        self.assertEqual([movie['title'] for movie in res.json()['results']],
+                         ['Movie 0'])
+        self.assertIsNone(res.json()['next'])
+
+    async def test_detail_matches_sync_detail(self):
+        """Test the async detail returns the sync serializer output"""
+        res = await self.async_client.get(async_detail_url(self.movie.id),
+                                          headers=self.auth)
+        expected = await self.sync_get(detail_url(self.movie.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), expected)
+
+    async def test_detail_not_found(self):
+        """Test a missing movie is the sync views' 404"""
+        res = await self.async_client.get(async_detail_url(0),
+                                          headers=self.auth)
+        expected = await self.sync_get(detail_url(0))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(res.json(), expected)
+
+    async def test_content_negotiation(self):
+        """Test the async views render the formats the sync ones do"""
+        res = await self.async_client.get(
+            async_detail_url(self.movie.id),
+            headers=dict(self.auth, Accept='text/html')
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/html'))
+
+        res = await self.async_client.get(
+            ASYNC_MOVIES_URL, headers=dict(self.auth, Accept='text/csv')
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+    async def test_writes_not_allowed(self):
+        """Test the async views only read"""
+        res = await self.async_client.post(ASYNC_MOVIES_URL, {},
+                                           headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_conditional_get(self):
+        """Test a matching ETag gets a 304 from the async views"""
+        for url in (ASYNC_MOVIES_URL, async_detail_url(self.movie.id)):
+            res = await self.async_client.get(url, headers=self.auth)
+            res = await self.async_client.get(
+                url, headers=dict(self.auth, **{'If-None-Match': res['ETag']})
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_search(self):
+        """Test the async search ranks and validates like the sync one"""
+        res = await self.async_client.get(ASYNC_SEARCH_URL, {'q': 'movie 3'},
+                                          headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['results'][0]['title'], 'Movie 3')
+        self.assertEqual(res.json()['results'][0]['ratings'][0]['rating'], 3)
+
+        res = await self.async_client.get(ASYNC_SEARCH_URL, headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def sync_get(self, url, params=None):
+        """Return the sync API's JSON for the same request"""
+        res = await sync_to_async(self.client.get)(url, params)
+        return json.loads(res.content)
@@ -0,0 +1,209 @@
+"""
+Test the title autocomplete index and API
+"""
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from core.models import Movie
+from movie import autocomplete
+
+AUTOCOMPLETE_URL = reverse('movie:movie-autocomplete')
+
+
+def create_movie(user, **params):
+    """Create and return a movie"""
+    defaults = {
+        'title':'Sample movie title',
+        'description':'Sample movie description',
+        'is_active':False,
+        'released_date':date(2014, 12, 2)
+    }
+    defaults.update(**params)
+
+    return Movie.objects.create(user=user, **defaults)
+
+
+def titles(results):
+    return [result['title'] for result in results]
+
+
+@override_settings(AUTOCOMPLETE_ASYNC=False)
+class TitleIndexTests(TestCase):
+    """Test prefix lookups, ranking and updates of the index"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        autocomplete.index.clear()
+        self.addCleanup(autocomplete.index.clear)
+        self.index = autocomplete.index
+
+    def test_prefix_ranked_by_popularity(self):
+        """Test titles starting with the prefix, most rated first"""
+        create_movie(self.user, title='Star Trek', rating_count=5)
+        create_movie(self.user, title='Star Wars', rating_count=50)
+        create_movie(self.user, title='Stardust', rating_count=5)
+        create_movie(self.user, title='Lone Star', rating_count=100)
+
+        results = self.index.search('star', 10)
+
+        # Ties are broken by the shortest title
+        self.assertEqual(titles(results), ['Star Wars', 'Stardust',
+                                           'Star Trek'])
+        self.assertEqual(set(results[0]), {'id', 'title'})
+
+    def test_limit(self):
+        """Test only the most popular matches up to the limit are returned"""
+        for count in range(30):
+            create_movie(self.user, title=f'Movie {count}',
+                         rating_count=count)
+
+        results = self.index.search('movie', 3)
+
+        self.assertEqual(titles(results), ['Movie 29', 'Movie 28',
+                                           'Movie 27'])
+
+    def test_case_accents_and_spaces_ignored(self):
+        """Test the prefix matches whatever its case and accents"""
+        create_movie(self.user, title='Amélie')
+        create_movie(self.user, title='Le   Fabuleux Destin')
+
+        self.assertEqual(titles(self.index.search('AME', 10)), ['Amélie'])
+        self.assertEqual(titles(self.index.search('le fab', 10)),
+                         ['Le   Fabuleux Destin'])
+
+    def test_trailing_space_ends_word(self):
+        """Test a prefix ending with a space only matches whole words"""
+        create_movie(self.user, title='Star Wars')
+        create_movie(self.user, title='Stardust')
+
+        self.assertEqual(titles(self.index.search('star ', 10)),
+                         ['Star Wars'])
+
+    def test_lookup_without_queries(self):
+        """Test lookups don't query the database once loaded"""
+        create_movie(self.user, title='Heat')
+        self.index.search('h', 10)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(titles(self.index.search('he', 10)), ['Heat'])
+
+    def test_saves_and_deletes_applied(self):
+        """Test committed movie changes update a loaded index"""
+        movie = create_movie(self.user, title='Alien')
+        self.index.search('a', 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_movie(self.user, title='Aliens')
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.title = 'Heat'
+            movie.save()
+        self.assertEqual(titles(self.index.search('alien', 10)), ['Aliens'])
+        self.assertEqual(titles(self.index.search('heat', 10)), ['Heat'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.delete()
+        self.assertEqual(self.index.search('heat', 10), [])
+
+    def test_refresh_applies_updated_movies(self):
+        """Test movies updated without signals are picked up"""
+        movie = create_movie(self.user, title='Alien')
+        self.index.search('a', 10)
+        Movie.objects.filter(pk=movie.pk).update(
+            rating_count=3, title='Aliens',
+            updated=timezone.now() + timedelta(minutes=1)
+        )
+
+        self.index.refresh()
+
+        self.assertEqual(titles(self.index.search('alien', 10)), ['Aliens'])
+
+    def test_refresh_applies_one_batch(self):
+        """Test the updated movies are merged into the index at once"""
+        create_movie(self.user, title='Alien')
+        self.index.search('a', 10)
+        Movie.objects.update(updated=timezone.now() + timedelta(minutes=1))
+        create_movie(self.user, title='Aliens')
+        create_movie(self.user, title='Heat')
+
+        with patch.object(self.index, 'apply',
+                          wraps=self.index.apply) as apply:
+            self.index.refresh()
+
+        apply.assert_called_once()
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(titles(self.index.search('alien', 10)),
+                         ['Alien', 'Aliens'])
+
+    def test_apply_swaps_new_arrays(self):
+        """Test updates build new arrays, those lookups use stay intact"""
+        alien = create_movie(self.user, title='Alien')
+        heat = create_movie(self.user, title='Heat')
+        create_movie(self.user, title='Brazil')
+        self.index.search('a', 10)
+        keys, ids = self.index._keys, self.index._ids
+
+        self.index.apply([(alien.id, 'Zardoz', 1), (100, 'Alphaville', 2),
+                          (101, 'Heat', 0)], removed_ids=[heat.id])
+
+        self.assertEqual(keys, ['alien', 'brazil', 'heat'])
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(self.index._keys,
+                         ['alphaville', 'brazil', 'heat', 'zardoz'])
+        self.assertEqual(self.index._titles,
+                         ['Alphaville', 'Brazil', 'Heat', 'Zardoz'])
+        self.assertEqual(self.index._ids.tolist()[::2], [100, 101])
+        self.assertEqual(self.index._ids[-1], alien.id)
+        self.assertEqual(self.index._popularity.tolist(), [2, 0, 0, 1])
+
+
+@override_settings(AUTOCOMPLETE_ASYNC=False)
+class AutocompleteApiTests(TestCase):
+    """Test the autocomplete endpoint"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        autocomplete.index.clear()
+        self.addCleanup(autocomplete.index.clear)
+
+    def test_auth_required(self):
+        """Test auth is required for suggestions"""
+        res = APIClient().get(AUTOCOMPLETE_URL, {'q': 'heat'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_query_required(self):
+        """Test a blank prefix is rejected"""
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': '  '})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', res.data)
+
+    def test_suggestions(self):
+        """Test suggestions are served from the index without queries"""
+        heat = create_movie(self.user, title='Heat', rating_count=2)
+        create_movie(self.user, title='Heathers', rating_count=1)
+        create_movie(self.user, title='Alien')
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'h'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(AUTOCOMPLETE_URL,
+                                  {'q': 'hea', 'limit': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), [{'id': heat.id, 'title': 'Heat'}])
@@ -0,0 +1,160 @@
+"""
+Test conditional GET support on the movie and rating APIs
+"""
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from datetime import date
+
+from core.models import (Movie,
+                         Rating)
+
+MOVIES_URL = reverse('movie:movie-list')
+RATING_URL = reverse('movie:rating-list')
+
+
+def detail_url(movie_id):
+    """Get movie detail url"""
+    return reverse('movie:movie-detail', args=[movie_id])
+
+
+def create_movie(user, **params):
+    """Create and return a movie"""
+    defaults = {
+        'title':'Sample movie title',
+        'description':'Sample movie description',
+        'is_active':False,
+        'released_date':date(2014, 12, 2)
+    }
+    defaults.update(**params)
+
+    return Movie.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and Last-Modified handling"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        self.movie = create_movie(self.user)
+        rating = Rating.objects.create(user=self.user, rating=3.0,
+                                       description='desc')
+        self.movie.ratings.add(rating)
+        self.rating = rating
+
+    def test_detail_returns_validators(self):
+        """Test detail responses carry an ETag and Last-Modified"""
+        res = self.client.get(detail_url(self.movie.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', res)
+
+    def test_detail_not_modified_skips_ratings_query(self):
+        """Test a matching ETag returns 304 after a single query"""
+        etag = self.client.get(detail_url(self.movie.id))['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(detail_url(self.movie.id),
+                                  HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+
+    def test_detail_if_modified_since(self):
+        """Test If-Modified-Since on a detail returns 304"""
+        last_modified = self.client.get(
+            detail_url(self.movie.id))['Last-Modified']
+
+        res = self.client.get(detail_url(self.movie.id),
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_changes_with_ratings(self):
+        """Test changing a nested rating changes the movie ETag"""
+        etag = self.client.get(detail_url(self.movie.id))['ETag']
+
+        self.client.patch(reverse('movie:rating-detail',
+                                  args=[self.rating.id]), {'rating':4.0})
+        res = self.client.get(detail_url(self.movie.id),
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['ratings'][0]['rating'], 4.0)
+
+    def test_list_not_modified_skips_ratings_query(self):
+        """Test a matching list ETag returns 304 after a single query"""
+        etag = self.client.get(MOVIES_URL)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(MOVIES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+
+    def test_list_etag_changes_on_delete(self):
+        """Test deleting a movie on the page changes the list ETag"""
+        other = create_movie(self.user, title='Other')
+        etag = self.client.get(MOVIES_URL)['ETag']
+
+        other.delete()
+        res = self.client.get(MOVIES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_etag_depends_on_query(self):
+        """Test different orderings of the list get different ETags"""
+        create_movie(self.user, title='Other')
+
+        ascending = self.client.get(MOVIES_URL, {'ordering': 'id'})
+        descending = self.client.get(MOVIES_URL, {'ordering': '-id'})
+
+        self.assertNotEqual(ascending['ETag'], descending['ETag'])
+
+    def test_rating_list_not_modified(self):
+        """Test the rating list supports conditional requests"""
+        etag = self.client.get(RATING_URL)['ETag']
+
+        unchanged = self.client.get(RATING_URL, HTTP_IF_NONE_MATCH=etag)
+        self.rating.description = 'changed'
+        self.rating.save()
+        changed = self.client.get(RATING_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(unchanged.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_format(self):
+        """Test the JSON and browsable renderings get different ETags"""
+        for url in (MOVIES_URL, detail_url(self.movie.id)):
+            with self.subTest(url=url):
+                json_etag = self.client.get(url)['ETag']
+
+                res = self.client.get(url, HTTP_ACCEPT='text/html',
+                                      HTTP_IF_NONE_MATCH=json_etag)
+
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertNotEqual(res['ETag'], json_etag)
+
+    def test_rating_detail_not_modified(self):
+        """Test single ratings support conditional requests"""
+        url = reverse('movie:rating-detail', args=[self.rating.id])
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
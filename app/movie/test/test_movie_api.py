@@ -1,20 +1,44 @@
 """
 Test for Movie APIs
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from datetime import date
+from datetime import date, timedelta
+from unittest.mock import patch
+import json
+import os
+import tempfile
 
-from core.models import(Movie)
+from PIL import Image
+
+from core.models import(Movie, MovieSimilarity)
 
 from movie.serializers import (MovieSerializer)
 
 MOVIES_URL = reverse('movie:movie-list')
+EXPORT_URL = reverse('movie:movie-export')
+TOP_URL = reverse('movie:movie-top')
+TRENDING_URL = reverse('movie:movie-trending')
+
+def detail_url(movie_id):
+    """Get movie detail url"""
+    return reverse('movie:movie-detail', args=[movie_id])
+
+def similar_url(movie_id):
+    """Get similar movies url"""
+    return reverse('movie:movie-similar', args=[movie_id])
+
+def image_upload_url(movie_id):
+    """Get movie image upload url"""
+    return reverse('movie:movie-upload-image', args=[movie_id])
 
 def create_user(is_super=False,**params):
     details = {
@@ -98,3 +122,420 @@ class PrivateMovieApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_create_movie_with_ratings_sets_aggregates(self):
+        """Test nested ratings are folded into the movie aggregates"""
+        self.client.force_authenticate(self.admin_user)
+        payload = {
+            'title':'Sample movie title',
+            'description':'Sample movie description',
+            'is_active':True,
+            'released_date':'2014-12-02',
+            'ratings':[{'rating':1.0}, {'rating':4.0}, {'rating':4.5}]
+        }
+
+        res = self.client.post(MOVIES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        movie = Movie.objects.get(id=res.data['id'])
+        self.assertEqual(movie.rating_count, 3)
+        self.assertEqual(movie.rating_sum, 9.5)
+        self.assertAlmostEqual(movie.rating_mean, 9.5 / 3)
+        self.assertEqual(movie.rating_histogram, [0, 1, 0, 0, 2, 0])
+        self.assertEqual(res.data['rating_count'], 3)
+
+    def test_nested_create_query_count_is_bounded(self):
+        """Test nested ratings don't add queries per rating"""
+        self.client.force_authenticate(self.admin_user)
+        payload = {
+            'title':'Sample movie title',
+            'description':'Sample movie description',
+            'is_active':True,
+            'released_date':'2014-12-02',
+        }
+
+        query_counts = []
+        for rating_count in (1, 150):
+            payload['ratings'] = [{'rating':3.0}] * rating_count
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(MOVIES_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data['ratings']), rating_count)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_nested_create_is_atomic(self):
+        """Test a failing nested rating rolls the whole movie back"""
+        self.client.force_authenticate(self.admin_user)
+        payload = {
+            'title':'Sample movie title',
+            'description':'Sample movie description',
+            'is_active':True,
+            'released_date':'2014-12-02',
+            'ratings':[{'rating':3.0}],
+        }
+
+        with patch('movie.serializers.Rating.objects.bulk_create',
+                   side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post(MOVIES_URL, payload, format='json')
+
+        self.assertFalse(Movie.objects.exists())
+
+    def test_detail_exposes_rating_aggregates(self):
+        """Test the movie detail returns the rating aggregates"""
+        self.client.force_authenticate(self.regular_user)
+        movie = create_movie(self.admin_user)
+        Movie.objects.apply_rating_change([movie.id], added=[3.0, 5.0])
+
+        res = self.client.get(detail_url(movie.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['rating_count'], 2)
+        self.assertEqual(res.data['rating_mean'], 4.0)
+        self.assertEqual(res.data['rating_histogram'], [0, 0, 0, 1, 0, 1])
+
+
+class MoviePaginationTests(TestCase):
+    """Test keyset pagination of the movie list"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        for day in range(1, 8):
+            create_movie(self.user,
+                         title=f'Movie {day}',
+                         released_date=date(2020, 1, 8 - day))
+
+    def collect_pages(self, url):
+        """Follow next links and return the titles of every page"""
+        pages = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([movie['title'] for movie in res.data['results']])
+            url = res.data['next']
+        return pages
+
+    def test_list_is_paginated_by_id(self):
+        """Test pages follow the id ordering without overlaps"""
+        pages = self.collect_pages(f'{MOVIES_URL}?page_size=3')
+
+        self.assertEqual(pages, [
+            ['Movie 1', 'Movie 2', 'Movie 3'],
+            ['Movie 4', 'Movie 5', 'Movie 6'],
+            ['Movie 7'],
+        ])
+
+    def test_list_ordered_by_released_date(self):
+        """Test ordering by a non unique field keeps pages consistent"""
+        Movie.objects.filter(title__in=['Movie 2', 'Movie 3']).update(
+            released_date=date(2021, 1, 1)
+        )
+        pages = self.collect_pages(
+            f'{MOVIES_URL}?page_size=2&ordering=-released_date'
+        )
+
+        titles = [title for page in pages for title in page]
+        self.assertEqual(titles, [
+            'Movie 3', 'Movie 2', 'Movie 1', 'Movie 4',
+            'Movie 5', 'Movie 6', 'Movie 7',
+        ])
+
+    def test_previous_link_returns_previous_page(self):
+        """Test following the previous cursor returns the earlier page"""
+        first = self.client.get(f'{MOVIES_URL}?page_size=3')
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+
+        self.assertIsNone(first.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_pages_do_not_count_or_offset(self):
+        """Test deep pages are fetched without COUNT or OFFSET"""
+        first = self.client.get(f'{MOVIES_URL}?page_size=3')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_deep_pages_seek_the_index(self):
+        """Test a cursor page starts reading the index at its position"""
+        table = connection.ops.quote_name(Movie._meta.db_table)
+        for ordering in ('id', 'released_date', '-rating_mean', '-user'):
+            with self.subTest(ordering=ordering):
+                first = self.client.get(
+                    f'{MOVIES_URL}?page_size=3&ordering={ordering}'
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(first.data['next'])
+                sql = next(query['sql'] for query in queries.captured_queries
+                           if f'FROM {table}' in query['sql'])
+                column = Movie._meta.get_field(ordering.lstrip('-')).column
+
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'postgresql':
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+                        cursor.execute(f'EXPLAIN {sql}')
+                        plan = [row[0] for row in cursor.fetchall()]
+                        seeks = [line for line in plan
+                                 if 'Index Cond' in line and column in line]
+                    else:
+                        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                        plan = [row[-1] for row in cursor.fetchall()]
+                        # SQLite names the id column rowid
+                        seeks = [line for line in plan
+                                 if line.startswith('SEARCH')
+                                 and f'({column}' in line.replace('rowid',
+                                                                  'id')]
+                self.assertTrue(seeks, '\n'.join(plan))
+
+    def test_invalid_ordering_rejected(self):
+        """Test ordering by an unsupported field is a bad request"""
+        res = self.client.get(f'{MOVIES_URL}?ordering=title')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_cursor_not_found(self):
+        """Test a malformed cursor returns not found"""
+        res = self.client.get(f'{MOVIES_URL}?cursor=garbage')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImageUploadTests(TestCase):
+    """Test uploading movie images and generating variants"""
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        media_settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.addCleanup(self.media_root.cleanup)
+
+        self.client = APIClient()
+        self.user = create_user(is_super=True)
+        self.client.force_authenticate(self.user)
+        self.movie = create_movie(self.user)
+
+    def upload(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (1200, 1800), color='red').save(image_file,
+                                                            format='JPEG')
+            image_file.seek(0)
+            return self.client.post(image_upload_url(self.movie.id),
+                                    {'image': image_file},
+                                    format='multipart')
+
+    @override_settings(IMAGE_VARIANTS_ASYNC=False)
+    def test_upload_generates_variants(self):
+        """Test uploading an image stores resized variants"""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.movie.refresh_from_db()
+        self.assertTrue(os.path.exists(self.movie.image.path))
+        self.assertIn('thumbnail_webp', self.movie.image_variants)
+        thumbnail = os.path.join(self.media_root.name,
+                                 self.movie.image_variants['thumbnail_webp'])
+        with Image.open(thumbnail) as image:
+            self.assertEqual(image.size, (160, 240))
+
+        detail = self.client.get(detail_url(self.movie.id))
+        self.assertTrue(
+            detail.data['image_variants']['thumbnail_webp'].endswith('.webp')
+        )
+
+    def test_upload_returns_before_variants_exist(self):
+        """Test variants are scheduled after commit, not rendered inline"""
+        with patch('movie.images.schedule_variants') as schedule:
+            with self.captureOnCommitCallbacks() as callbacks:
+                res = self.upload()
+            schedule.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.movie.refresh_from_db()
+        schedule.assert_called_once_with(self.movie.id,
+                                         self.movie.image.name, {})
+        self.assertEqual(self.movie.image_variants, {})
+
+    @override_settings(IMAGE_VARIANTS_ASYNC=False)
+    def test_reupload_replaces_stale_variants(self):
+        """Test a new upload deletes the previous image's variants"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload()
+        self.movie.refresh_from_db()
+        old_variants = list(self.movie.image_variants.values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload()
+
+        for name in old_variants:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root.name, name))
+            )
+
+
+class ExportApiTests(TestCase):
+    """Test streaming the catalog as NDJSON"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        for index in range(3):
+            create_movie(self.user, title=f'Movie {index}')
+
+    def read_lines(self, res):
+        body = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_export_streams_ndjson(self):
+        """Test every movie is streamed as one JSON line"""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = self.read_lines(res)
+        self.assertEqual([line['title'] for line in lines],
+                         ['Movie 0', 'Movie 1', 'Movie 2'])
+        self.assertEqual(lines[0]['released_date'], '2014-12-02')
+        self.assertNotIn('rating_mean', lines[0])
+
+    def test_export_with_ratings(self):
+        """Test the rating aggregates are included on request"""
+        movie = Movie.objects.get(title='Movie 1')
+        Movie.objects.apply_rating_change([movie.id], added=[2.0, 4.0])
+
+        lines = self.read_lines(self.client.get(EXPORT_URL, {'ratings': 'true'}))
+
+        exported = next(line for line in lines if line['id'] == movie.id)
+        self.assertEqual(exported['rating_count'], 2)
+        self.assertEqual(exported['rating_mean'], 3.0)
+        self.assertEqual(exported['rating_histogram'], [0, 0, 1, 0, 1, 0])
+
+
+class LeaderboardApiTests(TestCase):
+    """Test the top rated and trending leaderboards"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def test_top_uses_bayesian_prior(self):
+        """Test a couple of perfect ratings don't beat many good ones"""
+        few = create_movie(self.user, title='Few')
+        many = create_movie(self.user, title='Many')
+        unrated = create_movie(self.user, title='Unrated')
+        Movie.objects.apply_rating_change([few.id], added=[5.0, 5.0])
+        Movie.objects.apply_rating_change([many.id], added=[4.5] * 50)
+
+        res = self.client.get(TOP_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['title'] for movie in res.data],
+                         ['Many', 'Few', 'Unrated'])
+        self.assertEqual(res.data[0]['rating_count'], 50)
+
+    def test_top_limit(self):
+        """Test the limit parameter is honoured and clamped"""
+        for index in range(3):
+            create_movie(self.user, title=f'Movie {index}')
+
+        self.assertEqual(len(self.client.get(TOP_URL, {'limit': 2}).data), 2)
+        self.assertEqual(len(self.client.get(TOP_URL, {'limit': 0}).data), 1)
+
+    def test_trending_favours_recent_activity(self):
+        """Test trending ranks recent ratings above older and stale ones"""
+        old = create_movie(self.user, title='Old')
+        recent = create_movie(self.user, title='Recent')
+        stale = create_movie(self.user, title='Stale')
+        create_movie(self.user, title='Unrated')
+        now = timezone.now()
+        with patch('django.utils.timezone.now',
+                   return_value=now - timedelta(hours=30)):
+            Movie.objects.apply_rating_change([old.id], added=[4.0, 4.0],
+                                              created=2)
+        with patch('django.utils.timezone.now',
+                   return_value=now - timedelta(days=30)):
+            Movie.objects.apply_rating_change([stale.id], added=[5.0] * 20,
+                                              created=20)
+        Movie.objects.apply_rating_change([recent.id], added=[3.0],
+                                          created=1)
+
+        res = self.client.get(TRENDING_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['title'] for movie in res.data],
+                         ['Recent', 'Old'])
+
+    def test_leaderboard_query_count(self):
+        """Test leaderboards are one query plus the ratings prefetch"""
+        for index in range(20):
+            movie = create_movie(self.user, title=f'Movie {index}')
+            movie.ratings.create(user=self.user, rating=3.0,
+                                 description='desc')
+            Movie.objects.apply_rating_change([movie.id], added=[3.0],
+                                              created=1)
+
+        for url in (TOP_URL, TRENDING_URL):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(url)
+            self.assertEqual(len(res.data), 10)
+            self.assertEqual(len(queries), 2)
+
+
+class SimilarMoviesApiTests(TestCase):
+    """Test reading the precomputed similar movies"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.movie = create_movie(self.user, title='Alien')
+        for rank, title in enumerate(['Aliens', 'Heat', 'Ronin']):
+            MovieSimilarity.objects.create(
+                movie=self.movie, neighbour=create_movie(self.user,
+                                                         title=title),
+                rank=rank, score=0.9 - rank * 0.1
+            )
+
+    def test_similar_movies(self):
+        """Test neighbours are returned best first with their scores"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(similar_url(self.movie.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['title'] for movie in res.data],
+                         ['Aliens', 'Heat', 'Ronin'])
+        self.assertAlmostEqual(res.data[1]['similarity'], 0.8)
+        self.assertEqual(res.data[0]['ratings'], [])
+        # The movie, its neighbours and their ratings
+        self.assertEqual(len(queries), 3)
+
+    def test_similar_movies_limit(self):
+        """Test the limit parameter is honoured"""
+        res = self.client.get(similar_url(self.movie.id), {'limit': 2})
+
+        self.assertEqual([movie['title'] for movie in res.data],
+                         ['Aliens', 'Heat'])
+
+    def test_not_computed(self):
+        """Test a movie without neighbours has no similar movies"""
+        other = create_movie(self.user, title='Other')
+
+        res = self.client.get(similar_url(other.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_unknown_movie(self):
+        """Test similar movies of a missing movie is a 404"""
+        res = self.client.get(similar_url(0))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
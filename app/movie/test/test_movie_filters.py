@@ -0,0 +1,365 @@
+"""
+Test filtering and ordering the movie and rating lists
+"""
+import json
+import re
+from base64 import urlsafe_b64encode
+from itertools import combinations
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from datetime import date
+
+from core.models import Movie, Rating
+
+MOVIES_URL = reverse('movie:movie-list')
+RATINGS_URL = reverse('movie:rating-list')
+
+# Every supported filter, as the query parameters that enable it
+FILTERS = {
+    'released': {'released_after': '2000-01-01',
+                 'released_before': '2010-12-31'},
+    'active': {'is_active': 'true'},
+    'inactive': {'is_active': 'false'},
+    'rating': {'min_rating': '3', 'max_rating': '4.5'},
+    'user': {'user': '1'},
+}
+ORDERINGS = ('id', 'released_date', 'rating_mean', 'user')
+
+
+def create_user(**params):
+    details = {
+        'username': 'username',
+        'email': 'user@example.com',
+        'password': 'test123'
+    }
+    details.update(**params)
+    return get_user_model().objects.create_user(**details)
+
+
+def create_movie(user, **params):
+    defaults = {
+        'title': 'Sample movie title',
+        'description': 'Sample movie description',
+        'is_active': True,
+        'released_date': date(2005, 6, 1),
+    }
+    defaults.update(**params)
+    return Movie.objects.create(user=user, **defaults)
+
+
+def filter_combinations():
+    """Yield the query parameters of every combination of filters"""
+    names = [name for name in FILTERS if name != 'inactive']
+    for size in range(len(names) + 1):
+        for combination in combinations(names, size):
+            params = {}
+            for name in combination:
+                params.update(FILTERS[name])
+            yield combination, params
+    yield ('inactive',), FILTERS['inactive']
+
+
+class MovieFilterApiTests(TestCase):
+    """Test the movie list filters"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.other_user = create_user(username='other',
+                                      email='other@example.com')
+        self.client.force_authenticate(self.user)
+
+    def titles(self, params):
+        res = self.client.get(MOVIES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [movie['title'] for movie in res.data['results']]
+
+    def test_filter_by_released_date_range(self):
+        """Test both ends of the release date range are inclusive"""
+        create_movie(self.user, title='Old', released_date=date(1999, 1, 1))
+        create_movie(self.user, title='Start', released_date=date(2000, 1, 1))
+        create_movie(self.user, title='End', released_date=date(2010, 1, 1))
+        create_movie(self.user, title='New', released_date=date(2011, 1, 1))
+
+        self.assertEqual(
+            self.titles({'released_after': '2000-01-01',
+                         'released_before': '2010-01-01'}),
+            ['Start', 'End']
+        )
+        self.assertEqual(self.titles({'released_after': '2010-06-01'}),
+                         ['New'])
+
+    def test_filter_by_is_active(self):
+        """Test active and inactive movies can be listed separately"""
+        create_movie(self.user, title='Active')
+        create_movie(self.user, title='Inactive', is_active=False)
+
+        self.assertEqual(self.titles({'is_active': 'true'}), ['Active'])
+        self.assertEqual(self.titles({'is_active': 'false'}), ['Inactive'])
+
+    def test_filter_by_mean_rating(self):
+        """Test the mean rating bounds"""
+        low = create_movie(self.user, title='Low')
+        high = create_movie(self.user, title='High')
+        create_movie(self.user, title='Unrated')
+        Movie.objects.apply_rating_change([low.id], added=[1.0, 2.0])
+        Movie.objects.apply_rating_change([high.id], added=[4.0])
+
+        self.assertEqual(self.titles({'min_rating': '1.5'}), ['Low', 'High'])
+        self.assertEqual(self.titles({'min_rating': '1', 'max_rating': '3'}),
+                         ['Low'])
+
+    def test_filter_by_owner(self):
+        """Test listing the movies of one user"""
+        create_movie(self.user, title='Mine')
+        create_movie(self.other_user, title='Theirs')
+
+        self.assertEqual(self.titles({'user': self.other_user.id}),
+                         ['Theirs'])
+
+    def test_filters_combine_with_ordering_and_cursors(self):
+        """Test filtered pages follow the requested ordering"""
+        for index in range(5):
+            create_movie(self.user, title=f'Movie {index}',
+                         released_date=date(2001 + index, 1, 1),
+                         is_active=index != 2)
+
+        res = self.client.get(MOVIES_URL, {'is_active': 'true',
+                                           'ordering': '-released_date',
+                                           'page_size': 2})
+        second = self.client.get(res.data['next'])
+
+        self.assertEqual([movie['title'] for movie in res.data['results']],
+                         ['Movie 4', 'Movie 3'])
+        self.assertEqual([movie['title'] for movie in second.data['results']],
+                         ['Movie 1', 'Movie 0'])
+        self.assertIsNone(second.data['next'])
+
+    def test_order_by_owner(self):
+        """Test ordering by owner then id"""
+        create_movie(self.other_user, title='Theirs')
+        create_movie(self.user, title='Mine')
+
+        self.assertEqual(self.titles({'ordering': 'user'}),
+                         ['Mine', 'Theirs'])
+        self.assertEqual(self.titles({'ordering': '-user'}),
+                         ['Theirs', 'Mine'])
+
+    def test_invalid_filter_values_rejected(self):
+        """Test malformed filter values are a bad request"""
+        for params in ({'released_after': 'yesterday'},
+                       {'is_active': 'maybe'},
+                       {'min_rating': '6'},
+                       {'max_rating': 'high'},
+                       {'user': '-1'}):
+            res = self.client.get(MOVIES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), res.data)
+
+
+class FilterIndexTestCase(TestCase):
+    """Check the queries of a list endpoint against the query planner"""
+    url = None
+    model = None
+    # Query parameter, `parameter=value` or `ordering=field` -> prefixes of
+    # the names of the indexes answering it
+    indexes = {}
+    # Filters applied when the request has none
+    default_filters = {}
+    # Ordering field -> value of the position cursors start after
+    cursor_values = {'id': 1}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_user())
+        if connection.vendor == 'postgresql':
+            # The test table is tiny, make the planner use an index if it can
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def list_query(self, params):
+        """Return the SQL the list endpoint runs to load its page"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        return next(query['sql'] for query in queries.captured_queries
+                    if f'FROM {table}' in query['sql'])
+
+    def cursor(self, params):
+        """Return a cursor for the page after a position in the ordering"""
+        field = params.get('ordering', 'id').lstrip('-')
+        payload = {'v': self.cursor_values[field], 'i': 1, 'r': False}
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def used_indexes(self, plan):
+        """Return the names of the indexes a plan reads"""
+        names = set()
+        for line in plan:
+            names.update(re.findall(
+                r'(?:Index Scan using|Index Only Scan using|'
+                r'Bitmap Index Scan on|USING INDEX|USING COVERING INDEX) '
+                r'"?(\w+)', line
+            ))
+            if 'USING INTEGER PRIMARY KEY' in line:
+                # SQLite's rowid, named like PostgreSQL's primary key index
+                names.add(f'{self.model._meta.db_table}_pkey')
+        return names
+
+    def expected_indexes(self, params):
+        """Return the prefixes of the index names that can answer `params`,
+        the indexes of its filters, or of its ordering"""
+        params = dict(params)
+        ordering = params.pop('ordering', 'id').lstrip('-')
+        filters = params or self.default_filters
+        prefixes = set()
+        for name, value in filters.items():
+            prefixes.update(self.indexes.get(name) or
+                            self.indexes[f'{name}={value}'])
+        if ordering != 'id' or not filters:
+            prefixes.update(self.indexes[f'ordering={ordering}'])
+        return prefixes
+
+    def assertUsesIndex(self, params):
+        plan = self.query_plan(self.list_query(params))
+        table = self.model._meta.db_table
+        unfiltered = not (set(params) - {'ordering'} or self.default_filters)
+        if (connection.vendor == 'sqlite' and unfiltered
+                and params.get('ordering', 'id').lstrip('-') == 'id'):
+            # SQLite tables are stored in id order, so an unfiltered scan
+            # is a walk of the primary key
+            self.assertEqual(plan, [f'SCAN {table}'])
+            return
+        self.assertAnsweredBy(params, plan)
+
+    def assertSeeksIndex(self, params):
+        """Check a cursor page starts reading an index at its position"""
+        params = dict(params, cursor=self.cursor(params))
+        plan = self.query_plan(self.list_query(params))
+        if connection.vendor == 'postgresql':
+            seeks = [line for line in plan if 'Index Cond' in line]
+        else:
+            seeks = [line for line in plan if line.startswith('SEARCH')]
+            self.assertFalse(
+                [line for line in plan if line.startswith('SCAN')],
+                f'{params} scans:\n' + '\n'.join(plan)
+            )
+        self.assertTrue(seeks, f'{params} seeks no index:\n'
+                        + '\n'.join(plan))
+        self.assertAnsweredBy(params, plan)
+
+    def assertAnsweredBy(self, params, plan):
+        params = {name: value for name, value in params.items()
+                  if name != 'cursor'}
+        used = self.used_indexes(plan)
+        expected = self.expected_indexes(params)
+        self.assertTrue(
+            any(name.startswith(prefix) for name in used
+                for prefix in expected),
+            f'{params} is not answered by any of {sorted(expected)}:\n'
+            + '\n'.join(plan)
+        )
+
+
+class MovieFilterIndexTests(FilterIndexTestCase):
+    """Test every filter combination is answered from an index"""
+    url = MOVIES_URL
+    model = Movie
+    indexes = {
+        'released_after': ('movie_released_date_id_idx',
+                           'movie_active_released_idx'),
+        'released_before': ('movie_released_date_id_idx',
+                            'movie_active_released_idx'),
+        'is_active=true': ('movie_active_',),
+        'is_active=false': ('movie_inactive_id_idx',),
+        'min_rating': ('movie_rating_mean_id_idx', 'movie_active_rating_idx'),
+        'max_rating': ('movie_rating_mean_id_idx', 'movie_active_rating_idx'),
+        # Or the foreign key index
+        'user': ('movie_user_id_idx', 'core_movie_user_id_'),
+        'ordering=id': ('core_movie_pkey',),
+        'ordering=released_date': ('movie_released_date_id_idx',
+                                   'movie_active_released_idx'),
+        'ordering=rating_mean': ('movie_rating_mean_id_idx',
+                                 'movie_active_rating_idx'),
+        'ordering=user': ('movie_user_id_idx',),
+    }
+    cursor_values = {'id': 1, 'released_date': '2005-06-01',
+                     'rating_mean': 3.0, 'user': 1}
+
+    def test_filter_combinations_use_indexes(self):
+        """Test no filter combination needs a sequential scan"""
+        for combination, params in filter_combinations():
+            with self.subTest(filters=combination):
+                self.assertUsesIndex(params)
+
+    def test_cursor_pages_seek_indexes(self):
+        """Test the pages after the first seek an index too"""
+        for params in ({}, {'movie': '1'}, {'user': '1'},
+                       {'movie': '1', 'user': '1'}):
+            with self.subTest(params=params):
+                self.assertSeeksIndex(params)
+
+    def test_orderings_use_indexes(self):
+        """Test every ordering, alone or with one filter, uses an index"""
+        for ordering in ORDERINGS:
+            for prefix in ('', '-'):
+                for name, params in [(None, {})] + list(FILTERS.items()):
+                    with self.subTest(ordering=prefix + ordering,
+                                      filters=name):
+                        self.assertUsesIndex(
+                            dict(params, ordering=prefix + ordering)
+                        )
+
+    def test_cursor_pages_seek_indexes(self):
+        """Test the pages after the first seek the index of every ordering,
+        alone or with one filter"""
+        for ordering in ORDERINGS:
+            for prefix in ('', '-'):
+                for name, params in [(None, {})] + list(FILTERS.items()):
+                    with self.subTest(ordering=prefix + ordering,
+                                      filters=name):
+                        self.assertSeeksIndex(
+                            dict(params, ordering=prefix + ordering)
+                        )
+
+
+class RatingFilterIndexTests(FilterIndexTestCase):
+    """Test the rating list is answered from an index, filtered or not"""
+    url = RATINGS_URL
+    model = Rating
+    indexes = {
+        'movie': ('rating_movie_id_idx', 'rating_movie_created_idx',
+                  'core_rating_movie_id_'),
+        'user': ('rating_user_id_idx', 'core_rating_user_id_'),
+    }
+    default_filters = {'user': '1'}
+
+    def test_rating_filters_use_indexes(self):
+        """Test the default scope and every filter avoid a table scan"""
+        for params in ({}, {'movie': '1'}, {'user': '1'},
+                       {'movie': '1', 'user': '1'}):
+            with self.subTest(params=params):
+                self.assertUsesIndex(params)
+
+    def test_cursor_pages_seek_indexes(self):
+        """Test the pages after the first seek an index too"""
+        for params in ({}, {'movie': '1'}, {'user': '1'},
+                       {'movie': '1', 'user': '1'}):
+            with self.subTest(params=params):
+                self.assertSeeksIndex(params)
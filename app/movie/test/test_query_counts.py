@@ -0,0 +1,104 @@
+"""
+Test the number of queries the movie and rating APIs issue
+"""
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from datetime import date, timedelta
+
+from core.models import (Movie,
+                         Rating)
+
+MOVIES_URL = reverse('movie:movie-list')
+RATING_URL = reverse('movie:rating-list')
+
+MOVIE_COUNT = 300
+RATINGS_PER_MOVIE = 3
+
+
+def detail_url(movie_id):
+    """Get movie detail url"""
+    return reverse('movie:movie-detail', args=[movie_id])
+
+
+class QueryCountTests(TestCase):
+    """Test endpoints run a bounded number of queries regardless of size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        movies = Movie.objects.bulk_create(
+            Movie(user=cls.user,
+                  title=f'Movie {index}',
+                  description='Sample movie description',
+                  released_date=date(2000, 1, 1) + timedelta(days=index))
+            for index in range(MOVIE_COUNT)
+        )
+        Rating.objects.bulk_create(
+            Rating(user=cls.user,
+                   movie=movie,
+                   rating=index % 6,
+                   description='Sample rating')
+            for movie in movies
+            for index in range(RATINGS_PER_MOVIE)
+        )
+        cls.movie = movies[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertMaxQueries(self, ceiling, url):
+        """Request url and assert it ran at most `ceiling` queries"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(
+            len(queries), ceiling,
+            '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        return res
+
+    def test_movie_list_query_ceiling(self):
+        """Test the movie list fetches ratings in a single extra query"""
+        res = self.assertMaxQueries(2, f'{MOVIES_URL}?page_size=200')
+
+        self.assertEqual(len(res.data['results']), 200)
+        self.assertTrue(all(
+            len(movie['ratings']) == RATINGS_PER_MOVIE
+            for movie in res.data['results']
+        ))
+
+    def test_movie_list_deep_page_query_ceiling(self):
+        """Test later pages cost the same number of queries"""
+        first = self.client.get(f'{MOVIES_URL}?page_size=200')
+
+        self.assertMaxQueries(2, first.data['next'])
+
+    def test_movie_list_ordered_query_ceiling(self):
+        """Test ordered lists keep the same query ceiling"""
+        for ordering in ('-released_date', 'rating_mean'):
+            self.assertMaxQueries(
+                2, f'{MOVIES_URL}?page_size=200&ordering={ordering}'
+            )
+
+    def test_movie_detail_query_ceiling(self):
+        """Test the movie detail fetches ratings in a single extra query"""
+        res = self.assertMaxQueries(2, detail_url(self.movie.id))
+
+        self.assertEqual(len(res.data['ratings']), RATINGS_PER_MOVIE)
+
+    def test_rating_list_query_ceiling(self):
+        """Test the rating list is a single query"""
+        self.assertMaxQueries(1, f'{RATING_URL}?page_size=200')
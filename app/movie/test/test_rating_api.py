@@ -17,6 +17,7 @@ from movie.serializers import (MovieSerializer,
                                RatingSerializer)
 
 RATING_URL = reverse('movie:rating-list')
+BULK_RATING_URL = reverse('movie:rating-bulk')
 
 def detail_url(rating_id):
     """Get detail url"""
@@ -64,20 +65,60 @@ class PrivateApiTest(TestCase):
         self.user = create_user()
         self.client.force_authenticate(user=self.user)
 
-    def test_ratings_are_not_limitted_to_user(self):
-        """Test anyone can see the rating"""
+    def test_ratings_limited_to_user_by_default(self):
+        """Test the list only has the caller's ratings without filters"""
         user2 = create_user(username='user2', email='user2@example.com')
         Rating.objects.create(user=user2,
                               rating=2.2,
                               description='Test desc')
-        Rating.objects.create(user=self.user,
-                              rating=2.2,
-                              description='Test desc')
+        rating = Rating.objects.create(user=self.user,
+                                       rating=2.2,
+                                       description='Test desc')
 
         res = self.client.get(RATING_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [rating.id])
+
+    def test_filter_ratings_by_movie_and_user(self):
+        """Test anyone's ratings can be listed by movie and by user"""
+        user2 = create_user(username='user2', email='user2@example.com')
+        movie = create_movie(self.user)
+        other_movie = create_movie(self.user)
+        theirs = Rating.objects.create(user=user2, movie=movie, rating=1.0,
+                                       description='Theirs')
+        mine = Rating.objects.create(user=self.user, movie=movie, rating=2.0,
+                                     description='Mine')
+        elsewhere = Rating.objects.create(user=user2, movie=other_movie,
+                                          rating=3.0, description='Other')
+
+        cases = [
+            ({'movie': movie.id}, [theirs, mine]),
+            ({'user': user2.id}, [theirs, elsewhere]),
+            ({'movie': movie.id, 'user': user2.id}, [theirs]),
+        ]
+        for params, expected in cases:
+            with self.subTest(params=params):
+                res = self.client.get(RATING_URL, params)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertEqual([item['id'] for item in res.data['results']],
+                                 [rating.id for rating in expected])
+
+        res = self.client.get(RATING_URL, {'movie': 'abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('movie', res.data)
+
+    def test_other_users_rating_still_readable(self):
+        """Test scoping the list doesn't hide single ratings"""
+        user2 = create_user(username='user2', email='user2@example.com')
+        rating = Rating.objects.create(user=user2, rating=2.2,
+                                       description='Test desc')
+
+        res = self.client.get(detail_url(rating.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], rating.id)
 
     def test_update_rating(self):
         """Test updating rating"""
@@ -117,3 +158,96 @@ class PrivateApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
         ratings = Rating.objects.all().filter(user=user)
         self.assertEqual(len(ratings), 1)
+
+    def test_update_rating_refreshes_movie_aggregates(self):
+        """Test updating a rating updates its movie's aggregates"""
+        movie = create_movie(self.user)
+        rating = Rating.objects.create(user=self.user,
+                                       rating=1.5,
+                                       description='description')
+        movie.ratings.add(rating)
+        Movie.objects.apply_rating_change([movie.id], added=[rating.rating],
+                                          created=1)
+        trending_score = Movie.objects.get(pk=movie.pk).trending_score
+
+        res = self.client.patch(detail_url(rating.id), {'rating': 4.5})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        movie.refresh_from_db()
+        self.assertEqual(movie.rating_count, 1)
+        self.assertEqual(movie.rating_mean, 4.5)
+        self.assertEqual(movie.rating_histogram, [0, 0, 0, 0, 1, 0])
+        # An edit isn't new activity
+        self.assertEqual(movie.trending_score, trending_score)
+
+    def test_delete_rating_refreshes_movie_aggregates(self):
+        """Test deleting a rating removes it from its movie's aggregates"""
+        movie = create_movie(self.user)
+        ratings = [
+            Rating.objects.create(user=self.user, rating=value,
+                                  description='description')
+            for value in (2.0, 5.0)
+        ]
+        movie.ratings.add(*ratings)
+        Movie.objects.apply_rating_change([movie.id], added=[2.0, 5.0])
+
+        res = self.client.delete(detail_url(ratings[0].id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        movie.refresh_from_db()
+        self.assertEqual(movie.rating_count, 1)
+        self.assertEqual(movie.rating_sum, 5.0)
+        self.assertEqual(movie.rating_mean, 5.0)
+        self.assertEqual(movie.rating_histogram, [0, 0, 0, 0, 0, 1])
+
+    def test_bulk_create_ratings(self):
+        """Test creating many ratings in one request"""
+        movie = create_movie(self.user)
+        payload = [
+            {'rating':index % 6, 'description':f'Rating {index}',
+             'movie':movie.id}
+            for index in range(1000)
+        ]
+
+        res = self.client.post(BULK_RATING_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['results']), 1000)
+        self.assertTrue(all(result['status'] == 'created'
+                            for result in res.data['results']))
+        self.assertEqual(Rating.objects.filter(user=self.user).count(), 1000)
+        movie.refresh_from_db()
+        self.assertEqual(movie.rating_count, 1000)
+        self.assertEqual(movie.ratings.count(), 1000)
+        self.assertEqual(movie.rating_histogram, [167, 167, 167, 167, 166, 166])
+        self.assertIsNotNone(movie.trending_score)
+
+    def test_bulk_create_reports_per_item_errors(self):
+        """Test invalid items are reported and valid ones still created"""
+        payload = [
+            {'rating':4, 'description':'Valid'},
+            {'rating':7, 'description':'Too high'},
+            {'description':'Missing rating'},
+            {'rating':2, 'description':'Unknown movie', 'movie':999999},
+            'not an object',
+        ]
+
+        res = self.client.post(BULK_RATING_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        results = res.data['results']
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertTrue(Rating.objects.filter(id=results[0]['id']).exists())
+        self.assertIn('rating', results[1]['errors'])
+        self.assertIn('rating', results[2]['errors'])
+        self.assertIn('movie', results[3]['errors'])
+        self.assertIn('non_field_errors', results[4]['errors'])
+        self.assertEqual(Rating.objects.count(), 1)
+
+    def test_bulk_create_requires_list(self):
+        """Test the bulk endpoint rejects a non list body"""
+        res = self.client.post(BULK_RATING_URL,
+                               {'rating':1, 'description':'desc'},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
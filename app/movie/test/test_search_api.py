@@ -0,0 +1,112 @@
+"""
+Test the movie search API
+"""
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from datetime import date
+
+from core.models import Movie
+
+SEARCH_URL = reverse('movie:movie-search')
+
+
+def create_movie(user, **params):
+    """Create and return a movie"""
+    defaults = {
+        'title':'Sample movie title',
+        'description':'Sample movie description',
+        'is_active':False,
+        'released_date':date(2014, 12, 2)
+    }
+    defaults.update(**params)
+
+    return Movie.objects.create(user=user, **defaults)
+
+
+class PublicSearchApiTests(TestCase):
+    """Test unauthenticated search requests"""
+    def test_auth_required(self):
+        """Test auth is required to search"""
+        res = APIClient().get(SEARCH_URL, {'q': 'matrix'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSearchApiTests(TestCase):
+    """Test authenticated search requests"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def titles(self, res):
+        return [movie['title'] for movie in res.data['results']]
+
+    def test_query_required(self):
+        """Test searching without a query is a bad request"""
+        res = self.client.get(SEARCH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_title_match_ranks_above_description_match(self):
+        """Test title matches are ranked above description matches"""
+        create_movie(self.user, title='Heat',
+                     description='A heist thriller about a robbery')
+        create_movie(self.user, title='The Heist',
+                     description='Crew plans one last job')
+        create_movie(self.user, title='Up', description='Balloons')
+
+        res = self.client.get(SEARCH_URL, {'q': 'heist'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.titles(res), ['The Heist', 'Heat'])
+
+    def test_all_terms_must_match(self):
+        """Test multi word queries match movies containing every term"""
+        create_movie(self.user, title='Space Odyssey', description='Monolith')
+        create_movie(self.user, title='Space Jam', description='Basketball')
+
+        res = self.client.get(SEARCH_URL, {'q': 'space basketball'})
+
+        self.assertEqual(self.titles(res), ['Space Jam'])
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test the index is updated incrementally on save and delete"""
+        movie = create_movie(self.user, title='Alien', description='Ripley')
+        create_movie(self.user, title='Aliens', description='Ripley returns')
+
+        movie.title = 'Prometheus'
+        movie.save()
+        Movie.objects.filter(title='Aliens').delete()
+
+        self.assertEqual(
+            self.titles(self.client.get(SEARCH_URL, {'q': 'prometheus'})),
+            ['Prometheus']
+        )
+        self.assertEqual(
+            self.titles(self.client.get(SEARCH_URL, {'q': 'aliens'})),
+            []
+        )
+
+    def test_results_paginated(self):
+        """Test search results are paginated without a count"""
+        for index in range(5):
+            create_movie(self.user, title=f'Batman {index}')
+
+        first = self.client.get(SEARCH_URL, {'q': 'batman', 'page_size': 3})
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(len(first.data['results']), 3)
+        self.assertIsNone(first.data['previous'])
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertIsNone(second.data['next'])
+        self.assertIsNotNone(second.data['previous'])
@@ -0,0 +1,87 @@
+"""
+Test serializing movies and ratings from .values() rows
+"""
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from rest_framework.test import APIClient
+
+from datetime import date
+from unittest.mock import patch
+
+from core.models import (Movie,
+                         Rating)
+from core.renderers import OrjsonRenderer
+from movie.serializers import (MovieSerializer,
+                               RatingSerializer,
+                               values_fields)
+from movie.views import attach_rating_values, ratings_prefetch
+
+MOVIES_URL = reverse('movie:movie-list')
+RATING_URL = reverse('movie:rating-list')
+
+
+class ValuesListSerializerTests(TestCase):
+    """Test `.values()` rows serialize exactly like model instances"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='username',
+            email='user@example.com',
+            password='test123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        titles = ['Am\u00e9lie', 'Line\u2028break', 'Rated']
+        for index, title in enumerate(titles):
+            movie = Movie.objects.create(user=self.user,
+                                         title=title,
+                                         description='desc',
+                                         is_active=index % 2 == 0,
+                                         released_date=date(2001, 4, index + 1))
+            values = [] if index == 1 else [0.1, 4.0, 5.0][:index + 1]
+            for value in values:
+                movie.ratings.add(Rating.objects.create(
+                    user=self.user, rating=value, description='desc'
+                ))
+            Movie.objects.apply_rating_change([movie.id], added=values)
+
+    def render(self, serializer):
+        return OrjsonRenderer().render(serializer.data)
+
+    def test_movie_rows_match_instances(self):
+        """Test movie rows with nested ratings render identical bytes"""
+        instances = list(Movie.objects.order_by('id')
+                         .prefetch_related(ratings_prefetch()))
+        rows = list(Movie.objects.order_by('id')
+                    .values(*values_fields(MovieSerializer)))
+        attach_rating_values(rows)
+
+        self.assertEqual(self.render(MovieSerializer(rows, many=True)),
+                         self.render(MovieSerializer(instances, many=True)))
+
+    def test_rating_rows_match_instances(self):
+        """Test rating rows render identical bytes"""
+        instances = Rating.objects.order_by('id')
+        rows = instances.values(*values_fields(RatingSerializer))
+
+        self.assertEqual(self.render(RatingSerializer(rows, many=True)),
+                         self.render(RatingSerializer(instances, many=True)))
+
+    def test_list_endpoints_build_no_model_instances(self):
+        """Test the movie and rating lists serialize straight from rows"""
+        expected = {
+            MOVIES_URL: MovieSerializer(
+                Movie.objects.order_by('id')
+                .prefetch_related(ratings_prefetch()), many=True
+            ).data,
+            RATING_URL: RatingSerializer(Rating.objects.order_by('id'),
+                                         many=True).data,
+        }
+
+        for url, data in expected.items():
+            with patch.object(Movie, 'from_db', side_effect=AssertionError), \
+                    patch.object(Rating, 'from_db', side_effect=AssertionError):
+                res = self.client.get(url)
+
+            self.assertIn(OrjsonRenderer().render(data)[1:-1], res.content)
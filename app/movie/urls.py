@@ -9,7 +9,7 @@ from django.urls import(
 
 from rest_framework.routers import DefaultRouter
 
-from movie import views
+from movie import async_views, views
 
 router = DefaultRouter()
 router.register('movies', views.MovieViewSet, 'movie')
@@ -18,5 +18,15 @@ router.register('ratings', views.RatingViewSet, 'rating')
 app_name = 'movie'
 
 urlpatterns = [
-     path('', include(router.urls))
+     path('', include(router.urls)),
+     # Async reads, routed to the ASGI server by the proxy
+     path('async/movies/',
+          async_views.AsyncMovieListView.as_view(),
+          name='async-movie-list'),
+     path('async/movies/search/',
+          async_views.AsyncMovieSearchView.as_view(),
+          name='async-movie-search'),
+     path('async/movies/<int:pk>/',
+          async_views.AsyncMovieDetailView.as_view(),
+          name='async-movie-detail'),
 ]
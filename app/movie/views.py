@@ -1,11 +1,17 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from rest_framework import (
     viewsets,
     mixins,
     status
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAdminUser)
 
@@ -13,19 +19,97 @@ from core.models import (
     Movie,
     Rating
 )
-from movie import serializers
+from core.search import MovieSearch
+from movie import autocomplete, bulk, images, serializers
+from movie.conditional import ConditionalGetMixin
+from movie.filters import MovieFilterBackend, RatingFilterBackend
+from movie.pagination import SearchPagination
 
 from movie.permissions import IsOwnerOrReadOnly
+from user.authentication import (CachedTokenAuthentication,
+                                 SignedTokenAuthentication)
+
+def ratings_prefetch():
+    """Prefetch of the ratings nested in movie responses"""
+    return Prefetch(
+        'ratings',
+        queryset=Rating.objects.only('id', 'rating', 'movie').order_by('id')
+    )
+
+
+def attach_rating_values(rows):
+    """Attach each movie row's ratings as `.values()` rows, ordered by id"""
+    ratings_by_movie = {}
+    for row in rows:
+        row['ratings'] = ratings_by_movie[row['id']] = []
+    ratings = (Rating.objects.filter(movie_id__in=ratings_by_movie)
+               .order_by('id')
+               .values('movie', *serializers.values_fields(
+                   serializers.RatingSerializer)))
+    for rating in ratings:
+        ratings_by_movie[rating.pop('movie')].append(rating)
+
 
-class MovieViewSet(viewsets.ModelViewSet):
+def ndjson_lines(rows, lines_per_chunk=500):
+    """Encode rows as newline delimited JSON, a few hundred lines per chunk"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(row))
+        if len(chunk) >= lines_per_chunk:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+class MovieViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """View for managing Movie in the databse"""
     serializer_class = serializers.MovieDetailSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication,
+                              SignedTokenAuthentication]
     queryset = Movie.objects.all()
+    filter_backends = [MovieFilterBackend]
+    ordering = 'id'
+    ordering_fields = ('id', 'released_date', 'rating_mean', 'user')
+    export_fields = ['id', 'title', 'description', 'is_active',
+                     'released_date']
+    export_rating_fields = ['rating_count', 'rating_mean', 'rating_histogram']
+    export_chunk_size = 2000
+    leaderboard_size = 10
+    max_leaderboard_size = 100
+    autocomplete_size = 10
+    max_autocomplete_size = 20
     http_method_names = [
         'get', 'post', 'patch', 'delete', 'head', 'options', 'trace'
     ]
 
+    def get_queryset(self):
+        """Return movies, as `.values()` rows for the list and with
+        ratings prefetched for search results"""
+        queryset = self.queryset
+        if self.action == 'list':
+            queryset = queryset.values(*self.get_list_values_fields())
+        elif self.action == 'search':
+            queryset = queryset.prefetch_related(ratings_prefetch())
+        return queryset
+
+    def get_list_values_fields(self):
+        """Return the columns list rows need to be serialized and paged"""
+        opts = self.queryset.model._meta
+        fields = serializers.values_fields(serializers.MovieSerializer)
+        fields += [opts.get_field(name).attname
+                   for name in self.ordering_fields]
+        fields.append(self.version_field)
+        return list(dict.fromkeys(fields))
+
+    def prepare_instances(self, instances):
+        """Fetch the nested ratings in one query once they're needed"""
+        if instances and isinstance(instances[0], dict):
+            attach_rating_values(instances)
+        else:
+            prefetch_related_objects(instances, ratings_prefetch())
+
     def get_permissions(self):
         if self.action in ['create', 'update', 'destroy', 'partial_update']:
             self.permission_classes = [IsAuthenticated, IsAdminUser]
@@ -39,35 +123,137 @@ class MovieViewSet(viewsets.ModelViewSet):
 
     def get_serializer_class(self):
         """Return the serializer class for request"""
-        if self.action == 'list':
+        if self.action in ['list', 'search', 'top', 'trending']:
             return serializers.MovieSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarMovieSerializer
+        elif self.action == 'autocomplete':
+            return serializers.MovieAutocompleteSerializer
         elif self.action == 'upload_image':
             return serializers.MovieImageSerializer
 
         return self.serializer_class
 
+    @action(methods=['GET'], detail=False, pagination_class=SearchPagination)
+    def search(self, request):
+        """Full-text search movies by title and description, best first"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['This query parameter is required.']})
+
+        page = self.paginate_queryset(MovieSearch(query, self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_limit(self, default, maximum):
+        """Return the `limit` query parameter, clamped to a sane range"""
+        try:
+            size = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return default
+        return max(1, min(size, maximum))
+
+    def get_leaderboard_size(self):
+        return self.get_limit(self.leaderboard_size,
+                              self.max_leaderboard_size)
+
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def top(self, request):
+        """Return the movies with the best Bayesian-weighted rating"""
+        movies = list(Movie.objects.top_rated(self.get_leaderboard_size()))
+        self.prepare_instances(movies)
+        return Response(self.get_serializer(movies, many=True).data)
+
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def trending(self, request):
+        """Return the movies with the most recent rating activity"""
+        movies = list(Movie.objects.trending(self.get_leaderboard_size()))
+        self.prepare_instances(movies)
+        return Response(self.get_serializer(movies, many=True).data)
+
+    @action(methods=['GET'], detail=True, pagination_class=None)
+    def similar(self, request, pk=None):
+        """Return the movies most often rated like this one, best first.
+
+        Neighbours are precomputed by the `rebuild_similar_movies` command,
+        a movie rated since its last run may have none yet.
+        """
+        movie = self.get_object()
+        movies = list(Movie.objects.similar_to(movie,
+                                               self.get_leaderboard_size()))
+        self.prepare_instances(movies)
+        return Response(self.get_serializer(movies, many=True).data)
+
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def autocomplete(self, request):
+        """Return the most popular movies whose title starts with `q`.
+
+        Served from the worker's in-memory title index, without querying
+        the database. Case and accents are ignored.
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': ['This query parameter is required.']})
+
+        movies = autocomplete.index.search(
+            query, self.get_limit(self.autocomplete_size,
+                                  self.max_autocomplete_size)
+        )
+        return Response(self.get_serializer(movies, many=True).data)
+
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        """Stream the whole catalog as NDJSON, one movie per line.
+
+        Rows come from a server-side cursor in chunks, so memory use is
+        the same whatever the size of the catalog. Pass `ratings=true` to
+        include each movie's rating aggregates.
+        """
+        fields = list(self.export_fields)
+        if request.query_params.get('ratings', '').lower() in ('1', 'true'):
+            fields += self.export_rating_fields
+        rows = (Movie.objects.order_by('id').values(*fields)
+                .iterator(chunk_size=self.export_chunk_size))
+
+        response = StreamingHttpResponse(
+            ndjson_lines(rows), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = 'attachment; filename="movies.ndjson"'
+        return response
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """Upload an image to Movie"""
+        """Upload an image to Movie and resize it in the background"""
         movie = self.get_object()
+        stale_variants = movie.image_variants
         serializer = self.get_serializer(movie, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            movie = serializer.save(image_variants={})
+            transaction.on_commit(lambda: images.schedule_variants(
+                movie.id, movie.image.name, stale_variants
+            ))
             return Response(serializer.data, status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class RatingViewSet(mixins.CreateModelMixin,
+class RatingViewSet(ConditionalGetMixin,
+                    mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.DestroyModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.ListModelMixin,
                     viewsets.GenericViewSet):
     """View for managing rating in the databse"""
     serializer_class = serializers.RatingDetailSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication,
+                              SignedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
     queryset = Rating.objects.all()
+    filter_backends = [RatingFilterBackend]
+    ordering = 'id'
+    ordering_fields = ('id',)
+    max_bulk_size = 5000
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -75,8 +261,73 @@ class RatingViewSet(mixins.CreateModelMixin,
         return self.serializer_class
 
     def get_queryset(self):
-        """Return ratings for the authenticated user."""
+        """Return ratings, as `.values()` rows for the list"""
+        if self.action == 'list':
+            return self.queryset.values(
+                *serializers.values_fields(serializers.RatingSerializer),
+                self.version_field
+            )
         return self.queryset
 
+    def filter_queryset(self, queryset):
+        """Scope and filter the list only, single ratings are readable by
+        anyone and writable by their owner"""
+        if self.action != 'list':
+            return queryset
+        return super().filter_queryset(queryset)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Save the rating and refresh the aggregates of its movie"""
+        old_value = serializer.instance.rating
+        rating = serializer.save()
+        if rating.rating != old_value and rating.movie_id:
+            Movie.objects.apply_rating_change(
+                [rating.movie_id],
+                added=[rating.rating],
+                removed=[old_value]
+            )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Delete the rating and remove it from its movie's aggregates"""
+        movie_id = instance.movie_id
+        instance.delete()
+        if movie_id:
+            Movie.objects.apply_rating_change([movie_id],
+                                              removed=[instance.rating])
+
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Create many ratings at once and report a result per item"""
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': [
+                'Expected a list of ratings.'
+            ]})
+        if len(items) > self.max_bulk_size:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.max_bulk_size} ratings can be created at once.'
+            ]})
+
+        valid, errors = bulk.validate_ratings(items)
+        ratings = bulk.create_ratings(request.user, valid) if valid else []
+
+        results = [None] * len(items)
+        for (index, data), rating in zip(valid, ratings):
+            results[index] = {'index': index, 'status': 'created',
+                              'id': rating.id}
+        for index, item_errors in errors.items():
+            results[index] = {'index': index, 'status': 'error',
+                              'errors': item_errors}
+
+        if not errors:
+            status_code = status.HTTP_201_CREATED
+        elif valid:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=status_code)
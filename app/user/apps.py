@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from rest_framework.authtoken.models import Token
+
+        from core import metrics
+        from user import authentication
+        from user import schema  # noqa: F401, registers the extension
+
+        post_delete.connect(authentication.invalidate_token, sender=Token)
+        post_save.connect(authentication.invalidate_user_tokens,
+                          sender=get_user_model())
+        post_delete.connect(authentication.invalidate_user_tokens,
+                            sender=get_user_model())
+        metrics.register(authentication.collect_token_cache_metrics)
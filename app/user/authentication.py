@@ -0,0 +1,322 @@
+"""
+Authentication classes for the APIs
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import HTTP_HEADER_ENCODING
+from rest_framework.authentication import (BaseAuthentication,
+                                           TokenAuthentication,
+                                           get_authorization_header)
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import metrics
+from user import tokens
+
+
+# Version passed when the shared version wasn't read
+UNCHECKED = object()
+
+
+class TokenUserCache:
+    """Bounded LRU cache of token key -> token (with its user) and a TTL.
+
+    The cache lives inside each worker process and keeps a snapshot of
+    the token and user fields, every hit returns new instances built from
+    it so no instance is shared between threads. Saving or deleting a
+    user or token drops its entries in this worker and bumps the token's
+    version in the shared Django cache (see CACHES). Entries check their
+    version at most every `check_interval` seconds, so the other workers
+    see the change within that delay without a shared cache round trip on
+    every request, and an entry whose version is outdated is a miss.
+    """
+
+    def __init__(self, max_size, ttl, check_interval=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def needs_check(self, key):
+        """Return whether the shared version of key must be read before
+        the lookup, because it isn't cached or its check is due"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is None or entry[2] <= time.monotonic()
+
+    def get(self, key, version=UNCHECKED):
+        """Return the cached token for key or None. `version` is the
+        token's current shared version, an entry cached with another one
+        is outdated. It is only needed when `needs_check` says so."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now or (version is not UNCHECKED and
+                                   entry[1] != version):
+                self._remove(key)
+                self.misses += 1
+                return None
+            if version is not UNCHECKED:
+                entry = entry[:2] + (now + self.check_interval,) + entry[3:]
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return build_token(key, *entry[3:])
+
+    def set(self, key, token, generation=None, version=UNCHECKED):
+        """Cache token unless an invalidation happened since `generation`.
+        `version` is the token's shared version read before the lookup."""
+        user = token.user
+        fields = user_fields()
+        now = time.monotonic()
+        if version is UNCHECKED:
+            version, checked_until = None, now
+        else:
+            checked_until = now + self.check_interval
+        entry = (now + self.ttl, version, checked_until, token.user_id,
+                 token.created,
+                 tuple(getattr(user, field) for field in fields))
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._keys_by_user.setdefault(token.user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_key(self, key):
+        """Drop a single token from the cache, in every worker"""
+        bump_token_versions([key], self.ttl)
+        with self._lock:
+            self.generation += 1
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token belonging to a user, in every worker"""
+        keys = set(Token.objects.filter(user_id=user_id)
+                   .values_list('key', flat=True))
+        with self._lock:
+            self.generation += 1
+            keys.update(self._keys_by_user.pop(user_id, ()))
+            for key in keys:
+                self._entries.pop(key, None)
+        bump_token_versions(keys, self.ttl)
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the cache counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._keys_by_user.get(entry[3])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[entry[3]]
+
+
+def user_fields():
+    """Return the user columns kept in cache entries"""
+    return [field.attname for field in get_user_model()._meta.concrete_fields]
+
+
+def build_token(key, user_id, created, values):
+    """Return new token and user instances from a cache entry"""
+    user = get_user_model().from_db(None, user_fields(), values)
+    token = Token.from_db(None, ['key', 'user_id', 'created'],
+                          (key, user_id, created))
+    token.user = user
+    return token
+
+
+def version_key(key):
+    return f'auth:token-version:{key}'
+
+
+def token_version(key):
+    """Return the shared version of a token, None until it changes"""
+    return cache.get(version_key(key))
+
+
+def bump_token_versions(keys, ttl):
+    """Outdate cached tokens in every worker.
+
+    The versions are bumped now, for lookups in other workers, and again
+    once the change commits, for lookups that read the old rows in the
+    meantime. Entries older than the TTL are gone anyway, so a version
+    only needs to outlive them.
+    """
+    def bump():
+        cache.set_many({version_key(key): uuid.uuid4().hex for key in keys},
+                       timeout=max(ttl, 1))
+
+    if keys:
+        bump()
+        transaction.on_commit(bump)
+
+
+token_cache = TokenUserCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300),
+    check_interval=getattr(settings, 'TOKEN_CACHE_CHECK_SECONDS', 2),
+)
+
+
+def collect_token_cache_metrics():
+    """Metrics collector for the token cache"""
+    stats = token_cache.stats()
+    yield metrics.gauge('token_cache_entries', 'Cached tokens',
+                        [({}, stats['size'])])
+    yield metrics.counter(
+        'token_cache_lookups_total', 'Token lookups, by outcome',
+        [({'outcome': 'hit'}, stats['hits']),
+         ({'outcome': 'miss'}, stats['misses'])]
+    )
+    yield metrics.counter(
+        'token_cache_evictions_total',
+        'Entries evicted to keep the cache under its size',
+        [({}, stats['evictions'])]
+    )
+
+
+def get_credentials(request, keyword):
+    """Return the credentials of a `<keyword> <credentials>` Authorization
+    header, or None if the request uses another scheme"""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != keyword.lower().encode():
+        return None
+
+    if len(auth) == 1:
+        msg = _('Invalid token header. No credentials provided.')
+        raise AuthenticationFailed(msg)
+    elif len(auth) > 2:
+        msg = _('Invalid token header. '
+                'Token string should not contain spaces.')
+        raise AuthenticationFailed(msg)
+
+    try:
+        return auth[1].decode(HTTP_HEADER_ENCODING)
+    except UnicodeError:
+        msg = _('Invalid token header. '
+                'Token string should not contain invalid characters.')
+        raise AuthenticationFailed(msg)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches token -> user lookups in memory"""
+
+    def authenticate_credentials(self, key):
+        version = UNCHECKED
+        if token_cache.needs_check(key):
+            version = token_version(key)
+        token = token_cache.get(key, version)
+        if token is None:
+            generation = token_cache.generation
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token, generation=generation,
+                            version=version)
+        return token.user, token
+
+    async def aauthenticate(self, request):
+        """Async counterpart of authenticate, for views served under ASGI"""
+        key = get_credentials(request, self.keyword)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        """Async counterpart of authenticate_credentials"""
+        version = UNCHECKED
+        if token_cache.needs_check(key):
+            version = await cache.aget(version_key(key))
+        token = token_cache.get(key, version)
+        if token is None:
+            generation = token_cache.generation
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(
+                    key=key
+                )
+            except model.DoesNotExist:
+                raise AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise AuthenticationFailed(_('User inactive or deleted.'))
+            token_cache.set(key, token, generation=generation,
+                            version=version)
+        return token.user, token
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticate `Bearer` access tokens from their signature alone.
+
+    `request.user` is built from the token claims (see
+    `user.tokens.claims_user`) and `request.auth` is the claims dict.
+    """
+    keyword = tokens.TOKEN_TYPE
+
+    def authenticate(self, request):
+        token = get_credentials(request, self.keyword)
+        if token is None:
+            return None
+        return self.authenticate_credentials(token)
+
+    def authenticate_credentials(self, token):
+        try:
+            claims = tokens.load_access_token(token)
+        except tokens.InvalidToken as exc:
+            raise AuthenticationFailed(str(exc))
+        return tokens.claims_user(claims), claims
+
+    async def aauthenticate(self, request):
+        """Async counterpart of authenticate, which does no I/O"""
+        return self.authenticate(request)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+def invalidate_token(sender, instance, **kwargs):
+    """Signal receiver dropping a deleted token from the cache"""
+    token_cache.invalidate_key(instance.key)
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Signal receiver dropping a saved or deleted user's tokens"""
+    token_cache.invalidate_user(instance.pk)
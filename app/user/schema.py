@@ -0,0 +1,17 @@
+"""
+OpenAPI extensions for the user app
+"""
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from drf_spectacular.plumbing import build_bearer_security_scheme_object
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """Document SignedTokenAuthentication as a bearer token scheme"""
+    target_class = 'user.authentication.SignedTokenAuthentication'
+    name = 'bearerAuth'
+
+    def get_security_definition(self, auto_schema):
+        return build_bearer_security_scheme_object(
+            header_name='Authorization',
+            token_prefix='Bearer',
+        )
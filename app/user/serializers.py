@@ -9,8 +9,12 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 
+from core.instrumentation import InstrumentedSerializerMixin
+from user import tokens
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(InstrumentedSerializerMixin,
+                     serializers.ModelSerializer):
     """Serializer for the user object"""
     class Meta:
         model = get_user_model()
@@ -36,11 +40,12 @@ class UserSerializer(serializers.ModelSerializer):
 
         if password:
             user.set_password(password)
-            user.save
+            user.save()
         return user
 
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(InstrumentedSerializerMixin,
+                          serializers.Serializer):
     """Serializer for the user auth token"""
     username = serializers.CharField()
     email = serializers.EmailField()
@@ -66,4 +71,31 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authorization')
 
         attrs['user'] = user
+        return attrs
+
+
+class SignedTokenSerializer(serializers.Serializer):
+    """Serializer for a signed access/refresh token pair"""
+    access = serializers.CharField(read_only=True)
+    refresh = serializers.CharField(read_only=True)
+    token_type = serializers.CharField(read_only=True)
+    expires_in = serializers.IntegerField(
+        read_only=True,
+        help_text='Lifetime of the access token in seconds'
+    )
+
+
+class RefreshTokenSerializer(InstrumentedSerializerMixin,
+                             serializers.Serializer):
+    """Serializer exchanging a refresh token for a new token pair"""
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        """Validate the refresh token and issue new tokens"""
+        try:
+            attrs['tokens'] = tokens.refresh_tokens(attrs['refresh'])
+        except tokens.InvalidToken as exc:
+            raise serializers.ValidationError(
+                {'refresh': [str(exc)]}, code='authorization'
+            )
         return attrs
\ No newline at end of file
@@ -0,0 +1,322 @@
+"""
+Test the cached token and signed token authentication
+"""
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from unittest.mock import patch
+import time
+
+from core import metrics
+from user import authentication
+from user.authentication import (TokenUserCache, bump_token_versions,
+                                 token_cache)
+
+ME_URL = reverse('user:me')
+SIGNED_TOKEN_URL = reverse('user:signed-token')
+REFRESH_URL = reverse('user:token-refresh')
+MOVIES_URL = reverse('movie:movie-list')
+ASYNC_MOVIES_URL = reverse('movie:async-movie-list')
+
+
+def create_user(**params):
+    details = {
+        'username':'username',
+        'email':'user@example.com',
+        'password':'test123'
+    }
+    details.update(**params)
+    return get_user_model().objects.create_user(**details)
+
+
+class TokenUserCacheTests(TestCase):
+    """Test the LRU + TTL cache itself"""
+    def setUp(self):
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+
+    def test_least_recently_used_entry_evicted(self):
+        """Test the cache never grows past its max size"""
+        cache = TokenUserCache(max_size=2, ttl=60)
+        other = create_user(username='other', email='other@example.com')
+        tokens = [self.token, Token.objects.create(user=other)]
+
+        cache.set('a', tokens[0])
+        cache.set('b', tokens[1])
+        cache.get('a')
+        cache.set('c', tokens[0])
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_expired_entry_is_a_miss(self):
+        """Test entries past their TTL aren't returned"""
+        cache = TokenUserCache(max_size=10, ttl=0)
+        cache.set(self.token.key, self.token)
+
+        self.assertIsNone(cache.get(self.token.key))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_stale_set_after_invalidation_ignored(self):
+        """Test a lookup racing an invalidation doesn't cache stale data"""
+        cache = TokenUserCache(max_size=10, ttl=60)
+        generation = cache.generation
+        cache.invalidate_user(self.user.pk)
+        cache.set(self.token.key, self.token, generation=generation)
+
+        self.assertIsNone(cache.get(self.token.key))
+
+    def test_outdated_version_is_a_miss(self):
+        """Test entries cached with another shared version aren't returned"""
+        cache = TokenUserCache(max_size=10, ttl=60)
+        cache.set(self.token.key, self.token, version='a')
+
+        self.assertIsNone(cache.get(self.token.key, 'b'))
+        self.assertIsNone(cache.get(self.token.key, 'a'))
+
+    def test_hits_return_new_instances(self):
+        """Test threads never share the cached token or user instances"""
+        cache = TokenUserCache(max_size=10, ttl=60)
+        cache.set(self.token.key, self.token)
+
+        first, second = cache.get(self.token.key), cache.get(self.token.key)
+
+        self.assertIsNot(first.user, second.user)
+        self.assertIsNot(first.user, self.user)
+        self.assertEqual(first.user.pk, self.user.pk)
+        self.assertEqual(first.user.email, 'user@example.com')
+        self.assertEqual(first.user_id, self.user.pk)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating API requests through the token cache"""
+    def setUp(self):
+        token_cache.clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_repeated_requests_hit_cache(self):
+        """Test the token lookup query runs only on the first request"""
+        self.client.get(ME_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_deleted_token_invalidated(self):
+        """Test deleting a token stops it authenticating"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """Test deactivating a user stops their token authenticating"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalidation_from_another_worker(self):
+        """Test a change made by another worker outdates the entry here"""
+        self.set_check_interval(0)
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+        # What the signal receivers of the other worker do
+        bump_token_versions([self.token.key], token_cache.ttl)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def set_check_interval(self, seconds):
+        interval = token_cache.check_interval
+        token_cache.check_interval = seconds
+        self.addCleanup(setattr, token_cache, 'check_interval', interval)
+
+    def test_version_checked_at_interval(self):
+        """Test the shared version is only read once the check is due"""
+        self.set_check_interval(60)
+        self.client.get(ME_URL)
+        bump_token_versions([self.token.key], token_cache.ttl)
+
+        with patch.object(authentication, 'token_version',
+                          wraps=authentication.token_version) as version:
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            version.assert_not_called()
+
+            with patch.object(authentication.time, 'monotonic',
+                              return_value=time.monotonic() + 61):
+                self.client.get(ME_URL)
+            version.assert_called_once_with(self.token.key)
+
+        self.assertEqual(token_cache.stats()['misses'], 2)
+
+    def test_counters_exported(self):
+        """Test the cache counters are on /metrics"""
+        self.client.get(ME_URL)
+        self.client.get(ME_URL)
+
+        body = metrics.render()
+
+        self.assertRegex(body, r'token_cache_lookups_total\{outcome="hit",'
+                               r'pid="\d+"\} 1\n')
+        self.assertRegex(body, r'token_cache_entries\{pid="\d+"\} 1\n')
+
+    def test_password_change_invalidates_cache(self):
+        """Test changing the password through the API drops the entry"""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'password':'new pass'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['size'], 0)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new pass'))
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    """Test signed access tokens and the refresh flow"""
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+
+    def obtain_tokens(self, user=None, password='test123'):
+        user = user or self.user
+        res = self.client.post(SIGNED_TOKEN_URL, {
+            'username': user.username,
+            'email': user.email,
+            'password': password,
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def authorize(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_obtain_signed_tokens(self):
+        """Test valid credentials return an access/refresh pair"""
+        tokens = self.obtain_tokens()
+
+        self.assertEqual(tokens['token_type'], 'Bearer')
+        self.assertEqual(tokens['expires_in'], 300)
+        self.assertNotEqual(tokens['access'], tokens['refresh'])
+
+        res = self.client.post(SIGNED_TOKEN_URL, {
+            'username': 'username',
+            'email': 'user@example.com',
+            'password': 'wrong',
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_access_token_verified_without_queries(self):
+        """Test authenticating a bearer token doesn't hit the database"""
+        self.authorize(self.obtain_tokens()['access'])
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(MOVIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in queries.captured_queries:
+            self.assertNotIn('authtoken_token', query['sql'])
+            self.assertNotIn('core_user', query['sql'])
+
+    def test_access_token_on_every_view(self):
+        """Test bearer tokens work for the profile, ratings and async reads"""
+        self.authorize(self.obtain_tokens()['access'])
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], 'user@example.com')
+
+        res = self.client.post(reverse('movie:rating-list'),
+                               {'rating': 4.0, 'description': 'Good'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.user.rating_set.count(), 1)
+
+        res = self.client.get(ASYNC_MOVIES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_staff_claims(self):
+        """Test permission flags come from the token claims"""
+        admin = create_user(username='admin', email='admin@example.com',
+                            is_staff=True)
+        self.authorize(self.obtain_tokens(admin)['access'])
+
+        res = self.client.post(MOVIES_URL, {'title': 'Movie',
+                                            'description': 'Description',
+                                            'released_date': '2020-01-01'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(admin.movie_set.count(), 1)
+
+    def test_invalid_access_tokens_rejected(self):
+        """Test tampered, expired and refresh tokens can't authenticate"""
+        tokens = self.obtain_tokens()
+        cases = {
+            'tampered': tokens['access'][:-2] + 'xx',
+            'refresh': tokens['refresh'],
+        }
+        for name, access in cases.items():
+            with self.subTest(token=name):
+                self.authorize(access)
+                res = self.client.get(ME_URL)
+                self.assertEqual(res.status_code,
+                                 status.HTTP_401_UNAUTHORIZED)
+
+        self.authorize(tokens['access'])
+        with override_settings(SIGNED_TOKEN_ACCESS_TTL=-1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token has expired.')
+
+    def test_refresh_tokens(self):
+        """Test a refresh token gives a working access token"""
+        tokens = self.obtain_tokens()
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.authorize(res.data['access'])
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['access']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('refresh', res.data)
+
+    def test_refresh_revoked_by_password_change(self):
+        """Test refresh tokens stop working after a password change"""
+        refresh = self.obtain_tokens()['refresh']
+        self.user.set_password('new pass')
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {'refresh': refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
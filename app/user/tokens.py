@@ -0,0 +1,98 @@
+"""
+Signed access and refresh tokens.
+
+Access tokens are HMAC-signed (`django.core.signing`, keyed by
+SECRET_KEY) and carry the user id and the claims permission checks need,
+so `SignedTokenAuthentication` verifies them without touching the
+database. They can't be revoked, only expire after
+SIGNED_TOKEN_ACCESS_TTL seconds, so they are kept short-lived.
+
+Refresh tokens live for SIGNED_TOKEN_REFRESH_TTL seconds and are checked
+against the database when used: they stop working once the user is
+deactivated or changes password.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+
+ACCESS_SALT = 'user.tokens.access'
+REFRESH_SALT = 'user.tokens.refresh'
+TOKEN_TYPE = 'Bearer'
+
+
+class InvalidToken(Exception):
+    """Raised for a token that is malformed, tampered with or expired"""
+
+
+def access_claims(user):
+    return {
+        'uid': user.pk,
+        'usr': user.get_username(),
+        'stf': user.is_staff,
+        'su': user.is_superuser,
+    }
+
+
+def refresh_claims(user):
+    # Changes with the password hash, like Django's session auth hash
+    return {'uid': user.pk, 'ver': user.get_session_auth_hash()}
+
+
+def issue_tokens(user):
+    """Return a new access/refresh token pair for a user"""
+    return {
+        'access': signing.dumps(access_claims(user), salt=ACCESS_SALT),
+        'refresh': signing.dumps(refresh_claims(user), salt=REFRESH_SALT),
+        'token_type': TOKEN_TYPE,
+        'expires_in': settings.SIGNED_TOKEN_ACCESS_TTL,
+    }
+
+
+def load_claims(token, salt, max_age):
+    try:
+        claims = signing.loads(token, salt=salt, max_age=max_age)
+    except signing.SignatureExpired:
+        raise InvalidToken(_('Token has expired.'))
+    except signing.BadSignature:
+        raise InvalidToken(_('Invalid token.'))
+    if not isinstance(claims, dict) or 'uid' not in claims:
+        raise InvalidToken(_('Invalid token.'))
+    return claims
+
+
+def load_access_token(token):
+    """Return the claims of a valid access token, without a DB query"""
+    return load_claims(token, ACCESS_SALT, settings.SIGNED_TOKEN_ACCESS_TTL)
+
+
+def claims_user(claims):
+    """Return a user built from access token claims.
+
+    It has the id, username and permission flags but no other fields, so
+    it can be compared with and assigned to foreign keys. Views needing
+    the full user row must load it.
+    """
+    user = get_user_model()(
+        pk=claims['uid'],
+        is_active=True,
+        is_staff=claims.get('stf', False),
+        is_superuser=claims.get('su', False),
+    )
+    setattr(user, user.USERNAME_FIELD, claims.get('usr', ''))
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def refresh_tokens(token):
+    """Return a new token pair for a valid refresh token"""
+    claims = load_claims(token, REFRESH_SALT,
+                         settings.SIGNED_TOKEN_REFRESH_TTL)
+    user = get_user_model().objects.filter(pk=claims['uid'],
+                                           is_active=True).first()
+    if user is None or not constant_time_compare(
+            claims.get('ver', ''), user.get_session_auth_hash()):
+        raise InvalidToken(_('Invalid token.'))
+    return issue_tokens(user)
@@ -8,5 +8,9 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/signed/', views.CreateSignedTokenView.as_view(),
+         name='signed-token'),
+    path('token/refresh/', views.RefreshSignedTokenView.as_view(),
+         name='token-refresh'),
     path('me/', views.ManageUserView.as_view(), name='me')
 ]
@@ -1,13 +1,21 @@
 """
 Views for user APi
 """
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from user import tokens
+from user.authentication import (CachedTokenAuthentication,
+                                 SignedTokenAuthentication)
 from user.serializers import (
     UserSerializer,
-    AuthTokenSerializer)
+    AuthTokenSerializer,
+    RefreshTokenSerializer,
+    SignedTokenSerializer)
 
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system"""
@@ -18,12 +26,43 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+class CreateSignedTokenView(ObtainAuthToken):
+    """Create a signed access token and a refresh token for a user"""
+    serializer_class = AuthTokenSerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+
+    @extend_schema(request=AuthTokenSerializer,
+                   responses=SignedTokenSerializer)
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(tokens.issue_tokens(serializer.validated_data['user']))
+
+
+class RefreshSignedTokenView(generics.GenericAPIView):
+    """Exchange a refresh token for a new signed token pair"""
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+    permission_classes = []
+
+    @extend_schema(responses=SignedTokenSerializer)
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data['tokens'])
+
+
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated view"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication,
+                              SignedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return the authenticated user."""
+        if isinstance(self.request.successful_authenticator,
+                      SignedTokenAuthentication):
+            # The user built from the token claims has no profile fields
+            return get_user_model().objects.get(pk=self.request.user.pk)
         return self.request.user
\ No newline at end of file
@@ -6,9 +6,41 @@ server {
         alias /vol/web/static/;
     }
 
+    location /api/movie/async/ {
+        proxy_pass              http://${ASGI_HOST}:${ASGI_PORT};
+        proxy_set_header        Host $host;
+        proxy_set_header        X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header        X-Forwarded-Proto $scheme;
+    }
+
+    # Scraped on the internal metrics port only
+    location = /metrics {
+        return 404;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
         client_max_body_size    10M;
     }
+}
+
+# Metrics of the WSGI and ASGI servers, on a port that isn't published so
+# only Prometheus on the internal network reaches it
+server {
+    listen ${METRICS_PORT};
+
+    location = /metrics {
+        uwsgi_pass              ${APP_HOST}:${APP_PORT};
+        include                 /etc/nginx/uwsgi_params;
+    }
+
+    location = /metrics/async {
+        proxy_pass              http://${ASGI_HOST}:${ASGI_PORT}/metrics;
+        proxy_set_header        Host $host;
+    }
+
+    location / {
+        return 404;
+    }
 }
\ No newline at end of file
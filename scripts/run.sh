@@ -6,4 +6,6 @@ python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+# --lazy-apps loads the app, and fills its connection pool, in each worker
+# after forking rather than once in the master
+uwsgi --socket :9000 --workers 4 --threads ${UWSGI_THREADS:-8} --master --enable-threads --lazy-apps --module app.wsgi
\ No newline at end of file